@@ -1390,12 +1390,7 @@ class _RecordingScreenState extends State<RecordingScreen>
 
   Future<SurfaceData> _fetchSurfaceSegments() async {
     try {
-      final rows =
-          await Supabase.instance.client
-                  .from('surface_segments')
-                  .select('surface,centroid,geometry')
-                  .limit(1500)
-              as List<dynamic>;
+      final rows = await _selectSurfaceSegments();
 
       final points = <SurfacePoint>[];
       final segments = <List<LatLng>>[];
@@ -1422,6 +1417,28 @@ class _RecordingScreenState extends State<RecordingScreen>
     }
   }
 
+  /// Surface rows with their geometry as GeoJSON or polyline jsonb.
+  ///
+  /// surface_geojson (tools/geometry_encoding.sql) also returns the geometry
+  /// of EWKB imports, which leave the jsonb column empty; databases without
+  /// it fall back to the jsonb column.
+  Future<List<dynamic>> _selectSurfaceSegments() async {
+    final client = Supabase.instance.client;
+    try {
+      return await client
+              .from('surface_segments')
+              .select('surface,centroid,geometry:surface_geojson')
+              .limit(1500)
+          as List<dynamic>;
+    } on PostgrestException {
+      return await client
+              .from('surface_segments')
+              .select('surface,centroid,geometry')
+              .limit(1500)
+          as List<dynamic>;
+    }
+  }
+
   double _surfaceWeight(String? surface) {
     switch (surface?.toLowerCase()) {
       case 'cobblestone':
@@ -1439,6 +1456,16 @@ class _RecordingScreenState extends State<RecordingScreen>
   List<LatLng> _parseSurfaceGeometry(dynamic geometry) {
     if (geometry is Map<String, dynamic>) {
       final type = geometry['type'];
+      final polyline = geometry['polyline'];
+      if (polyline != null) {
+        // Encoded by import_datasets.py --geometry-encoding polyline
+        dynamic first = polyline;
+        while (first is List && first.isNotEmpty) {
+          first = first.first;
+        }
+        if (first is! String) return [];
+        return _decodePolyline(first, (geometry['precision'] as num?)?.toInt() ?? 6);
+      }
       final coords = geometry['coordinates'];
       if (type == 'LineString' && coords is List) {
         return coords
@@ -1467,6 +1494,32 @@ class _RecordingScreenState extends State<RecordingScreen>
     return [];
   }
 
+  List<LatLng> _decodePolyline(String encoded, int precision) {
+    final factor = math.pow(10, precision);
+    final points = <LatLng>[];
+    var index = 0;
+    var lat = 0;
+    var lng = 0;
+    int nextValue() {
+      var shift = 0;
+      var result = 0;
+      int byte;
+      do {
+        byte = encoded.codeUnitAt(index++) - 63;
+        result |= (byte & 0x1f) << shift;
+        shift += 5;
+      } while (byte >= 0x20);
+      return (result & 1) != 0 ? ~(result >> 1) : result >> 1;
+    }
+
+    while (index < encoded.length) {
+      lat += nextValue();
+      lng += nextValue();
+      points.add(LatLng(lat / factor, lng / factor));
+    }
+    return points;
+  }
+
   List<LatLng> _sampleRoutePoints(List<LatLng> points, {int maxPoints = 200}) {
     if (points.length <= maxPoints) return points;
     final step = (points.length / maxPoints).ceil().clamp(1, points.length);
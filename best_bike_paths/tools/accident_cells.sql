@@ -0,0 +1,30 @@
+-- Accident counts per geohash cell, year and type (python import_datasets.py)
+-- Run this in Supabase SQL Editor before importing accidents
+
+-- cell is a geohash, or 'city' for accidents without coordinates (center
+-- is then null); cell_id is "<cell>/<year>/<accident_type>", the key every
+-- import upserts on (deleting the cells that no longer occur)
+CREATE TABLE IF NOT EXISTS public.accident_cells (
+  id bigserial PRIMARY KEY,
+  cell_id text UNIQUE NOT NULL,
+  cell text NOT NULL,
+  year int,
+  accident_type text,
+  accidents int NOT NULL,
+  center geometry(Point, 4326)
+);
+
+-- Cells of an area by geohash prefix (cell LIKE 'u0nd%'), or by distance
+CREATE INDEX IF NOT EXISTS accident_cells_cell_idx
+ON public.accident_cells (cell text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS accident_cells_center_gix
+ON public.accident_cells USING gist (center);
+
+-- Public read-only data
+ALTER TABLE public.accident_cells ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Anyone can read accident_cells" ON public.accident_cells;
+CREATE POLICY "Anyone can read accident_cells" ON public.accident_cells
+FOR SELECT TO anon, authenticated
+USING (true);
@@ -0,0 +1,166 @@
+"""
+Accident aggregation for the dataset import.
+
+While the accident CSV streams to accident_stats, each row is parsed once
+into a typed record (year, accident type, position, count) and counted per
+geohash cell, year and type. The counts go to accident_cells
+(accident_cells.sql): a few thousand rows that path scoring and the app can
+read instead of scanning and parsing every accident's jsonb.
+
+Column names differ between accident datasets, so the year, type,
+coordinate and count columns are looked up among known names. Accidents
+without coordinates (like the city-level Milan file) are counted in the
+CITY_CELL cell; rows without a count column count as one accident.
+"""
+
+import math
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+GEOHASH_PRECISION = 6  # Characters per cell; 6 is about 1.2 x 0.6 km
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Cell of accidents without coordinates; "i" is not a geohash character
+CITY_CELL = "city"
+UNKNOWN_TYPE = "unknown"
+
+# Known names of each field, matched case-insensitively, first match wins
+YEAR_COLUMNS = ("ANNO_INCIDENTE", "ANNO", "YEAR")
+TYPE_COLUMNS = ("NATURA_INCIDENTE", "TIPO_INCIDENTE", "NATURA", "TIPO", "TYPE")
+LATITUDE_COLUMNS = ("LATITUDINE", "LATITUDE", "LAT", "Y")
+LONGITUDE_COLUMNS = ("LONGITUDINE", "LONGITUDE", "LON", "LNG", "X")
+COUNT_COLUMNS = ("NUMERO_INCIDENTI", "N_INCIDENTI", "INCIDENTI", "COUNT")
+
+
+class AccidentRecord(NamedTuple):
+    year: int
+    accident_type: str
+    lat: Optional[float]
+    lon: Optional[float]
+    count: int
+
+
+def parse_number(value: Optional[str]) -> Optional[float]:
+    """Float of a CSV value, accepting a decimal comma; None if empty, invalid or not finite."""
+    if value is None:
+        return None
+    value = value.strip().replace(",", ".")
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+class AccidentColumns:
+    """Names of the typed fields in a CSV header, and the parser of its rows."""
+
+    def __init__(self, header: Sequence[str]):
+        by_name = {name.strip().upper(): name for name in header}
+
+        def find(candidates: Tuple[str, ...]) -> Optional[str]:
+            return next((by_name[c] for c in candidates if c in by_name), None)
+
+        self.year = find(YEAR_COLUMNS)
+        self.accident_type = find(TYPE_COLUMNS)
+        self.lat = find(LATITUDE_COLUMNS)
+        self.lon = find(LONGITUDE_COLUMNS)
+        self.count = find(COUNT_COLUMNS)
+
+    def parse(self, row: Dict[str, Optional[str]]) -> AccidentRecord:
+        year = parse_number(row.get(self.year)) if self.year else None
+        kind = (row.get(self.accident_type) or "").strip() if self.accident_type else ""
+        lat = parse_number(row.get(self.lat)) if self.lat else None
+        lon = parse_number(row.get(self.lon)) if self.lon else None
+        if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            lat = lon = None
+        count = parse_number(row.get(self.count)) if self.count else 1
+        return AccidentRecord(
+            int(year or 0),
+            kind.lower() or UNKNOWN_TYPE,
+            lat,
+            lon,
+            max(int(count or 0), 0),
+        )
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash of a position with precision characters."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars: List[str] = []
+    bits = value = 0
+    even = True  # Bits alternate, starting with longitude
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """(min lon, min lat, max lon, max lat) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def geohash_center(cell: str) -> Tuple[float, float]:
+    """(lon, lat) of the centre of a geohash cell."""
+    min_lon, min_lat, max_lon, max_lat = geohash_bounds(cell)
+    return (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+
+
+class AccidentGrid:
+    """Accident counts per (cell, year, type)."""
+
+    def __init__(self, precision: int = GEOHASH_PRECISION):
+        self.precision = precision
+        self.counts: Dict[Tuple[str, int, str], int] = {}
+        self.records = 0
+        self.accidents = 0
+        self.located = 0
+
+    def add(self, record: AccidentRecord) -> None:
+        if record.lat is None or record.lon is None:
+            cell = CITY_CELL
+        else:
+            cell = geohash_encode(record.lat, record.lon, self.precision)
+            self.located += record.count
+        key = (cell, record.year, record.accident_type)
+        self.counts[key] = self.counts.get(key, 0) + record.count
+        self.records += 1
+        self.accidents += record.count
+
+    def cells(self) -> Iterator[Tuple[str, int, str, int]]:
+        """(cell, year, type, accidents) of every non-empty bucket, sorted."""
+        for (cell, year, kind), accidents in sorted(self.counts.items()):
+            if accidents:
+                yield cell, year, kind, accidents
+
+    def report(self, label: str = "accident_cells") -> str:
+        cells = len({cell for cell, _, _ in self.counts})
+        return (
+            f"  {label}: {self.records} rows, {self.accidents} accidents "
+            f"({self.located} with coordinates) in {len(self.counts)} buckets over "
+            f"{cells} cells (geohash precision {self.precision})"
+        )
@@ -0,0 +1,141 @@
+"""
+Import backend benchmark: REST (PostgREST) batches vs. Postgres COPY.
+
+Inserts synthetic fountains and surface segments with each backend into the
+target database, times them and deletes the rows again (their osm_id starts
+with "bench/"). Run it against a local or staging database that has
+tools/schema.sql applied, never production:
+
+    python benchmark_import.py --rows 20000 --database-url postgresql://...
+
+The REST backend uses SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY; --stub
+starts rest_stub.py instead, which measures the HTTP and JSON cost alone
+(no database work), so the COPY speedup it reports is a lower bound.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import import_datasets as importer
+
+BENCHMARK_ROWS = 20000
+SURFACE_VERTICES = 20
+BENCHMARK_SEED = 42
+STUB_PORT = 54329
+
+
+def synthetic_fountains(n: int, seed: int = BENCHMARK_SEED) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        yield {
+            "type": "Feature",
+            "id": f"bench/node/{i}",
+            "properties": {"amenity": "drinking_water", "bottle": rng.choice(["yes", "no"])},
+            "geometry": {
+                "type": "Point",
+                "coordinates": [9.1 + rng.random() * 0.2, 45.4 + rng.random() * 0.1],
+            },
+        }
+
+
+def synthetic_surfaces(
+    n: int, vertices: int = SURFACE_VERTICES, seed: int = BENCHMARK_SEED
+) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        lon, lat = 9.1 + rng.random() * 0.2, 45.4 + rng.random() * 0.1
+        coords = []
+        for _ in range(vertices):
+            lon += rng.uniform(-1e-4, 1e-4)
+            lat += rng.uniform(-1e-4, 1e-4)
+            coords.append([lon, lat])
+        yield {
+            "type": "Feature",
+            "id": f"bench/way/{i}",
+            "properties": {"surface": "sett", "highway": "residential", "name": f"Via Bench {i}"},
+            "geometry": {"type": "LineString", "coordinates": coords},
+        }
+
+
+BENCHMARK_TABLES: Dict[str, Callable[[int], Iterator[Dict[str, Any]]]] = {
+    "fountains": lambda n: importer.fountain_rows(synthetic_fountains(n)),
+    "surface_segments": lambda n: importer.surface_rows(synthetic_surfaces(n)),
+}
+
+
+def measure(backend: importer.Backend, table: str, n: int, batch_size: int) -> Dict[str, Any]:
+    """Time inserting n synthetic rows into table, then delete them.
+
+    Rows are prepared up front, so only the upload is timed.
+    """
+    rows = list(BENCHMARK_TABLES[table](n))
+    start = time.perf_counter()
+    inserted = backend.insert(table, rows, batch_size)
+    seconds = time.perf_counter() - start
+    backend.delete(table, "osm_id", [str(row["osm_id"]) for row in rows])
+    return {
+        "table": table,
+        "backend": backend.name,
+        "rows": inserted["rows"],
+        "failed_rows": inserted["failed_rows"],
+        "seconds": seconds,
+        "rows_per_second": inserted["rows"] / seconds if seconds else 0.0,
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"\n{'table':<18}{'backend':<10}{'rows':>8}{'seconds':>9}{'rows/s':>10}{'speedup':>9}")
+    rest = {r["table"]: r["seconds"] for r in results if r["backend"] == "rest"}
+    for r in results:
+        speedup = rest[r["table"]] / r["seconds"] if r["table"] in rest and r["seconds"] else None
+        print(
+            f"{r['table']:<18}{r['backend']:<10}{r['rows']:>8}{r['seconds']:>9.2f}"
+            f"{r['rows_per_second']:>10.0f}" + (f"{speedup:>8.1f}x" if speedup else "")
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the import backends")
+    parser.add_argument("--rows", type=int, default=BENCHMARK_ROWS)
+    parser.add_argument(
+        "--tables", nargs="+", default=list(BENCHMARK_TABLES), choices=list(BENCHMARK_TABLES)
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="REST batch size")
+    parser.add_argument("--workers", type=int, default=importer.UPLOAD_WORKERS)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument(
+        "--stub", action="store_true", help="measure REST against a local rest_stub.py"
+    )
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        import rest_stub
+
+        rest_stub.serve(STUB_PORT)
+        os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+        os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "stub")
+    backends: List[importer.Backend] = [importer.RestBackend(workers=args.workers)]
+    if args.database_url:
+        backends.append(importer.PostgresBackend(args.database_url))
+
+    results = []
+    for table in args.tables:
+        for backend in backends:
+            print(f"{table} via {backend.name}...")
+            results.append(measure(backend, table, args.rows, args.batch_size))
+    for backend in backends:
+        backend.close()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
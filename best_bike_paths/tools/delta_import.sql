@@ -0,0 +1,22 @@
+-- Keys for delta imports (python import_datasets.py --delta)
+-- Run this in Supabase SQL Editor before the first delta import
+
+-- Surfaces are upserted on osm_id: remove duplicates left by full imports,
+-- keeping the oldest row (and its path_score), then make osm_id unique
+DELETE FROM public.surface_segments s
+USING public.surface_segments older
+WHERE s.osm_id = older.osm_id
+  AND s.id > older.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS surface_segments_osm_id_key
+ON public.surface_segments (osm_id);
+
+-- Accident rows have no source id; they are keyed by a hash of their content,
+-- computed by the import. Rows from earlier full imports have no hash, so
+-- empty the table once before the first delta import:
+--   TRUNCATE public.accident_stats;
+ALTER TABLE public.accident_stats
+ADD COLUMN IF NOT EXISTS row_hash text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS accident_stats_row_hash_key
+ON public.accident_stats (row_hash);
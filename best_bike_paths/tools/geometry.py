@@ -0,0 +1,257 @@
+"""
+NumPy geometry stage for the dataset import.
+
+Geometries are processed in batches: the vertices of every line of every
+geometry in a batch are stacked into one array, so centroids and
+Douglas-Peucker simplification run as a handful of vectorized passes per
+batch instead of Python loops per vertex.
+
+Coordinates are GeoJSON [lon, lat] degrees. Distances are computed on a
+local equirectangular projection around the first vertex of each line,
+accurate to well under a metre for street-sized features.
+"""
+
+import itertools
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = EARTH_RADIUS_M * np.pi / 180
+SIMPLIFY_TOLERANCE_M = 1.0
+# Geometries per vectorized batch; larger batches keep enough coordinate
+# lists alive to make the garbage collector the bottleneck
+GEOMETRY_BATCH_SIZE = 64
+# Points a simplified ring keeps at least (closed, so first == last)
+MIN_RING_POINTS = 4
+PAYLOAD_SAMPLE_EVERY = 10  # GeometryStats measures the JSON size of 1 in this many
+
+Centroid = Tuple[float, float]
+
+
+def geometry_lines(geometry: Dict[str, Any]) -> List[List[List[float]]]:
+    """Every line of a geometry, as coordinate lists: lines, or polygon rings."""
+    kind = geometry.get("type")
+    coords = geometry.get("coordinates") or []
+    if kind == "LineString":
+        return [coords]
+    if kind in ("MultiLineString", "Polygon"):
+        return list(coords)
+    if kind == "MultiPolygon":
+        return [ring for polygon in coords for ring in polygon]
+    return []
+
+
+def rebuild_geometry(geometry: Dict[str, Any], lines: List[List[List[float]]]) -> Dict[str, Any]:
+    """Copy of geometry with its lines (in geometry_lines order) replaced."""
+    kind = geometry["type"]
+    if kind == "LineString":
+        coordinates: Any = lines[0]
+    elif kind == "MultiPolygon":
+        remaining = iter(lines)
+        coordinates = [[next(remaining) for _ in polygon] for polygon in geometry["coordinates"]]
+    else:
+        coordinates = lines
+    return {**geometry, "coordinates": coordinates}
+
+
+def douglas_peucker(
+    xy: np.ndarray, starts: np.ndarray, ends: np.ndarray, tolerance: float
+) -> np.ndarray:
+    """
+    Boolean mask of the points Douglas-Peucker keeps at tolerance (unit of xy).
+
+    xy holds several lines back to back, line k spanning starts[k]..ends[k]
+    inclusive. All open spans of all lines are split level by level: each
+    pass measures every undecided point against the chord of its span,
+    keeps the farthest point of every span beyond tolerance and settles
+    the points of all other spans.
+    """
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+    open_points = ~keep
+    while open_points.any():
+        points = np.flatnonzero(open_points)
+        kept = np.flatnonzero(keep)
+        span = np.searchsorted(kept, points)
+        a, b = kept[span - 1], kept[span]
+
+        chord = xy[b] - xy[a]
+        offset = xy[points] - xy[a]
+        chord_length = np.hypot(chord[:, 0], chord[:, 1])
+        cross = np.abs(chord[:, 0] * offset[:, 1] - chord[:, 1] * offset[:, 0])
+        # Closed rings have a zero-length chord: distance from the start point
+        distance = np.where(
+            chord_length > 0,
+            cross / np.where(chord_length > 0, chord_length, 1.0),
+            np.hypot(offset[:, 0], offset[:, 1]),
+        )
+
+        # Points of a span are contiguous in points
+        new_span = np.r_[True, span[1:] != span[:-1]]
+        group = np.cumsum(new_span) - 1
+        span_max = np.maximum.reduceat(distance, np.flatnonzero(new_span))
+        split = span_max > tolerance
+        # First point of each split span at its maximum distance
+        candidates = np.flatnonzero(split[group] & (distance == span_max[group]))
+        farthest = candidates[np.diff(group[candidates], prepend=-1) != 0]
+
+        open_points[points[~split[group]]] = False
+        keep[points[farthest]] = True
+        open_points[points[farthest]] = False
+    return keep
+
+
+def process_geometries(
+    geometries: Sequence[Dict[str, Any]], tolerance_m: float = SIMPLIFY_TOLERANCE_M
+) -> List[Tuple[Optional[Centroid], Dict[str, Any], int, int]]:
+    """
+    Centroid and simplified copy of every geometry of a batch.
+
+    The centroid (lon, lat) is the mean of all segment midpoints over all
+    lines of the geometry, weighted by segment length, so it does not move
+    towards densely digitized stretches; geometries of zero length fall
+    back to the vertex mean, geometries without vertices get None. Lines
+    are simplified with Douglas-Peucker at tolerance_m metres (0 keeps
+    them); rings keep at least MIN_RING_POINTS points. Returns
+    (centroid, simplified, vertices before, vertices after) per geometry.
+    """
+    lines: List[List[List[float]]] = []
+    owners: List[int] = []
+    for index, geometry in enumerate(geometries):
+        for line in geometry_lines(geometry):
+            if line:
+                lines.append(line)
+                owners.append(index)
+    if not lines:
+        return [(None, geometry, 0, 0) for geometry in geometries]
+
+    lengths = np.array([len(line) for line in lines])
+    ends = np.cumsum(lengths) - 1
+    starts = ends - lengths + 1
+    values = np.fromiter(
+        itertools.chain.from_iterable(itertools.chain.from_iterable(lines)), dtype=np.float64
+    )
+    if len(values) == 2 * lengths.sum():
+        lonlat = values.reshape(-1, 2)
+    else:
+        # Some coordinates carry an elevation
+        lonlat = np.array([(c[0], c[1]) for line in lines for c in line], dtype=np.float64)
+    line_of_point = np.repeat(np.arange(len(lines)), lengths)
+    owner_of_point = np.asarray(owners)[line_of_point]
+
+    # Metres east/north of each line's first vertex
+    origin = lonlat[starts][line_of_point]
+    scale = np.cos(np.radians(origin[:, 1])) * METRES_PER_DEGREE
+    xy = np.column_stack((
+        (lonlat[:, 0] - origin[:, 0]) * scale,
+        (lonlat[:, 1] - origin[:, 1]) * METRES_PER_DEGREE,
+    ))
+
+    # Length-weighted centroids; segments never join two lines
+    segment = np.ones(len(lonlat) - 1, dtype=bool)
+    segment[ends[:-1]] = False
+    step = np.diff(xy, axis=0)[segment]
+    segment_length = np.hypot(step[:, 0], step[:, 1])
+    midpoint = ((lonlat[:-1] + lonlat[1:]) / 2)[segment]
+    segment_owner = owner_of_point[:-1][segment]
+    n = len(geometries)
+    total = np.bincount(segment_owner, segment_length, n)
+    weighted_lon = np.bincount(segment_owner, segment_length * midpoint[:, 0], n)
+    weighted_lat = np.bincount(segment_owner, segment_length * midpoint[:, 1], n)
+    vertices = np.bincount(owner_of_point, minlength=n)
+    mean_lon = np.bincount(owner_of_point, lonlat[:, 0], n) / np.maximum(vertices, 1)
+    mean_lat = np.bincount(owner_of_point, lonlat[:, 1], n) / np.maximum(vertices, 1)
+    has_length = total > 0
+    safe_total = np.where(has_length, total, 1.0)
+    centroid_lon = np.where(has_length, weighted_lon / safe_total, mean_lon)
+    centroid_lat = np.where(has_length, weighted_lat / safe_total, mean_lat)
+
+    simplified_lines: List[List[List[List[float]]]] = [[] for _ in geometries]
+    if tolerance_m > 0:
+        keep = douglas_peucker(xy, starts, ends, tolerance_m)
+        kept_per_line = np.add.reduceat(keep.astype(np.int64), starts)
+        closed = (lengths >= MIN_RING_POINTS) & np.all(lonlat[starts] == lonlat[ends], axis=1)
+        too_few = closed & (kept_per_line < MIN_RING_POINTS)
+        keep[np.isin(line_of_point, np.flatnonzero(too_few))] = True
+        kept_per_line[too_few] = lengths[too_few]
+        kept_vertices = np.bincount(owner_of_point[keep], minlength=n)
+        for line, owner, start, end, kept in zip(lines, owners, starts, ends, kept_per_line):
+            if kept < len(line):
+                line = [line[i] for i in np.flatnonzero(keep[start:end + 1])]
+            simplified_lines[owner].append(line)
+    else:
+        kept_vertices = vertices
+
+    results: List[Tuple[Optional[Centroid], Dict[str, Any], int, int]] = []
+    for index, geometry in enumerate(geometries):
+        before, after = int(vertices[index]), int(kept_vertices[index])
+        if not before:
+            results.append((None, geometry, 0, 0))
+            continue
+        centroid = (float(centroid_lon[index]), float(centroid_lat[index]))
+        parts = simplified_lines[index]
+        if after == before or len(parts) != len(geometry_lines(geometry)):
+            # Nothing removed, or empty lines a rebuilt geometry could not place
+            results.append((centroid, geometry, before, before))
+        else:
+            results.append((centroid, rebuild_geometry(geometry, parts), before, after))
+    return results
+
+
+def payload_bytes(value: Any) -> int:
+    """Size of value as JSON, as sent to the REST API and stored in jsonb."""
+    return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+class GeometryStats:
+    """
+    Vertex and payload totals of a dataset's geometries before and after
+    simplification.
+
+    Vertices are counted exactly. Serializing every geometry twice would
+    cost as much as parsing the file, so payload bytes are measured on
+    every sample_every-th geometry and scaled to the dataset.
+    """
+
+    def __init__(self, sample_every: int = PAYLOAD_SAMPLE_EVERY) -> None:
+        self.sample_every = sample_every
+        self.features = 0
+        self.vertices_before = 0
+        self.vertices_after = 0
+        self.sampled = 0
+        self.sampled_bytes_before = 0
+        self.sampled_bytes_after = 0
+
+    def add(
+        self, before: Dict[str, Any], after: Dict[str, Any], vertices_before: int, vertices_after: int
+    ) -> None:
+        if self.features % self.sample_every == 0:
+            size = payload_bytes(before)
+            self.sampled += 1
+            self.sampled_bytes_before += size
+            self.sampled_bytes_after += size if after is before else payload_bytes(after)
+        self.features += 1
+        self.vertices_before += vertices_before
+        self.vertices_after += vertices_after
+
+    @property
+    def bytes_before(self) -> float:
+        return self.sampled_bytes_before * self.features / self.sampled if self.sampled else 0.0
+
+    @property
+    def bytes_after(self) -> float:
+        return self.sampled_bytes_after * self.features / self.sampled if self.sampled else 0.0
+
+    def report(self, label: str) -> str:
+        def reduction(before: float, after: float) -> str:
+            return f"-{100 * (1 - after / before):.1f}%" if before else "n/a"
+
+        return (
+            f"  {label}: {self.features} geometries, vertices {self.vertices_before} -> "
+            f"{self.vertices_after} ({reduction(self.vertices_before, self.vertices_after)}), "
+            f"geometry payload ~{self.bytes_before / 1e6:.1f} MB -> ~{self.bytes_after / 1e6:.1f} MB "
+            f"({reduction(self.bytes_before, self.bytes_after)}, measured on 1 in {self.sample_every})"
+        )
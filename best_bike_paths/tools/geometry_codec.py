@@ -0,0 +1,315 @@
+"""
+Compact encodings of GeoJSON geometries for surface_segments.
+
+- EWKB hex: PostGIS' extended well-known binary (little endian, with
+  SRID), accepted as input by any geometry column.
+- Encoded polyline: each line as the Google polyline algorithm string
+  (lat/lon deltas at a fixed decimal precision, zigzag-encoded as base-64
+  varints), stored in the geometry jsonb as
+  {"type": ..., "precision": 6, "polyline": ...} where polyline has the
+  nesting of coordinates minus the point level.
+
+encode_geometry / decode_geometry dispatch on ENCODINGS. Run the module
+on a GeoJSON file to compare the encoded sizes with the plain jsonb
+representation and check that every geometry round-trips:
+
+    python geometry_codec.py "export road surface.geojson"
+"""
+
+import argparse
+import itertools
+import json
+import struct
+from typing import Any, Dict, Iterator, List, Tuple
+
+from geometry import GEOMETRY_BATCH_SIZE, SIMPLIFY_TOLERANCE_M, process_geometries
+
+ENCODINGS = ("geojson", "polyline", "ewkb")
+POLYLINE_PRECISION = 6  # Decimal places; 1e-6 degrees is about 0.1 m
+SRID = 4326
+
+WKB_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+}
+WKB_TYPE_NAMES = {code: name for name, code in WKB_TYPES.items()}
+EWKB_SRID_FLAG = 0x20000000
+# Coordinates nesting depth below "coordinates" for each type (Point: none)
+COORDINATE_DEPTH = {
+    "Point": 0,
+    "LineString": 1,
+    "MultiPoint": 1,
+    "Polygon": 2,
+    "MultiLineString": 2,
+    "MultiPolygon": 3,
+}
+
+
+# ---- EWKB ----
+
+
+def _wkb_body(kind: str, coords: Any) -> bytes:
+    """WKB of a geometry without the byte order and type header."""
+    if kind == "Point":
+        return struct.pack("<2d", coords[0], coords[1])
+    if kind == "LineString":
+        return struct.pack("<I", len(coords)) + b"".join(
+            struct.pack("<2d", c[0], c[1]) for c in coords
+        )
+    if kind == "Polygon":
+        return struct.pack("<I", len(coords)) + b"".join(
+            _wkb_body("LineString", ring) for ring in coords
+        )
+    part = {"MultiPoint": "Point", "MultiLineString": "LineString", "MultiPolygon": "Polygon"}[kind]
+    return struct.pack("<I", len(coords)) + b"".join(
+        struct.pack("<BI", 1, WKB_TYPES[part]) + _wkb_body(part, c) for c in coords
+    )
+
+
+def encode_ewkb(geometry: Dict[str, Any], srid: int = SRID) -> str:
+    """Hex EWKB (little endian, 2D, with SRID) of a GeoJSON geometry."""
+    kind = geometry["type"]
+    if kind not in WKB_TYPES:
+        raise ValueError(f"Unsupported geometry type {kind!r}")
+    header = struct.pack("<BII", 1, WKB_TYPES[kind] | EWKB_SRID_FLAG, srid)
+    return (header + _wkb_body(kind, geometry["coordinates"])).hex()
+
+
+def decode_ewkb(data: str) -> Tuple[Dict[str, Any], int]:
+    """GeoJSON geometry and SRID (0 if none) of hex EWKB or WKB."""
+    raw = bytes.fromhex(data)
+    srid = 0
+
+    def read(offset: int) -> Tuple[str, Any, int]:
+        nonlocal srid
+        order = "<" if raw[offset] == 1 else ">"
+        (code,) = struct.unpack_from(order + "I", raw, offset + 1)
+        offset += 5
+        if code & EWKB_SRID_FLAG:
+            (srid,) = struct.unpack_from(order + "I", raw, offset)
+            offset += 4
+        kind = WKB_TYPE_NAMES[code & 0xFF]
+
+        def points(offset: int) -> Tuple[List[List[float]], int]:
+            (n,) = struct.unpack_from(order + "I", raw, offset)
+            values = struct.unpack_from(order + f"{2 * n}d", raw, offset + 4)
+            return [list(values[i:i + 2]) for i in range(0, 2 * n, 2)], offset + 4 + 16 * n
+
+        if kind == "Point":
+            return kind, list(struct.unpack_from(order + "2d", raw, offset)), offset + 16
+        if kind == "LineString":
+            coords, offset = points(offset)
+            return kind, coords, offset
+        (n,) = struct.unpack_from(order + "I", raw, offset)
+        offset += 4
+        parts = []
+        for _ in range(n):
+            if kind == "Polygon":
+                part, offset = points(offset)
+            else:
+                _, part, offset = read(offset)
+            parts.append(part)
+        return kind, parts, offset
+
+    kind, coords, _ = read(0)
+    return {"type": kind, "coordinates": coords}, srid
+
+
+# ---- Encoded polyline ----
+
+
+def _encode_value(value: int, out: List[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1  # zigzag
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(coords: List[List[float]], precision: int = POLYLINE_PRECISION) -> str:
+    """Polyline string of [lon, lat] coordinates (encoded lat first, like Google's)."""
+    factor = 10**precision
+    out: List[str] = []
+    previous_lat = previous_lon = 0
+    for c in coords:
+        lat, lon = round(c[1] * factor), round(c[0] * factor)
+        _encode_value(lat - previous_lat, out)
+        _encode_value(lon - previous_lon, out)
+        previous_lat, previous_lon = lat, lon
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> List[List[float]]:
+    """[lon, lat] coordinates of a polyline string."""
+    factor = 10**precision
+    coords = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        values = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += values[0]
+        lon += values[1]
+        coords.append([lon / factor, lat / factor])
+    return coords
+
+
+def _map_lines(coords: Any, depth: int, line: Any) -> Any:
+    """Apply line to every line (depth 1 list) of a coordinates nesting."""
+    if depth == 1:
+        return line(coords)
+    return [_map_lines(part, depth - 1, line) for part in coords]
+
+
+# ---- Dispatch ----
+
+
+def encode_geometry(
+    geometry: Dict[str, Any], encoding: str, precision: int = POLYLINE_PRECISION
+) -> Any:
+    """Value of a GeoJSON geometry in encoding (see ENCODINGS)."""
+    if encoding == "geojson":
+        return geometry
+    if encoding == "ewkb":
+        return encode_ewkb(geometry)
+    if encoding == "polyline":
+        kind = geometry["type"]
+        depth = COORDINATE_DEPTH[kind]
+        coords = geometry["coordinates"]
+        if depth == 0:
+            coords, depth = [coords], 1
+        return {
+            "type": kind,
+            "precision": precision,
+            "polyline": _map_lines(coords, depth, lambda line: encode_polyline(line, precision)),
+        }
+    raise ValueError(f"Unknown geometry encoding {encoding!r}, expected one of {ENCODINGS}")
+
+
+def decode_geometry(value: Any, encoding: str) -> Dict[str, Any]:
+    """GeoJSON geometry of a value produced by encode_geometry."""
+    if encoding == "geojson":
+        return value
+    if encoding == "ewkb":
+        return decode_ewkb(value)[0]
+    if encoding == "polyline":
+        kind = value["type"]
+        depth = max(COORDINATE_DEPTH[kind], 1)
+        coords = _map_lines(
+            value["polyline"], depth, lambda line: decode_polyline(line, value["precision"])
+        )
+        return {"type": kind, "coordinates": coords[0] if kind == "Point" else coords}
+    raise ValueError(f"Unknown geometry encoding {encoding!r}, expected one of {ENCODINGS}")
+
+
+def max_coordinate_error(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """Largest coordinate difference in degrees between two geometries of the same shape."""
+
+    def flatten(coords: Any) -> List[float]:
+        if coords and isinstance(coords[0], (int, float)):
+            return list(coords[:2])
+        return [value for part in coords for value in flatten(part)]
+
+    if a["type"] != b["type"]:
+        raise ValueError(f"Geometry type changed: {a['type']} -> {b['type']}")
+    left, right = flatten(a["coordinates"]), flatten(b["coordinates"])
+    if len(left) != len(right):
+        raise ValueError("Vertex count changed")
+    return max((abs(x - y) for x, y in zip(left, right)), default=0.0)
+
+
+def stored_size(value: Any, encoding: str) -> int:
+    """Bytes of value in its column: jsonb text, or binary for an EWKB geometry column."""
+    if encoding == "ewkb":
+        return len(value) // 2
+    return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def payload_size(value: Any) -> int:
+    """Bytes of value in a JSON request body."""
+    return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def compare_encodings(
+    geometries: Any, precision: int = POLYLINE_PRECISION
+) -> Dict[str, Dict[str, float]]:
+    """
+    Payload and stored sizes of every encoding over geometries, with the
+    largest round-trip error; raises ValueError if one does not round-trip.
+    """
+    totals = {
+        encoding: {"payload_bytes": 0, "stored_bytes": 0, "max_error": 0.0}
+        for encoding in ENCODINGS
+    }
+    tolerance = 0.5 / 10**precision + 1e-12
+    for geometry in geometries:
+        for encoding in ENCODINGS:
+            value = encode_geometry(geometry, encoding, precision)
+            error = max_coordinate_error(geometry, decode_geometry(value, encoding))
+            limit = tolerance if encoding == "polyline" else 0.0
+            if error > limit:
+                raise ValueError(f"{encoding} does not round-trip: error {error} > {limit}")
+            totals[encoding]["payload_bytes"] += payload_size(value)
+            totals[encoding]["stored_bytes"] += stored_size(value, encoding)
+            totals[encoding]["max_error"] = max(totals[encoding]["max_error"], error)
+    return totals
+
+
+def print_comparison(totals: Dict[str, Dict[str, float]]) -> None:
+    base = totals["geojson"]
+    print(f"{'encoding':<10}{'payload MB':>12}{'vs jsonb':>10}{'stored MB':>11}{'vs jsonb':>10}{'max error':>12}")
+    for encoding, sizes in totals.items():
+        print(
+            f"{encoding:<10}{sizes['payload_bytes'] / 1e6:>12.2f}"
+            f"{sizes['payload_bytes'] / max(base['payload_bytes'], 1):>9.2f}x"
+            f"{sizes['stored_bytes'] / 1e6:>11.2f}"
+            f"{sizes['stored_bytes'] / max(base['stored_bytes'], 1):>9.2f}x"
+            f"{sizes['max_error']:>12.1e}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare and check geometry encodings on a GeoJSON file")
+    parser.add_argument("geojson")
+    parser.add_argument("--precision", type=int, default=POLYLINE_PRECISION)
+    parser.add_argument(
+        "--simplify-tolerance",
+        type=float,
+        default=SIMPLIFY_TOLERANCE_M,
+        help="simplify like import_datasets.py first (0: compare the raw geometries)",
+    )
+    args = parser.parse_args()
+
+    from import_datasets import iter_features
+
+    def simplified_geometries() -> Iterator[Dict[str, Any]]:
+        features = iter_features(args.geojson)
+        while True:
+            batch = [
+                feature["geometry"]
+                for feature in itertools.islice(features, GEOMETRY_BATCH_SIZE)
+                if (feature.get("geometry") or {}).get("type") in WKB_TYPES
+            ]
+            if not batch:
+                return
+            for centroid, geometry, _, _ in process_geometries(batch, args.simplify_tolerance):
+                if centroid is not None:
+                    yield geometry
+
+    print_comparison(compare_encodings(simplified_geometries(), args.precision))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+-- Column for EWKB surface geometries (python import_datasets.py --geometry-encoding ewkb)
+-- Run this in Supabase SQL Editor before importing with that encoding
+
+-- Binary PostGIS geometry; the importer leaves the geometry jsonb column empty,
+-- so the app reads it through surface_geojson below
+ALTER TABLE public.surface_segments
+ADD COLUMN IF NOT EXISTS geom geometry(Geometry, 4326);
+
+CREATE INDEX IF NOT EXISTS surface_segments_geom_gix
+ON public.surface_segments USING gist (geom);
+
+-- The polyline encoding needs no schema change: it is stored in the geometry
+-- jsonb column as {"type": ..., "precision": 6, "polyline": ...}
+
+-- Geometry for the app whatever the encoding: the jsonb value (GeoJSON or
+-- polyline) or, for EWKB imports, geom as GeoJSON. PostgREST exposes it as a
+-- computed column: select=surface,centroid,geometry:surface_geojson
+CREATE OR REPLACE FUNCTION public.surface_geojson(segment public.surface_segments)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT COALESCE(segment.geometry, ST_AsGeoJSON(segment.geom)::jsonb);
+$$;
+
+GRANT EXECUTE ON FUNCTION public.surface_geojson(public.surface_segments) TO authenticated, anon;
@@ -1,23 +1,52 @@
+import argparse
 import csv
+import hashlib
+import itertools
 import json
 import os
-from typing import Any, Dict, Iterable, List, Tuple
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from supabase import create_client
+import ijson
 from dotenv import load_dotenv
+from postgrest.types import ReturnMethod
+from postgrest.exceptions import APIError
+from supabase import Client, create_client
+
+from accident_grid import CITY_CELL, GEOHASH_PRECISION, AccidentColumns, AccidentGrid, geohash_center
+from geometry import GEOMETRY_BATCH_SIZE, SIMPLIFY_TOLERANCE_M, GeometryStats, process_geometries
+from geometry_codec import ENCODINGS, POLYLINE_PRECISION, encode_geometry
+from tile_pack import TILE_ZOOM, TilePackBuilder
 
 load_dotenv()
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+# Uploads: worker threads, batches queued per worker, retries of a failed batch
+UPLOAD_WORKERS = 4
+BATCHES_IN_FLIGHT_PER_WORKER = 2
+UPLOAD_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 0.5
+RETRY_BACKOFF_MAX_SECONDS = 30.0
+# PostgREST/Postgres error codes that fail the same way on every retry:
+# data exceptions, constraint violations, undefined columns, bad requests
+PERMANENT_ERROR_PREFIXES = ("22", "23", "42", "PGRST1", "PGRST2")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise SystemExit(
-        "Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY env vars. "
-        "Create a .env file or export them before running."
-    )
+# Delta imports: local state of the last import, column each table is upserted on
+DELTA_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_state.json")
+DELTA_KEYS = {
+    "accident_stats": "row_hash",
+    "accident_cells": "cell_id",
+    "fountains": "osm_id",
+    "surface_segments": "osm_id",
+}
+DELETE_BATCH_SIZE = 200
+KEYS_PAGE_SIZE = 1000  # PostgREST's default maximum rows per response
+# Aggregates rebuilt from the whole source on every run: always upserted on
+# their DELTA_KEYS column, with rows missing from the new source deleted
+DERIVED_TABLES = ("accident_cells",)
 
-client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_client: Optional[Client] = None
 
 SURFACE_ALLOWED = {
     "cobblestone",
@@ -28,117 +57,726 @@ SURFACE_ALLOWED = {
 }
 
 
-def batch_insert(table: str, rows: List[Dict[str, Any]], batch_size: int = 500) -> None:
-    for start in range(0, len(rows), batch_size):
-        chunk = rows[start : start + batch_size]
-        if not chunk:
-            continue
-        client.table(table).insert(chunk).execute()
+def get_client() -> Client:
+    """The Supabase client, created from the environment on first use."""
+    global _client
+    if _client is None:
+        url = os.environ.get("SUPABASE_URL")
+        key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+        if not url or not key:
+            raise SystemExit(
+                "Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY env vars. "
+                "Create a .env file or export them before running."
+            )
+        _client = create_client(url, key)
+    return _client
 
 
-def to_wkt_point(lon: float, lat: float) -> str:
-    return f"SRID=4326;POINT({lon} {lat})"
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed request may succeed when sent again."""
+    if isinstance(error, APIError):
+        code = error.code or ""
+        if code.isdigit() and len(code) == 3:
+            # HTTP status of a response without a PostgREST error body
+            return code == "429" or code.startswith("5")
+        return not code.startswith(PERMANENT_ERROR_PREFIXES)
+    # Connection errors, timeouts, ...
+    return True
+
+
+def send_with_retry(send: Callable[[], Any], retries: int = UPLOAD_RETRIES) -> int:
+    """Call send until it succeeds; returns the number of retries needed.
+
+    Retryable errors are retried up to retries times with exponential
+    backoff and jitter; the last error, or a permanent one, is raised.
+    """
+    for attempt in range(retries + 1):
+        try:
+            send()
+            return attempt
+        except Exception as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+            backoff = min(RETRY_BACKOFF_SECONDS * 2**attempt, RETRY_BACKOFF_MAX_SECONDS)
+            time.sleep(backoff * random.uniform(0.5, 1.0))
+    raise AssertionError("unreachable")
+
+
+def upload_batches(
+    table: str,
+    rows: Iterable[Any],
+    send_batch: Callable[[List[Any]], Any],
+    batch_size: int = 500,
+    workers: int = UPLOAD_WORKERS,
+) -> Dict[str, Any]:
+    """Send rows in batches of batch_size with send_batch, several at a time.
+
+    Batches are sent from a pool of workers threads. Only
+    workers * BATCHES_IN_FLIGHT_PER_WORKER batches are queued at any time,
+    so rows are pulled from the iterable no faster than they are uploaded.
+    Failed batches are retried (see send_with_retry); batches that still
+    fail are counted and the upload goes on. Returns and prints a summary.
+    """
+    rows = iter(rows)
+    summary: Dict[str, Any] = {
+        "table": table,
+        "rows": 0,
+        "batches": 0,
+        "retries": 0,
+        "failed_batches": 0,
+        "failed_rows": 0,
+        "first_error": None,
+    }
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def submit(count: int) -> None:
+            for _ in range(count):
+                chunk = list(itertools.islice(rows, batch_size))
+                if not chunk:
+                    return
+                future = executor.submit(send_with_retry, lambda chunk=chunk: send_batch(chunk))
+                pending[future] = len(chunk)
+
+        submit(workers * BATCHES_IN_FLIGHT_PER_WORKER)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                n_rows = pending.pop(future)
+                try:
+                    summary["retries"] += future.result()
+                    summary["rows"] += n_rows
+                    summary["batches"] += 1
+                except Exception as error:
+                    summary["failed_batches"] += 1
+                    summary["failed_rows"] += n_rows
+                    if summary["first_error"] is None:
+                        summary["first_error"] = repr(error)
+            submit(len(done))
+
+    seconds = time.perf_counter() - start
+    summary["seconds"] = seconds
+    summary["rows_per_second"] = summary["rows"] / seconds if seconds else 0.0
+    summary["batches_per_second"] = summary["batches"] / seconds if seconds else 0.0
+    print_upload_summary(summary)
+    return summary
+
+
+def print_upload_summary(summary: Dict[str, Any]) -> None:
+    print(
+        f"  {summary['table']}: {summary['rows']} rows in {summary['batches']} batches, "
+        f"{summary['seconds']:.1f} s ({summary['rows_per_second']:.0f} rows/s, "
+        f"{summary['batches_per_second']:.1f} batches/s), {summary['retries']} retries"
+    )
+    if summary["failed_batches"]:
+        print(
+            f"  {summary['table']}: {summary['failed_batches']} batches "
+            f"({summary['failed_rows']} rows) failed, first error: {summary['first_error']}"
+        )
+
+
+def batch_insert(
+    table: str,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = 500,
+    client: Optional[Client] = None,
+    workers: int = UPLOAD_WORKERS,
+) -> Dict[str, Any]:
+    """Insert rows in batches of batch_size, consuming rows lazily."""
+    client = client or get_client()
+    return upload_batches(
+        table,
+        rows,
+        lambda chunk: client.table(table).insert(chunk).execute(),
+        batch_size,
+        workers,
+    )
+
+
+class RestBackend:
+    """Writes rows through the Supabase REST API (PostgREST)."""
+
+    name = "rest"
+
+    def __init__(self, client: Optional[Client] = None, workers: int = UPLOAD_WORKERS):
+        self.client = client or get_client()
+        self.workers = workers
+
+    def insert(self, table: str, rows: Iterable[Dict[str, Any]], batch_size: int) -> Dict[str, Any]:
+        return batch_insert(table, rows, batch_size, self.client, self.workers)
 
+    def upsert(
+        self, table: str, rows: Iterable[Dict[str, Any]], key: str, batch_size: int
+    ) -> Dict[str, Any]:
+        return upload_batches(
+            table,
+            rows,
+            lambda chunk: self.client.table(table)
+            .upsert(chunk, on_conflict=key, returning=ReturnMethod.minimal)
+            .execute(),
+            batch_size,
+            self.workers,
+        )
+
+    def delete(self, table: str, key: str, keys: List[str]) -> Dict[str, Any]:
+        return upload_batches(
+            f"{table} (deletes)",
+            keys,
+            lambda chunk: self.client.table(table)
+            .delete(returning=ReturnMethod.minimal)
+            .in_(key, chunk)
+            .execute(),
+            DELETE_BATCH_SIZE,
+            self.workers,
+        )
+
+    def keys(self, table: str, key: str) -> List[str]:
+        """Every value of the key column of table, read KEYS_PAGE_SIZE rows at a time."""
+        keys: List[str] = []
+        while True:
+            page: List[Dict[str, Any]] = []
+
+            def fetch() -> None:
+                page[:] = (
+                    self.client.table(table)
+                    .select(key)
+                    .order(key)
+                    .range(len(keys), len(keys) + KEYS_PAGE_SIZE - 1)
+                    .execute()
+                    .data
+                )
+
+            send_with_retry(fetch)
+            keys.extend(str(row[key]) for row in page)
+            if len(page) < KEYS_PAGE_SIZE:
+                return keys
+
+    def close(self) -> None:
+        pass
+
+
+class PostgresBackend:
+    """Writes rows straight to Postgres with COPY, bypassing the REST API.
+
+    Every operation streams its rows with COPY ... FROM STDIN into a
+    temporary staging table shaped like the target columns and merges them
+    with one INSERT (... ON CONFLICT for upserts) or DELETE, in one
+    transaction per table. Needs psycopg and a connection string such as
+    Supabase's (Project Settings > Database).
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg
+            from psycopg import sql
+            from psycopg.types.json import Jsonb
+        except ImportError:
+            raise SystemExit(
+                "The postgres backend needs psycopg: python -m pip install 'psycopg[binary]'"
+            )
+        self.sql = sql
+        self.jsonb = Jsonb
+        self.connection = psycopg.connect(dsn)
+
+    def _stage(self, cursor: Any, table: str, columns: List[str], rows: Iterable[List[Any]]) -> int:
+        """COPY rows (values in columns order) into a temp table; returns the row count."""
+        sql = self.sql
+        cursor.execute(
+            sql.SQL(
+                "CREATE TEMP TABLE import_stage ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA"
+            ).format(sql.SQL(", ").join(map(sql.Identifier, columns)), sql.Identifier("public", table))
+        )
+        count = 0
+        copy_statement = sql.SQL("COPY import_stage ({}) FROM STDIN").format(
+            sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+        with cursor.copy(copy_statement) as copy:
+            for values in rows:
+                copy.write_row(values)
+                count += 1
+        return count
+
+    def _run(
+        self,
+        label: str,
+        rows: Iterable[Any],
+        columns_of: Callable[[Any], List[str]],
+        values_of: Callable[[Any, List[str]], List[Any]],
+        merge: Callable[[List[str]], Any],
+    ) -> Dict[str, Any]:
+        """Stage rows and run the merge statement built by merge(columns)."""
+        summary: Dict[str, Any] = {
+            "table": label,
+            "rows": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed_batches": 0,
+            "failed_rows": 0,
+            "first_error": None,
+        }
+        start = time.perf_counter()
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is not None:
+            columns = columns_of(first)
+            table = label.split(" ", 1)[0]
+            try:
+                with self.connection.transaction(), self.connection.cursor() as cursor:
+                    summary["rows"] = self._stage(
+                        cursor,
+                        table,
+                        columns,
+                        (values_of(row, columns) for row in itertools.chain([first], rows)),
+                    )
+                    cursor.execute(merge(columns))
+                summary["batches"] = 1
+            except Exception as error:
+                summary["failed_batches"] = 1
+                summary["failed_rows"] = summary["rows"]
+                summary["rows"] = 0
+                summary["first_error"] = repr(error)
+
+        seconds = time.perf_counter() - start
+        summary["seconds"] = seconds
+        summary["rows_per_second"] = summary["rows"] / seconds if seconds else 0.0
+        summary["batches_per_second"] = summary["batches"] / seconds if seconds else 0.0
+        print_upload_summary(summary)
+        return summary
+
+    def _values(self, row: Dict[str, Any], columns: List[str]) -> List[Any]:
+        return [
+            self.jsonb(row[column]) if isinstance(row[column], (dict, list)) else row[column]
+            for column in columns
+        ]
+
+    def _insert_statement(self, table: str, columns: List[str]) -> Any:
+        sql = self.sql
+        names = sql.SQL(", ").join(map(sql.Identifier, columns))
+        return sql.SQL("INSERT INTO {} ({}) SELECT {} FROM import_stage").format(
+            sql.Identifier("public", table), names, names
+        )
+
+    def insert(self, table: str, rows: Iterable[Dict[str, Any]], batch_size: int) -> Dict[str, Any]:
+        return self._run(
+            table, rows, list, self._values, lambda columns: self._insert_statement(table, columns)
+        )
+
+    def upsert(
+        self, table: str, rows: Iterable[Dict[str, Any]], key: str, batch_size: int
+    ) -> Dict[str, Any]:
+        sql = self.sql
+
+        def merge(columns: List[str]) -> Any:
+            updates = [
+                sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(c), sql.Identifier(c))
+                for c in columns
+                if c != key
+            ]
+            return sql.SQL("{} ON CONFLICT ({}) DO UPDATE SET {}").format(
+                self._insert_statement(table, columns), sql.Identifier(key), sql.SQL(", ").join(updates)
+            )
+
+        return self._run(table, rows, list, self._values, merge)
+
+    def delete(self, table: str, key: str, keys: List[str]) -> Dict[str, Any]:
+        sql = self.sql
+        return self._run(
+            f"{table} (deletes)",
+            keys,
+            lambda _: [key],
+            lambda row_key, _: [row_key],
+            lambda _: sql.SQL(
+                "DELETE FROM {} AS target USING import_stage WHERE target.{} = import_stage.{}"
+            ).format(sql.Identifier("public", table), sql.Identifier(key), sql.Identifier(key)),
+        )
 
-def centroid_from_coords(coords: List[List[float]]) -> Tuple[float, float]:
-    if not coords:
-        return 0.0, 0.0
-    lon_sum = 0.0
-    lat_sum = 0.0
-    for lon, lat in coords:
-        lon_sum += lon
-        lat_sum += lat
-    return lon_sum / len(coords), lat_sum / len(coords)
+    def keys(self, table: str, key: str) -> List[str]:
+        """Every value of the key column of table."""
+        sql = self.sql
+        with self.connection.transaction(), self.connection.cursor() as cursor:
+            cursor.execute(
+                sql.SQL("SELECT {} FROM {}").format(sql.Identifier(key), sql.Identifier("public", table))
+            )
+            return [str(row_key) for (row_key,) in cursor]
 
+    def close(self) -> None:
+        self.connection.close()
 
-def load_accidents(csv_path: str) -> None:
-    rows: List[Dict[str, Any]] = []
+
+Backend = Union[RestBackend, PostgresBackend]
+
+
+def row_hash(row: Dict[str, Any]) -> str:
+    """Hash of a prepared row's content, independent of key order."""
+    data = json.dumps(row, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_delta_state(path: str) -> Dict[str, Dict[str, str]]:
+    """Per table, the key -> row hash of every row the last delta import sent."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_delta_state(path: str, state: Dict[str, Dict[str, str]]) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def delta_import(
+    table: str,
+    rows: Iterable[Dict[str, Any]],
+    state: Dict[str, Dict[str, str]],
+    backend: Backend,
+    batch_size: int = 500,
+) -> Dict[str, Any]:
+    """Bring table in line with rows, sending only what changed since the last import.
+
+    Rows are keyed on DELTA_KEYS[table] ("row_hash" keys a row by its
+    content, numbering identical rows). Rows whose hash differs from
+    state[table] are upserted and keys missing from rows are deleted.
+    state[table] is replaced by the new hashes only if every batch
+    succeeded, so a failed import is resent in full by the next run.
+    """
+    key = DELTA_KEYS[table]
+    previous = state.get(table, {})
+    current: Dict[str, str] = {}
+    occurrences: Dict[str, int] = {}
+    counts = {"unchanged": 0, "duplicates": 0, "missing_key": 0}
+
+    def changed_rows() -> Iterator[Dict[str, Any]]:
+        for row in rows:
+            digest = row_hash(row)
+            if key == "row_hash":
+                # Identical rows are still separate records: number the repeats
+                repeat = occurrences.get(digest, 0)
+                occurrences[digest] = repeat + 1
+                row = {**row, "row_hash": f"{digest}-{repeat}" if repeat else digest}
+            if row.get(key) is None:
+                counts["missing_key"] += 1
+                continue
+            row_key = str(row[key])
+            if row_key in current:
+                # Upserting a key twice in one statement is an error
+                counts["duplicates"] += 1
+                continue
+            current[row_key] = digest
+            if previous.get(row_key) == digest:
+                counts["unchanged"] += 1
+                continue
+            yield row
+
+    upserted = backend.upsert(table, changed_rows(), key, batch_size)
+    deleted = {"rows": 0, "failed_batches": 0}
+    # Only a fully read source tells which keys were removed
+    removed = [row_key for row_key in previous if row_key not in current]
+    if removed and not upserted["failed_batches"]:
+        deleted = backend.delete(table, key, removed)
+
+    failed_batches = upserted["failed_batches"] + deleted["failed_batches"]
+    if not failed_batches:
+        state[table] = current
+    print(
+        f"  {table}: {counts['unchanged']} unchanged, {upserted['rows']} new or changed, "
+        f"{deleted['rows']} removed"
+        + (f", {counts['duplicates']} duplicate keys skipped" if counts["duplicates"] else "")
+        + (f", {counts['missing_key']} rows without {key} skipped" if counts["missing_key"] else "")
+    )
+    return {
+        "table": table,
+        **counts,
+        "upserted": upserted["rows"],
+        "deleted": deleted["rows"],
+        "failed_batches": failed_batches,
+    }
+
+
+def import_rows(
+    table: str,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = 500,
+    state: Optional[Dict[str, Dict[str, str]]] = None,
+    backend: Optional[Backend] = None,
+    tiles: Optional[TilePackBuilder] = None,
+) -> Dict[str, Any]:
+    """Insert all rows, or only the delta against state if one is given.
+
+    DERIVED_TABLES are never plainly inserted: without stored hashes for
+    them their rows are upserted and the keys the table holds beyond them
+    are deleted, as a delta against the table's current keys. Rows of the
+    tile pack layers are also added to tiles if given.
+    """
+    backend = backend or RestBackend()
+    if tiles is not None:
+        rows = tiles.collect(table, rows)
+    if table in DERIVED_TABLES and table not in (state or {}):
+        # Every current key counts as changed, so all rows are sent
+        state = {} if state is None else state
+        state[table] = dict.fromkeys(backend.keys(table, DELTA_KEYS[table]), "")
+    if state is None:
+        return backend.insert(table, rows, batch_size)
+    return delta_import(table, rows, state, backend, batch_size)
+
+
+def iter_features(geojson_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the features of a GeoJSON FeatureCollection one at a time.
+
+    The file is parsed incrementally, so memory does not grow with the
+    number of features.
+    """
+    with open(geojson_path, "rb") as f:
+        yield from ijson.items(f, "features.item", use_float=True)
+
+
+def to_wkt_point(lon: float, lat: float) -> str:
+    return f"SRID=4326;POINT({lon} {lat})"
+
+
+def accident_rows(csv_path: str, grid: Optional[AccidentGrid] = None) -> Iterator[Dict[str, Any]]:
+    """Raw accident rows; each is also parsed and counted in grid if one is given."""
     with open(csv_path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
+        columns = AccidentColumns(reader.fieldnames or [])
         for row in reader:
-            year = int(row.get("ANNO_INCIDENTE") or 0)
-            comune = row.get("COMUNE")
-            rows.append({"year": year, "comune": comune, "data": row})
+            record = columns.parse(row)
+            if grid is not None:
+                grid.add(record)
+            yield {"year": record.year, "comune": row.get("COMUNE"), "data": row}
+
 
-    batch_insert("accident_stats", rows, batch_size=200)
+def accident_cell_rows(grid: AccidentGrid) -> Iterator[Dict[str, Any]]:
+    for cell, year, accident_type, accidents in grid.cells():
+        center = None if cell == CITY_CELL else to_wkt_point(*geohash_center(cell))
+        yield {
+            "cell_id": f"{cell}/{year}/{accident_type}",
+            "cell": cell,
+            "year": year,
+            "accident_type": accident_type,
+            "accidents": accidents,
+            "center": center,
+        }
 
 
-def load_fountains(geojson_path: str) -> None:
-    with open(geojson_path, encoding="utf-8") as f:
-        data = json.load(f)
+def load_accidents(
+    csv_path: str, cell_precision: int = GEOHASH_PRECISION, **options: Any
+) -> Dict[str, Any]:
+    """Import the raw accident rows, then their counts per cell, year and type."""
+    grid = AccidentGrid(cell_precision)
+    summary = import_rows("accident_stats", accident_rows(csv_path, grid), batch_size=200, **options)
+    print(grid.report())
+    cells = import_rows("accident_cells", accident_cell_rows(grid), **options)
+    return {**summary, "failed_batches": summary["failed_batches"] + cells["failed_batches"]}
 
-    rows: List[Dict[str, Any]] = []
-    for feature in data.get("features", []):
+
+def fountain_rows(features: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for feature in features:
         geom = feature.get("geometry") or {}
         coords = geom.get("coordinates") or []
         if geom.get("type") != "Point" or len(coords) < 2:
             continue
         lon, lat = coords[0], coords[1]
-        rows.append(
-            {
-                "osm_id": feature.get("id"),
-                "location": to_wkt_point(lon, lat),
-                "properties": feature.get("properties") or {},
-            }
-        )
+        yield {
+            "osm_id": feature.get("id"),
+            "location": to_wkt_point(lon, lat),
+            "properties": feature.get("properties") or {},
+        }
 
-    batch_insert("fountains", rows)
 
+def load_fountains(geojson_path: str, **options: Any) -> Dict[str, Any]:
+    return import_rows("fountains", fountain_rows(iter_features(geojson_path)), **options)
 
-def load_surfaces(geojson_path: str) -> None:
-    with open(geojson_path, encoding="utf-8") as f:
-        data = json.load(f)
 
-    rows: List[Dict[str, Any]] = []
-    for feature in data.get("features", []):
-        props = feature.get("properties") or {}
-        surface = (props.get("surface") or "").lower()
-        if surface not in SURFACE_ALLOWED:
-            continue
+def surface_rows(
+    features: Iterable[Dict[str, Any]],
+    tolerance_m: float = SIMPLIFY_TOLERANCE_M,
+    stats: Optional[GeometryStats] = None,
+    encoding: str = "geojson",
+    precision: int = POLYLINE_PRECISION,
+) -> Iterator[Dict[str, Any]]:
+    """Rows of the allowed surfaces; geometries simplified to tolerance_m (0 keeps them raw).
 
-        geom = feature.get("geometry") or {}
-        coords: List[List[float]] = []
-        if geom.get("type") == "LineString":
-            coords = geom.get("coordinates") or []
-        elif geom.get("type") == "Polygon":
-            rings = geom.get("coordinates") or []
-            if rings:
-                coords = rings[0]
-        elif geom.get("type") == "MultiLineString":
-            lines = geom.get("coordinates") or []
-            if lines:
-                coords = lines[0]
-
-        if not coords:
-            continue
+    Geometries go through the NumPy stage GEOMETRY_BATCH_SIZE features at a time
+    and are stored in encoding (see geometry_codec): "geojson" and "polyline"
+    in the geometry jsonb column, "ewkb" in the geom geometry column
+    (geometry_encoding.sql), which the app reads through the surface_geojson
+    computed column defined there.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown geometry encoding {encoding!r}, expected one of {ENCODINGS}")
 
-        lon, lat = centroid_from_coords(coords)
-        rows.append(
-            {
+    def allowed() -> Iterator[Tuple[Dict[str, Any], Dict[str, Any], str]]:
+        for feature in features:
+            props = feature.get("properties") or {}
+            surface = (props.get("surface") or "").lower()
+            if surface in SURFACE_ALLOWED:
+                yield feature, props, surface
+
+    candidates = allowed()
+    while True:
+        batch = list(itertools.islice(candidates, GEOMETRY_BATCH_SIZE))
+        if not batch:
+            break
+        geometries = [feature.get("geometry") or {} for feature, _, _ in batch]
+        processed = process_geometries(geometries, tolerance_m)
+        for (feature, props, surface), geom, (centroid, simplified, before, after) in zip(
+            batch, geometries, processed
+        ):
+            if centroid is None:
+                continue
+            encoded = encode_geometry(simplified, encoding, precision)
+            if stats is not None:
+                stats.add(geom, encoded, before, after)
+            row = {
                 "osm_id": feature.get("id"),
                 "surface": surface,
                 "highway": props.get("highway"),
                 "name": props.get("name"),
-                "centroid": to_wkt_point(lon, lat),
-                "geometry": geom,
+                "centroid": to_wkt_point(*centroid),
+                "geometry": encoded,
             }
-        )
+            if encoding == "ewkb":
+                row["geometry"] = None
+                row["geom"] = encoded
+            yield row
 
-    batch_insert("surface_segments", rows, batch_size=200)
+
+def load_surfaces(
+    geojson_path: str,
+    tolerance_m: float = SIMPLIFY_TOLERANCE_M,
+    encoding: str = "geojson",
+    precision: int = POLYLINE_PRECISION,
+    **options: Any,
+) -> Dict[str, Any]:
+    stats = GeometryStats()
+    summary = import_rows(
+        "surface_segments",
+        surface_rows(iter_features(geojson_path), tolerance_m, stats, encoding, precision),
+        batch_size=200,
+        **options,
+    )
+    print(stats.report("surface_segments geometry"))
+    return summary
 
 
-def main() -> None:
+def dataset_paths() -> Tuple[str, str, str]:
+    """Accident CSV, fountains and surfaces GeoJSON paths, in $DATASET_BASE."""
     base = os.environ.get("DATASET_BASE", "/Users/rahul/Desktop")
-    accident_csv = os.path.join(base, "INCIDENTI_STRADALI_nel_COMUNE_MILANO_20260125.csv")
-    fountains_geojson = os.path.join(base, "export water fountains.geojson")
-    surfaces_geojson = os.path.join(base, "export road surface.geojson")
-
-    print("Importing accidents...")
-    load_accidents(accident_csv)
-    print("Importing fountains...")
-    load_fountains(fountains_geojson)
-    print("Importing cobblestones...")
-    load_surfaces(surfaces_geojson)
+    return (
+        os.path.join(base, "INCIDENTI_STRADALI_nel_COMUNE_MILANO_20260125.csv"),
+        os.path.join(base, "export water fountains.geojson"),
+        os.path.join(base, "export road surface.geojson"),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Import accidents, fountains and surfaces into Supabase")
+    parser.add_argument(
+        "--backend",
+        choices=("rest", "postgres"),
+        default="rest",
+        help="write through the REST API, or with COPY straight to Postgres",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get("DATABASE_URL"),
+        help="Postgres connection string for --backend postgres (default: $DATABASE_URL)",
+    )
+    parser.add_argument(
+        "--simplify-tolerance",
+        type=float,
+        default=SIMPLIFY_TOLERANCE_M,
+        help="Douglas-Peucker tolerance in metres for surface geometries (0: upload them raw)",
+    )
+    parser.add_argument(
+        "--geometry-encoding",
+        choices=ENCODINGS,
+        default="geojson",
+        help="surface geometry storage: GeoJSON or encoded polyline in the geometry jsonb, "
+        "or EWKB in the geom column (run geometry_encoding.sql first: the app then reads "
+        "it through surface_geojson)",
+    )
+    parser.add_argument(
+        "--polyline-precision",
+        type=int,
+        default=POLYLINE_PRECISION,
+        help="decimal places of polyline coordinates",
+    )
+    parser.add_argument(
+        "--accident-cell-precision",
+        type=int,
+        default=GEOHASH_PRECISION,
+        help="geohash length of the accident_cells grid (run accident_cells.sql first)",
+    )
+    parser.add_argument(
+        "--tile-pack", default=None, help="also write the imported rows to this offline tile pack"
+    )
+    parser.add_argument("--tile-zoom", type=int, default=TILE_ZOOM, help="zoom level of the tile pack")
+    parser.add_argument(
+        "--workers", type=int, default=UPLOAD_WORKERS, help="batches uploaded concurrently (rest)"
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="upsert only new or changed rows and delete removed ones (run delta_import.sql first)",
+    )
+    parser.add_argument(
+        "--state-file", default=DELTA_STATE_FILE, help="hashes of the last delta import"
+    )
+    args = parser.parse_args(argv)
+
+    accident_csv, fountains_geojson, surfaces_geojson = dataset_paths()
+    if args.backend == "postgres":
+        if not args.database_url:
+            raise SystemExit("--backend postgres needs --database-url or DATABASE_URL.")
+        backend: Backend = PostgresBackend(args.database_url)
+    else:
+        backend = RestBackend(get_client(), args.workers)
+    options: Dict[str, Any] = {"backend": backend}
+    if args.delta:
+        options["state"] = load_delta_state(args.state_file)
+    if args.tile_pack:
+        options["tiles"] = TilePackBuilder(args.tile_zoom)
+
+    summaries = []
+    for message, load, path in (
+        (
+            "Importing accidents...",
+            lambda path, **options: load_accidents(path, args.accident_cell_precision, **options),
+            accident_csv,
+        ),
+        ("Importing fountains...", load_fountains, fountains_geojson),
+        (
+            "Importing cobblestones...",
+            lambda path, **options: load_surfaces(
+                path,
+                args.simplify_tolerance,
+                args.geometry_encoding,
+                args.polyline_precision,
+                **options,
+            ),
+            surfaces_geojson,
+        ),
+    ):
+        print(message)
+        summaries.append(load(path, **options))
+        if args.delta:
+            save_delta_state(args.state_file, options["state"])
+    backend.close()
+    if args.tile_pack:
+        pack = options["tiles"].write(args.tile_pack)
+        print(f"Wrote {args.tile_pack}: {pack['tiles']} tiles, {pack['bytes'] / 1e6:.1f} MB")
+
+    failed = sum(summary["failed_batches"] for summary in summaries)
+    if failed:
+        raise SystemExit(f"Done with {failed} failed batches.")
     print("Done.")
 
 
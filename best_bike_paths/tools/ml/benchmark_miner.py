@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Pothole Data Miner Benchmarks
+Measures the mining pipeline on synthetic SimRa rides (see simra_synth.py).
+
+Benchmarks:
+- ride-length: peak RSS and time to mine a single ride of growing length,
+  streaming reader vs. whole-file columnar parse vs. list-of-dicts parse.
+  Each measurement runs in a fresh process so peak RSS is not shared.
+- stages: time of each pipeline stage (parse_ride_file, extract_windows,
+  classify_window, compute_features, window_table) and of the end-to-end
+  main() on small, medium and large synthetic corpora, for both parsers.
+
+Results are written as JSON together with the commit and environment;
+--baseline compares a run against an earlier results file.
+
+Usage:
+  python benchmark_miner.py ride-length --rows 20000 200000 2000000
+  python benchmark_miner.py stages --sizes small medium --baseline old.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+import contextlib
+
+import simra_synth
+import pothole_data_miner as miner
+
+RIDE_LENGTH_ROWS = [20000, 200000, 1000000]
+RIDE_LENGTH_MODES = ['stream', 'columnar']
+
+# Synthetic corpora for the stages benchmark: (rides, average rows per ride)
+CORPUS_SIZES = {
+    'small': (10, 5000),
+    'medium': (50, 20000),
+    'large': (200, 50000),
+}
+STAGE_MODES = ['columnar', 'dicts']
+SLOWER_RATIO = 1.1  # --baseline flags entries that got this much slower
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure_ride(mode, ride_path):
+    """Mine one ride with the given mode; returns time, windows and RSS."""
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+
+    if mode == 'stream':
+        n_windows, _ = miner.mine_ride(ride_path, columnar=True)
+    elif mode == 'columnar':
+        incidents, columns = miner.parse_ride_file(ride_path, columnar=True)
+        n_windows = len(miner.window_table(columns)['label'])
+    else:
+        n_windows, _ = miner.mine_ride(ride_path, columnar=False)
+
+    return {
+        'mode': mode,
+        'seconds': time.perf_counter() - start,
+        'windows': n_windows,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure_in_subprocess(mode, ride_path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '_measure', mode, ride_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def ride_length_benchmark(rows_list, modes, work_dir):
+    """Peak RSS and time per mode for single rides of increasing length."""
+    results = []
+    for n_rows in rows_list:
+        ride_path = os.path.join(work_dir, f'ride_{n_rows}.txt')
+        if not os.path.exists(ride_path):
+            print(f"Generating {n_rows}-row ride...")
+            simra_synth.write_ride(ride_path, n_rows, seed=n_rows)
+        size_mb = os.path.getsize(ride_path) / (1024 * 1024)
+
+        for mode in modes:
+            result = measure_in_subprocess(mode, ride_path)
+            result.update({'rows': n_rows, 'file_mb': size_mb})
+            result['rss_above_baseline_mb'] = result['peak_rss_mb'] - result['baseline_rss_mb']
+            results.append(result)
+            print(f"  {n_rows:>9} rows ({size_mb:7.1f} MB) {mode:>9}: "
+                  f"{result['seconds']:7.2f} s, peak RSS +{result['rss_above_baseline_mb']:7.1f} MB")
+    return results
+
+
+def time_stages(corpus_dir, mode):
+    """
+    Time parse_ride_file, extract_windows, classify_window, compute_features
+    and (columnar only) window_table over every ride of a corpus.
+
+    Rides are processed one at a time, so memory stays at one parsed ride.
+    Returns one result per stage; 'items' is what the stage iterates over
+    (rows for parsing, windows otherwise, labelled windows for features).
+    """
+    columnar = mode == 'columnar'
+    stages = ['parse_ride_file', 'extract_windows', 'classify_window', 'compute_features']
+    if columnar:
+        stages.append('window_table')
+    seconds = dict.fromkeys(stages, 0.0)
+    rides = rows = windows = labelled = 0
+
+    for _, ride_path in miner.list_ride_files(corpus_dir):
+        start = time.perf_counter()
+        incidents, sensor_data = miner.parse_ride_file(ride_path, columnar=columnar)
+        seconds['parse_ride_file'] += time.perf_counter() - start
+        if sensor_data is None:
+            continue
+        rides += 1
+        rows += len(sensor_data['ts']) if columnar else len(sensor_data)
+
+        start = time.perf_counter()
+        ride_windows = miner.extract_windows(sensor_data)
+        seconds['extract_windows'] += time.perf_counter() - start
+        windows += len(ride_windows)
+
+        start = time.perf_counter()
+        labels = [miner.classify_window(window) for window in ride_windows]
+        seconds['classify_window'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for window, label in zip(ride_windows, labels):
+            if label is not None:
+                miner.compute_features(window)
+                labelled += 1
+        seconds['compute_features'] += time.perf_counter() - start
+
+        if columnar:
+            start = time.perf_counter()
+            miner.window_table(sensor_data)
+            seconds['window_table'] += time.perf_counter() - start
+
+    items = {
+        'parse_ride_file': rows,
+        'extract_windows': windows,
+        'classify_window': windows,
+        'compute_features': labelled,
+        'window_table': windows,
+    }
+    return [
+        {'stage': stage, 'mode': mode, 'workers': 1, 'seconds': elapsed, 'rides': rides,
+         'rows': rows, 'items': items[stage],
+         'items_per_s': items[stage] / elapsed if elapsed else None}
+        for stage, elapsed in seconds.items()
+    ]
+
+
+def time_main(corpus_dir, mode, workers):
+    """
+    Time the miner's main() over a whole corpus with the ride cache off.
+
+    The sample targets are lifted for the run so every ride is mined
+    instead of stopping once enough samples are found.
+    """
+    targets = miner.TARGET_POTHOLE_SAMPLES, miner.TARGET_NORMAL_SAMPLES
+    miner.TARGET_POTHOLE_SAMPLES = miner.TARGET_NORMAL_SAMPLES = sys.maxsize
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            argv = ['--dataset', corpus_dir, '--output', output_dir, '--parser', mode,
+                    '--workers', str(workers), '--no-cache']
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                miner.main(argv)
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(output_dir, 'mining_summary.json')) as f:
+                summary = json.load(f)
+    finally:
+        miner.TARGET_POTHOLE_SAMPLES, miner.TARGET_NORMAL_SAMPLES = targets
+
+    return {
+        'stage': 'main', 'mode': mode, 'workers': workers, 'seconds': elapsed,
+        'rides': summary['files_processed'], 'items': summary['total_windows'],
+        'items_per_s': summary['total_windows'] / elapsed if elapsed else None,
+    }
+
+
+def stages_benchmark(sizes, modes, work_dir, workers):
+    """Stage and end-to-end timings for each corpus size and parser mode."""
+    results = []
+    for size in sizes:
+        n_rides, rows_per_ride = CORPUS_SIZES[size]
+        corpus_dir = os.path.join(work_dir, size)
+        if not os.path.isdir(corpus_dir):
+            print(f"Generating {size} corpus ({n_rides} rides x ~{rows_per_ride} rows)...")
+            simra_synth.write_corpus(corpus_dir, n_rides, rows_per_ride, seed=n_rides)
+
+        for mode in modes:
+            mode_results = time_stages(corpus_dir, mode)
+            mode_results.append(time_main(corpus_dir, mode, 1))
+            if workers > 1:
+                mode_results.append(time_main(corpus_dir, mode, workers))
+            for result in mode_results:
+                result['corpus'] = size
+                results.append(result)
+                print(f"  {size:>6} {mode:>8} {result['stage']:>16} x{result['workers']:<3}: "
+                      f"{result['seconds']:8.3f} s ({result['items']} items)")
+    return results
+
+
+def result_key(result):
+    return result['corpus'], result['mode'], result['stage'], result['workers']
+
+
+def compare_results(results, baseline_file):
+    """Print each result's time relative to the same entry of a baseline file."""
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    previous = {result_key(result): result for result in baseline['results']}
+
+    print(f"\nCompared with {baseline_file} (commit {baseline.get('commit') or 'unknown'}):")
+    for result in results:
+        before = previous.get(result_key(result))
+        if not before or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = '  <-- slower' if ratio > SLOWER_RATIO else ''
+        name = ' '.join(str(part) for part in result_key(result))
+        print(f"  {name:>36}: {before['seconds']:8.3f} s -> {result['seconds']:8.3f} s "
+              f"({ratio:5.2f}x){flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pothole data miner")
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    ride_length = sub.add_parser('ride-length', help="peak RSS vs. ride length")
+    ride_length.add_argument('--rows', type=int, nargs='+', default=RIDE_LENGTH_ROWS)
+    ride_length.add_argument('--modes', nargs='+', default=RIDE_LENGTH_MODES,
+                             choices=['stream', 'columnar', 'dicts'])
+    ride_length.add_argument('--work-dir', default=None,
+                             help="where synthetic rides are generated (default: temp dir)")
+    ride_length.add_argument('--output', default='benchmark_ride_length.json')
+    ride_length.add_argument('--baseline', default=None,
+                             help="earlier results file to compare against")
+
+    stages = sub.add_parser('stages', help="per-stage and end-to-end timings on synthetic corpora")
+    stages.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(CORPUS_SIZES))
+    stages.add_argument('--modes', nargs='+', default=STAGE_MODES, choices=STAGE_MODES)
+    stages.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="also time main() of each parser with this many workers")
+    stages.add_argument('--work-dir', default=None,
+                        help="where synthetic corpora are generated and kept (default: temp dir)")
+    stages.add_argument('--output', default='benchmark_stages.json')
+    stages.add_argument('--baseline', default=None,
+                        help="earlier results file to compare against")
+
+    measure = sub.add_parser('_measure', help=argparse.SUPPRESS)
+    measure.add_argument('mode')
+    measure.add_argument('ride_path')
+
+    args = parser.parse_args(argv)
+
+    if args.benchmark == '_measure':
+        print(json.dumps(measure_ride(args.mode, args.ride_path)))
+        return
+
+    print("=" * 60)
+    if args.benchmark == 'ride-length':
+        print("Ride Length Stress Benchmark")
+    else:
+        print("Pipeline Stage Benchmark")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        if args.benchmark == 'ride-length':
+            results = ride_length_benchmark(args.rows, args.modes, work_dir)
+            for result in results:
+                result.update({'corpus': f"{result['rows']}-rows", 'stage': 'mine_ride', 'workers': 1})
+        else:
+            results = stages_benchmark(args.sizes, args.modes, work_dir, args.workers)
+
+    with open(args.output, 'w') as f:
+        json.dump({'benchmark': args.benchmark, **miner.environment(), 'results': results}, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.baseline:
+        compare_results(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
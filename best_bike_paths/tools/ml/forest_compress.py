@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Flat Forest Compression
+Post-training passes that shrink a flat forest (see forest_export) before
+it is exported to Dart:
+- drop_trees: greedily remove the trees that contribute least to the
+  ensemble accuracy, within a maximum accuracy drop
+- merge_sibling_leaves: collapse splits whose two leaves predict the same
+  class into one leaf
+- quantize_forest: store thresholds and leaf values as float32 literals,
+  or as int16 codes with a per-feature scale and offset
+
+compress_forest runs the passes in that order and records the size and
+accuracy of the forest after every stage, so the accuracy cost of the
+compression is known.
+"""
+
+import numpy as np
+
+import forest_export
+from forest_export import LEAF, NODE_ARRAYS, VALUE_CODE_SCALE
+
+QUANTIZATION_MODES = ('float32', 'int16')
+INT16_MIN = -32768
+INT16_MAX = 32767
+INT16_LEVELS = INT16_MAX - INT16_MIN
+DROP_TREES_SAMPLE_ROWS = 200000  # Rows drop_trees scores candidates on
+DROP_TREES_SEED = 42
+QUANTIZED_NODE_ARRAYS = ('threshold_code', 'value_code')
+
+
+def compact_forest(flat):
+    """
+    Copy of flat holding only the nodes reachable from the roots.
+
+    Nodes are renumbered in depth-first preorder, tree by tree, and
+    max_depth is recomputed.
+    """
+    left, right = flat['left'], flat['right']
+    order = []
+    depths = []
+    roots = []
+    for root in flat['roots']:
+        roots.append(len(order))
+        stack = [(int(root), 0)]
+        while stack:
+            node, depth = stack.pop()
+            order.append(node)
+            depths.append(depth)
+            if left[node] != LEAF:
+                stack.append((int(right[node]), depth + 1))
+                stack.append((int(left[node]), depth + 1))
+
+    order = np.array(order, dtype=np.int64)
+    new_index = np.full(len(flat['feature']), LEAF, dtype=np.int64)
+    new_index[order] = np.arange(len(order))
+
+    compact = dict(flat)
+    for name in NODE_ARRAYS + QUANTIZED_NODE_ARRAYS:
+        if name in flat:
+            compact[name] = flat[name][order]
+    for name in ('left', 'right'):
+        children = flat[name][order]
+        compact[name] = np.where(children == LEAF, LEAF, new_index[children]).astype(np.int32)
+    compact['roots'] = np.array(roots, dtype=np.int32)
+    compact['max_depth'] = max(depths, default=0)
+    return compact
+
+
+def merge_sibling_leaves(flat):
+    """
+    Replace every split whose children are both leaves of the same class
+    (pothole probability above or not above 0.5) with a single leaf.
+
+    The merged leaf takes the sample-weighted mean of the two leaf values,
+    which is the split node's own training probability. Merging repeats
+    until no such split is left, so whole subtrees predicting one class
+    collapse.
+    """
+    flat = {name: value.copy() if isinstance(value, np.ndarray) else value
+            for name, value in flat.items()}
+    feature, left, right = flat['feature'], flat['left'], flat['right']
+    value, weight = flat['value'], flat['weight']
+    while True:
+        split = np.flatnonzero(feature != LEAF)
+        l, r = left[split], right[split]
+        mergeable = (feature[l] == LEAF) & (feature[r] == LEAF) & \
+            ((value[l] > 0.5) == (value[r] > 0.5))
+        if not mergeable.any():
+            break
+        nodes, l, r = split[mergeable], l[mergeable], r[mergeable]
+        total = weight[l] + weight[r]
+        value[nodes] = np.where(total > 0, (value[l] * weight[l] + value[r] * weight[r]) /
+                                np.where(total > 0, total, 1.0), (value[l] + value[r]) / 2)
+        feature[nodes] = LEAF
+        flat['threshold'][nodes] = 0.0
+        left[nodes] = LEAF
+        right[nodes] = LEAF
+    return compact_forest(flat)
+
+
+def select_trees(flat, keep):
+    """Copy of flat with only the trees at the indices in keep."""
+    selected = dict(flat)
+    selected['roots'] = flat['roots'][np.sort(np.asarray(keep, dtype=np.int64))]
+    return compact_forest(selected)
+
+
+def drop_trees(flat, X, y, max_accuracy_drop, min_trees=1):
+    """
+    Greedy backward elimination of trees.
+
+    Each round removes the tree whose removal leaves the highest accuracy
+    on (X, y), as long as the accuracy stays within max_accuracy_drop of
+    the full forest and at least min_trees remain. At most
+    DROP_TREES_SAMPLE_ROWS rows of X are used for scoring.
+
+    (X, y) must be rows the forest was not trained on: every tree scores
+    close to 1.0 on its own training rows, so nearly all trees would look
+    redundant.
+    """
+    y = np.asarray(y)
+    if len(X) > DROP_TREES_SAMPLE_ROWS:
+        rows = np.random.default_rng(DROP_TREES_SEED).choice(
+            len(X), DROP_TREES_SAMPLE_ROWS, replace=False)
+        X, y = X[np.sort(rows)], y[np.sort(rows)]
+    truth = (y == forest_export.POTHOLE_CLASS)[:, None]
+
+    votes = forest_export.tree_probabilities(flat, X).astype(np.float32)
+    keep = list(range(votes.shape[1]))
+    total = votes.sum(axis=1)
+    baseline = float(np.mean((total / len(keep) > 0.5) == truth[:, 0]))
+
+    while len(keep) > max(min_trees, 1):
+        without = (total[:, None] - votes[:, keep]) / (len(keep) - 1) > 0.5
+        accuracy = np.mean(without == truth, axis=0)
+        best = int(np.argmax(accuracy))
+        if baseline - accuracy[best] > max_accuracy_drop:
+            break
+        total -= votes[:, keep[best]]
+        del keep[best]
+    return select_trees(flat, keep)
+
+
+def quantize_forest(flat, mode):
+    """
+    Copy of flat with thresholds and leaf values quantized.
+
+    'float32': every threshold becomes the shortest decimal literal that
+    lies between the largest float32 not above it and the next float32, so
+    float32 features split exactly as before; leaf values are rounded to
+    float32.
+
+    'int16': the thresholds of every feature are mapped linearly onto the
+    int16 range. threshold_code holds the codes, threshold_scale and
+    threshold_offset the per-feature dequantization
+    offset[f] + code * scale[f]; threshold holds that dequantized value.
+    Leaf values are stored as value_code = round(value * VALUE_CODE_SCALE).
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization {mode!r}, expected one of {QUANTIZATION_MODES}")
+    quantized = dict(flat)
+    is_split = flat['feature'] != LEAF
+
+    if mode == 'float32':
+        quantized['threshold'] = np.array(
+            [_short_float32_threshold(t) if split else 0.0
+             for t, split in zip(flat['threshold'], is_split)])
+        quantized['value'] = np.array([float(str(np.float32(v))) for v in flat['value']])
+    else:
+        n_features = len(flat['feature_names'])
+        scale = np.ones(n_features)
+        offset = np.zeros(n_features)
+        code = np.zeros(len(flat['feature']), dtype=np.int16)
+        for f in range(n_features):
+            nodes = np.flatnonzero(flat['feature'] == f)
+            if not nodes.size:
+                continue
+            lo, hi = flat['threshold'][nodes].min(), flat['threshold'][nodes].max()
+            if hi > lo:
+                scale[f] = (hi - lo) / INT16_LEVELS
+            offset[f] = lo - INT16_MIN * scale[f]
+            codes = np.rint((flat['threshold'][nodes] - offset[f]) / scale[f])
+            code[nodes] = np.clip(codes, INT16_MIN, INT16_MAX)
+
+        # Same operation order as the Dart evaluator
+        split_feature = np.where(is_split, flat['feature'], 0)
+        threshold = offset[split_feature] + code.astype(np.float64) * scale[split_feature]
+        value_code = np.rint(flat['value'] * VALUE_CODE_SCALE).astype(np.int16)
+
+        quantized['threshold'] = np.where(is_split, threshold, 0.0)
+        quantized['threshold_code'] = code
+        quantized['threshold_scale'] = scale
+        quantized['threshold_offset'] = offset
+        quantized['value'] = value_code / VALUE_CODE_SCALE
+        quantized['value_code'] = value_code
+    quantized['quantization'] = mode
+    return quantized
+
+
+def _short_float32_threshold(threshold):
+    """Shortest literal splitting float32 values like threshold does."""
+    below = np.float32(threshold)
+    if below > threshold:
+        below = np.nextafter(below, np.float32(-np.inf))
+    above = np.nextafter(below, np.float32(np.inf))
+    for digits in range(1, 18):
+        candidate = float(f'{float(below):.{digits}g}')
+        if below <= candidate < above:
+            return candidate
+    return float(below)
+
+
+def flat_accuracy(flat, X, y):
+    """Accuracy of the flat forest's pothole/normal decision on (X, y)."""
+    predicted = forest_export.predict_proba_flat(flat, X) > 0.5
+    return float(np.mean(predicted == (np.asarray(y) == forest_export.POTHOLE_CLASS)))
+
+
+def compress_forest(flat, X_select, y_select, X_eval, y_eval,
+                    max_accuracy_drop=None, merge_leaves=False, quantization=None):
+    """
+    Run the enabled compression passes on flat.
+
+    Trees are dropped on (X_select, y_select), held-out rows other than
+    the evaluation rows (see drop_trees); accuracy is reported on
+    (X_eval, y_eval). Returns the compressed forest and one dict per stage
+    (starting with the uncompressed 'original') holding trees, nodes, Dart
+    source size, accuracy and the accuracy delta against the original.
+    """
+    stages = []
+
+    def record(name, current):
+        accuracy = flat_accuracy(current, X_eval, y_eval)
+        stages.append({
+            'stage': name,
+            **forest_export.forest_stats(current),
+            'dart_bytes': len(forest_export.dart_source(current, current['feature_names']).encode()),
+            'accuracy': accuracy,
+            'accuracy_delta': accuracy - stages[0]['accuracy'] if stages else 0.0,
+        })
+
+    record('original', flat)
+    if max_accuracy_drop is not None:
+        flat = drop_trees(flat, X_select, y_select, max_accuracy_drop)
+        record('drop_trees', flat)
+    if merge_leaves:
+        flat = merge_sibling_leaves(flat)
+        record('merge_leaves', flat)
+    if quantization:
+        flat = quantize_forest(flat, quantization)
+        record(f'quantize_{quantization}', flat)
+    return flat, stages
+
+
+def print_compression_report(stages):
+    print(f"{'stage':<18}{'trees':>6}{'nodes':>8}{'dart KB':>9}{'accuracy':>10}{'delta':>9}")
+    for stage in stages:
+        print(f"{stage['stage']:<18}{stage['trees']:>6}{stage['nodes']:>8}"
+              f"{stage['dart_bytes'] / 1024:>9.1f}{stage['accuracy']:>10.4f}"
+              f"{stage['accuracy_delta']:>+9.4f}")
+
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Forest Distillation
+Small models trained to imitate the forest's pothole probability, for
+low-end devices:
+- distill_tree: one shallow DecisionTreeRegressor fitted on the forest's
+  predict_proba
+- distill_lookup_table: a binned lookup table over the forest's top-k
+  features by feature_importances_, each cell holding the mean forest
+  probability of the training windows in it
+
+Both are returned as flat forests of a single tree (see forest_export), so
+they go through the same parity checks, compression and Dart export as
+the forest and are evaluated with at most max_depth comparisons. The
+lookup table is laid out as a binary search over the bin edges of one
+feature after the other.
+"""
+
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+
+import forest_export
+import forest_compress
+from forest_export import LEAF
+
+DISTILL_MODES = ('tree', 'lut')
+DISTILL_TREE_DEPTH = 6
+DISTILL_TREE_MIN_LEAF = 5
+LUT_FEATURES = 3
+LUT_BINS = 8
+
+
+def forest_probability(model, X):
+    """The forest's pothole probability for every row of X."""
+    pothole_index = list(model.classes_).index(forest_export.POTHOLE_CLASS)
+    return model.predict_proba(X)[:, pothole_index]
+
+
+def distill_tree(model, X, feature_names, max_depth=DISTILL_TREE_DEPTH,
+                 min_samples_leaf=DISTILL_TREE_MIN_LEAF):
+    """Flat single regression tree imitating the forest's probability on X."""
+    student = DecisionTreeRegressor(max_depth=max_depth, min_samples_leaf=min_samples_leaf,
+                                    random_state=42)
+    student.fit(X, forest_probability(model, X))
+    return forest_export.flatten_regression_tree(student, feature_names)
+
+
+def top_features(model, k):
+    """Indices of the k most important features of the forest, most important first."""
+    return np.argsort(model.feature_importances_)[::-1][:k].tolist()
+
+
+def distill_lookup_table(model, X, feature_names, k=LUT_FEATURES, bins=LUT_BINS):
+    """
+    Flat tree implementing a lookup table over the top k features.
+
+    Each feature is cut into at most bins quantile bins of X. A cell holds
+    the mean forest probability of its rows; empty cells fall back to the
+    mean of the enclosing cell over the features before it.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    target = forest_probability(model, X)
+    features = top_features(model, k)
+    edges = []
+    for f in features:
+        quantiles = np.quantile(X[:, f], np.linspace(0, 1, bins + 1)[1:-1])
+        edges.append(np.unique(quantiles.astype(np.float32)).astype(np.float64))
+
+    nodes = {name: [] for name in forest_export.NODE_ARRAYS}
+
+    def add_node():
+        for name in forest_export.NODE_ARRAYS:
+            nodes[name].append(LEAF if name in ('feature', 'left', 'right') else 0.0)
+        return len(nodes['feature']) - 1
+
+    def build(rows, level, lo, hi, fallback):
+        """Node over rows for bin edges lo:hi of features[level]; returns its index."""
+        value = float(target[rows].mean()) if len(rows) else fallback
+        while level < len(features) and lo == hi:
+            # One bin left for this feature: continue with the next one
+            level += 1
+            lo, hi = 0, len(edges[level]) if level < len(features) else 0
+
+        node = add_node()
+        nodes['weight'][node] = float(len(rows))
+        if level == len(features):
+            nodes['value'][node] = value
+            return node
+
+        middle = (lo + hi) // 2
+        f = features[level]
+        threshold = edges[level][middle]
+        go_left = X[rows, f] <= threshold
+        nodes['feature'][node] = f
+        nodes['threshold'][node] = threshold
+        nodes['left'][node] = build(rows[go_left], level, lo, middle, value)
+        nodes['right'][node] = build(rows[~go_left], level, middle + 1, hi, value)
+        return node
+
+    build(np.arange(len(X)), 0, 0, len(edges[0]) if features else 0, float(target.mean()))
+
+    flat = {
+        'feature': np.array(nodes['feature'], dtype=np.int32),
+        'threshold': np.array(nodes['threshold'], dtype=np.float64),
+        'left': np.array(nodes['left'], dtype=np.int32),
+        'right': np.array(nodes['right'], dtype=np.int32),
+        'value': np.array(nodes['value'], dtype=np.float64),
+        'weight': np.array(nodes['weight'], dtype=np.float64),
+        'roots': np.array([0], dtype=np.int32),
+        'max_depth': 0,
+        'feature_names': list(feature_names),
+    }
+    # compact_forest renumbers in preorder and computes max_depth
+    return forest_compress.compact_forest(flat)
+
+
+def agreement_report(model, flat, X, y):
+    """
+    Compare a distilled flat model with the forest on (X, y).
+
+    Returns the share of rows where both predict the same class, the mean
+    and maximum probability difference and both accuracies.
+    """
+    teacher = forest_probability(model, X)
+    student = forest_export.predict_proba_flat(flat, X)
+    truth = np.asarray(y) == forest_export.POTHOLE_CLASS
+    return {
+        'rows': int(len(X)),
+        'agreement': float(np.mean((teacher > 0.5) == (student > 0.5))) if len(X) else 1.0,
+        'mean_abs_diff': float(np.mean(np.abs(teacher - student))) if len(X) else 0.0,
+        'max_abs_diff': float(np.max(np.abs(teacher - student))) if len(X) else 0.0,
+        'forest_accuracy': float(np.mean((teacher > 0.5) == truth)) if len(X) else 0.0,
+        'accuracy': float(np.mean((student > 0.5) == truth)) if len(X) else 0.0,
+    }
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Flat Forest Export
+Serializes a fitted RandomForestClassifier as flat parallel node arrays.
+
+All trees share one set of arrays, indexed by node:
+- feature:   feature index tested at the node, -1 for leaves
+- threshold: go left when features[feature] <= threshold
+- left/right: child node indices (-1 for leaves)
+- value:     pothole probability of the leaf (0.0 for split nodes)
+- weight:    weighted training samples that reached the node
+and roots holds the index of every tree's root node. The forest's pothole
+probability is the mean leaf value over the trees, exactly like
+RandomForestClassifier.predict_proba.
+
+A forest compressed by forest_compress.quantize_forest also carries its
+quantization ('float32' or 'int16'); for int16 the Dart export stores
+integer codes plus per-feature scales instead of double literals.
+
+flatten_regression_tree and forest_distill build the same arrays for
+distilled models (one regression tree, or a lookup table laid out as a
+tree), so they share the evaluators and the export.
+
+The same arrays are used by:
+- predict_proba_flat: vectorized NumPy reference evaluator
+- scalar_evaluator: one-window-at-a-time Python port of the Dart evaluator,
+  used to compare the per-window latency of candidate models
+- dart_source: Dart class with a small generic evaluator that keeps the
+  PotholeDetectionModel API (predictProbability, isPothole, featureNames)
+- save_flat_forest/load_flat_forest: .npz export loadable from Python
+"""
+
+import time
+
+import numpy as np
+
+LEAF = -1
+NODE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'weight')
+POTHOLE_CLASS = 1
+PREDICT_CHUNK_ROWS = 1 << 18  # Rows evaluated at once by predict_proba_flat
+PARITY_TOLERANCE = 1e-9
+DART_VALUES_PER_LINE = 8
+VALUE_CODE_SCALE = 32767  # int16 leaf code of probability 1.0
+LATENCY_REPEATS = 3  # measure_latency keeps the fastest of this many passes
+
+
+def flatten_forest(model, feature_names):
+    """Flat node arrays (see module docstring) of a fitted RandomForestClassifier."""
+    pothole_index = list(model.classes_).index(POTHOLE_CLASS)
+
+    def leaf_probability(tree):
+        counts = tree.value[:, 0, :]
+        return counts[:, pothole_index] / counts.sum(axis=1)
+
+    return flatten_trees([estimator.tree_ for estimator in model.estimators_],
+                         feature_names, leaf_probability)
+
+
+def flatten_regression_tree(model, feature_names):
+    """
+    Flat node arrays of a fitted DecisionTreeRegressor predicting the
+    pothole probability, as a forest of one tree.
+    """
+    return flatten_trees([model.tree_], feature_names,
+                         lambda tree: np.clip(tree.value[:, 0, 0], 0.0, 1.0))
+
+
+def flatten_trees(trees, feature_names, leaf_probability):
+    """
+    Flat node arrays of scikit-learn Tree objects; leaf_probability(tree)
+    gives the pothole probability of every node of a tree.
+    """
+    parts = {name: [] for name in NODE_ARRAYS}
+    roots = []
+    max_depth = 0
+    offset = 0
+
+    for tree in trees:
+        is_leaf = tree.children_left == -1
+        probability = leaf_probability(tree)
+
+        parts['feature'].append(np.where(is_leaf, LEAF, tree.feature))
+        parts['threshold'].append(np.where(is_leaf, 0.0, tree.threshold))
+        parts['left'].append(np.where(is_leaf, LEAF, tree.children_left + offset))
+        parts['right'].append(np.where(is_leaf, LEAF, tree.children_right + offset))
+        parts['value'].append(np.where(is_leaf, probability, 0.0))
+        parts['weight'].append(tree.weighted_n_node_samples)
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    return {
+        'feature': np.concatenate(parts['feature']).astype(np.int32),
+        'threshold': np.concatenate(parts['threshold']).astype(np.float64),
+        'left': np.concatenate(parts['left']).astype(np.int32),
+        'right': np.concatenate(parts['right']).astype(np.int32),
+        'value': np.concatenate(parts['value']).astype(np.float64),
+        'weight': np.concatenate(parts['weight']).astype(np.float64),
+        'roots': np.array(roots, dtype=np.int32),
+        'max_depth': max_depth,
+        'feature_names': list(feature_names),
+    }
+
+
+def predict_proba_flat(flat, X):
+    """
+    Pothole probability of every row of X from the flat arrays.
+
+    Trees are evaluated one after the other for a whole block of rows: each
+    step moves every row still on a split node one level down, and rows
+    drop out once they reach a leaf. X is compared as float32, the
+    precision scikit-learn trees split on.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    probability = np.empty(len(X))
+    for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+        block = X[start:start + PREDICT_CHUNK_ROWS]
+        total = np.zeros(len(block))
+        for root in flat['roots']:
+            total += flat['value'][_leaves(flat, block, root)]
+        probability[start:start + len(block)] = total / len(flat['roots'])
+    return probability
+
+
+def tree_probabilities(flat, X):
+    """Pothole probability of every tree for every row of X, shape (rows, trees)."""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    return np.stack([flat['value'][_leaves(flat, X, root)] for root in flat['roots']], axis=1) \
+        if len(flat['roots']) else np.empty((len(X), 0))
+
+
+def _leaves(flat, X, root):
+    """Leaf node reached by every row of a float32 block in the tree at root."""
+    feature, threshold = flat['feature'], flat['threshold']
+    left, right = flat['left'], flat['right']
+    n_features = X.shape[1] if X.ndim == 2 else 0
+    values = X.ravel()
+    node = np.full(len(X), root, dtype=np.int64)
+    active = np.arange(len(X))
+    while active.size:
+        at = node[active]
+        split = feature[at] != LEAF
+        active, at = active[split], at[split]
+        go_left = values[active * n_features + feature[at]] <= threshold[at]
+        node[active] = np.where(go_left, left[at], right[at])
+    return node
+
+
+def scalar_evaluator(flat):
+    """
+    predict(features) for a single window, walking the trees like the
+    generated Dart predictProbability does.
+    """
+    feature = flat['feature'].tolist()
+    threshold = flat['threshold'].tolist()
+    left = flat['left'].tolist()
+    right = flat['right'].tolist()
+    value = flat['value'].tolist()
+    roots = flat['roots'].tolist()
+    n_trees = len(roots)
+
+    def predict(features):
+        total = 0.0
+        for node in roots:
+            while feature[node] >= 0:
+                node = left[node] if features[feature[node]] <= threshold[node] else right[node]
+            total += value[node]
+        return total / n_trees
+
+    return predict
+
+
+def measure_latency(flat, X):
+    """
+    Per-window cost of the exported evaluator over the rows of X.
+
+    Returns the mean latency in microseconds of scalar_evaluator (best of
+    LATENCY_REPEATS passes) and the mean number of nodes visited per
+    window, which does not depend on the machine.
+    """
+    predict = scalar_evaluator(flat)
+    windows = np.asarray(X, dtype=np.float64).tolist()
+    if not windows:
+        return {'latency_us': 0.0, 'nodes_visited': 0.0}
+
+    best = float('inf')
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        for features in windows:
+            predict(features)
+        best = min(best, time.perf_counter() - start)
+
+    feature, threshold = flat['feature'], flat['threshold']
+    left, right = flat['left'], flat['right']
+    visited = 0
+    for features in windows:
+        for node in flat['roots']:
+            visited += 1
+            while feature[node] >= 0:
+                node = left[node] if features[feature[node]] <= threshold[node] else right[node]
+                visited += 1
+
+    return {
+        'latency_us': best / len(windows) * 1e6,
+        'nodes_visited': visited / len(windows),
+    }
+
+
+def parity_report(model, flat, X):
+    """
+    Compare predict_proba_flat with model.predict_proba on X.
+
+    Returns a dict with the maximum absolute probability difference, the
+    number of rows whose predicted class differs and whether the difference
+    is within PARITY_TOLERANCE.
+    """
+    pothole_index = list(model.classes_).index(POTHOLE_CLASS)
+    expected = model.predict_proba(X)[:, pothole_index]
+    actual = predict_proba_flat(flat, X)
+    max_abs_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    return {
+        'rows': int(len(X)),
+        'max_abs_diff': max_abs_diff,
+        'class_mismatches': int(np.sum((expected > 0.5) != (actual > 0.5))),
+        'passed': max_abs_diff <= PARITY_TOLERANCE,
+    }
+
+
+def forest_stats(flat):
+    """Tree and node counts of a flat forest."""
+    return {
+        'trees': int(len(flat['roots'])),
+        'nodes': int(len(flat['feature'])),
+        'leaves': int(np.sum(flat['feature'] == LEAF)),
+        'max_depth': int(flat['max_depth']),
+    }
+
+
+def save_flat_forest(flat, path):
+    """Write a flat forest, including any quantization arrays, to an .npz file."""
+    arrays = {name: value for name, value in flat.items() if isinstance(value, np.ndarray)}
+    np.savez(path, **arrays,
+             max_depth=np.int32(flat['max_depth']),
+             feature_names=np.array(flat['feature_names']),
+             quantization=np.array(flat.get('quantization') or ''))
+
+
+def load_flat_forest(path):
+    """Read a flat forest written by save_flat_forest."""
+    with np.load(path) as data:
+        flat = {name: data[name] for name in data.files
+                if name not in ('max_depth', 'feature_names', 'quantization')}
+        flat['max_depth'] = int(data['max_depth'])
+        flat['feature_names'] = data['feature_names'].tolist()
+        if 'quantization' in data.files and str(data['quantization']):
+            flat['quantization'] = str(data['quantization'])
+    return flat
+
+
+def _dart_list(values, indent='    '):
+    lines = []
+    for start in range(0, len(values), DART_VALUES_PER_LINE):
+        lines.append(indent + ', '.join(values[start:start + DART_VALUES_PER_LINE]) + ',')
+    return '\n'.join(lines)
+
+
+def _dart_doubles(values):
+    return _dart_list([repr(float(v)) for v in values])
+
+
+def _dart_ints(values):
+    return _dart_list([str(int(v)) for v in values])
+
+
+def dart_source(flat, feature_names, model_name='RandomForestClassifier'):
+    """Dart source of PotholeDetectionModel evaluating the flat forest."""
+    n_features = len(feature_names)
+    names = ''.join(f"    '{name}',\n" for name in feature_names)
+    stats = forest_stats(flat)
+    quantization = flat.get('quantization')
+
+    if quantization == 'int16':
+        description = f'''/// The trees are stored as flat node arrays: a node tests
+/// features[f] <= _thresholdOffset[f] + _thresholdCode[node] * _thresholdScale[f]
+/// with f = _feature[node] and continues at _left[node] or _right[node];
+/// leaves (_feature == -1) hold the pothole probability times
+/// {VALUE_CODE_SCALE} in _valueCode. The forest averages the leaves over the trees.'''
+        step = '''final f = _feature[node];
+        node = features[f] <= _thresholdOffset[f] + _thresholdCode[node] * _thresholdScale[f]
+            ? _left[node]
+            : _right[node];'''
+        leaf = 'sum += _valueCode[node];'
+        probability = f'sum / (_roots.length * {VALUE_CODE_SCALE})'
+        value_arrays = f'''  static const List<int> _thresholdCode = [
+{_dart_ints(flat['threshold_code'])}
+  ];
+
+  static const List<double> _thresholdOffset = [
+{_dart_doubles(flat['threshold_offset'])}
+  ];
+
+  static const List<double> _thresholdScale = [
+{_dart_doubles(flat['threshold_scale'])}
+  ];
+
+  static const List<int> _valueCode = [
+{_dart_ints(flat['value_code'])}
+  ];'''
+    else:
+        description = '''/// The trees are stored as flat node arrays: a node tests
+/// features[_feature[node]] <= _threshold[node] and continues at
+/// _left[node] or _right[node]; leaves (_feature == -1) hold the pothole
+/// probability in _value. The forest averages the leaves over the trees.'''
+        step = '''node = features[_feature[node]] <= _threshold[node]
+            ? _left[node]
+            : _right[node];'''
+        leaf = 'sum += _value[node];'
+        probability = 'sum / _roots.length'
+        value_arrays = f'''  static const List<double> _threshold = [
+{_dart_doubles(flat['threshold'])}
+  ];
+
+  static const List<double> _value = [
+{_dart_doubles(flat['value'])}
+  ];'''
+
+    model_line = f"{model_name} ({stats['trees']} trees, {stats['nodes']} nodes"
+    model_line += f", {quantization} quantized)" if quantization else ")"
+    return f'''// AUTO-GENERATED FILE - DO NOT EDIT MANUALLY
+// Generated from SimRa Berlin pothole detection training data
+// Model: {model_line}
+
+/// Pothole detection model using Random Forest
+/// Features: {list(feature_names)}
+///
+{description}
+class PotholeDetectionModel {{
+  /// Predict if the sensor window indicates a pothole
+  /// Returns probability of pothole (0.0 to 1.0)
+  static double predictProbability(List<double> features) {{
+    // features order: {list(feature_names)}
+    assert(
+      features.length == {n_features},
+      'Expected {n_features} features, got ${{features.length}}',
+    );
+
+    double sum = 0.0;
+    for (int tree = 0; tree < _roots.length; tree++) {{
+      int node = _roots[tree];
+      while (_feature[node] >= 0) {{
+        {step}
+      }}
+      {leaf}
+    }}
+    return ({probability}).clamp(0.0, 1.0);
+  }}
+
+  /// Returns true if pothole is detected (probability > 0.5)
+  static bool isPothole(List<double> features) {{
+    return predictProbability(features) > 0.5;
+  }}
+
+  /// Feature names in order
+  static const List<String> featureNames = [
+{names}  ];
+
+  static const List<int> _roots = [
+{_dart_ints(flat['roots'])}
+  ];
+
+  static const List<int> _feature = [
+{_dart_ints(flat['feature'])}
+  ];
+
+  static const List<int> _left = [
+{_dart_ints(flat['left'])}
+  ];
+
+  static const List<int> _right = [
+{_dart_ints(flat['right'])}
+  ];
+
+{value_arrays}
+}}
+'''
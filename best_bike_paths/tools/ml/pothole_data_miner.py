@@ -13,11 +13,33 @@ This script extracts 2-second windows (based on timestamps) and labels them.
 import os
 import sys
 import csv
+import time
 import random
+import pstats
+import cProfile
+import argparse
+import bisect
+import contextlib
+import hashlib
+import itertools
+import math
+import shutil
+import platform
+import warnings
+import subprocess
 from pathlib import Path
-from collections import defaultdict
+from datetime import datetime, timezone
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 import json
 
+# NumPy is only needed for the columnar parser mode
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # Configuration
 DATASET_PATH = "/Users/rahul/Desktop/Dataset/Berlin_04_2024_02_2025/Berlin/Rides"
 OUTPUT_PATH = "/Users/rahul/Desktop/NayakXXX/best_bike_paths/tools/ml/dataset"
@@ -30,45 +52,117 @@ POTHOLE_HIGH_THRESHOLD = 14.0  # Strong upward acceleration (hitting pothole)
 POTHOLE_LOW_THRESHOLD = 5.5    # Strong downward (falling into pothole)
 NORMAL_MIN = 7.5   # More lenient for normal classification
 NORMAL_MAX = 12.5  # More lenient for normal classification
+NORMAL_MAX_STD = 2.5  # Normal windows must also be stable
+
+# Incident join: windows are tagged with the nearest reported incident in time
+INCIDENT_MAX_GAP_MS = 3000      # Max time between the incident and the window span
+INCIDENT_MAX_DISTANCE_M = 30.0  # Max distance between the incident and the window's first fix
+INCIDENT_NONE = 0               # incident_type of windows without an incident
+EARTH_RADIUS_M = 6371000.0
+
+# Window labels in the columnar window table
+LABEL_AMBIGUOUS = -1
+LABEL_NORMAL = 0
+LABEL_POTHOLE = 1
+LABEL_NAMES = {LABEL_NORMAL: 'normal', LABEL_POTHOLE: 'pothole'}
+
+# Per-window feature columns, in CSV order
+FEATURE_NAMES = ['z_mean', 'z_std', 'z_min', 'z_max', 'z_range',
+                 'x_mean', 'x_std', 'x_range',
+                 'y_mean', 'y_std', 'y_range', 'sample_count']
 
 # Targets
 TARGET_POTHOLE_SAMPLES = 500
 TARGET_NORMAL_SAMPLES = 500
 
+# Parallel mining: rides queued per worker process before results are consumed
+RIDES_IN_FLIGHT_PER_WORKER = 4
+
+# Full-corpus (reservoir) sampling: fixed histogram bins per feature
+HISTOGRAM_BINS = 64
+HISTOGRAM_RANGES = {
+    'mean': (-40.0, 40.0),
+    'min': (-40.0, 40.0),
+    'max': (-40.0, 40.0),
+    'std': (0.0, 40.0),
+    'range': (0.0, 80.0),
+    'sample_count': (0.0, 1280.0),
+}
+
+# Ride cache: bump CACHE_VERSION whenever mine_ride's output changes shape
+CACHE_VERSION = 2
+CACHE_FLUSH_RIDES = 100  # Rides mined between manifest writes
+
+# SimRa file layout
+SECTION_SEPARATOR = '========================='
+RIDE_COLUMNS = ['lat', 'lon', 'x', 'y', 'z', 'ts', 'xl', 'yl', 'zl']
+RIDE_COLUMN_INDICES = [0, 1, 2, 3, 4, 5, 15, 16, 17]
+PARSE_BLOCK_BYTES = 1 << 20  # Ride text read and parsed per chunk in the columnar parser
+EMPTY_FIELD_TEXT = b'nan,'  # Parsed in place of an empty sensor field
+
+# Instrumentation (see MiningMetrics)
+PIPELINE_STAGES = ['read', 'parse', 'window', 'classify', 'featurize', 'cache', 'write']
+FAILURE_EXAMPLES = 20  # Parse failures listed by path in the metrics report
+PROFILE_TOP_FUNCTIONS = 25
+
+# Columnar binary dataset (see save_dataset)
+DATASET_FORMAT_VERSION = 1
+POSITION_COLUMNS = ['lat', 'lon', 'timestamp']
+INCIDENT_COLUMNS = ['incident_type', 'incident_distance_m']
+
+
+def parse_incidents(incident_section):
+    """Parse the incident section (before the separator) of a ride file."""
+    incidents = []
+    incident_lines = incident_section.strip().split('\n')
+    for line in incident_lines[2:]:  # Skip version and header
+        if line.strip() and not line.startswith('key'):
+            parts_line = line.split(',')
+            if len(parts_line) > 8:
+                try:
+                    incident_type = int(parts_line[8]) if parts_line[8] else 0
+                    lat = float(parts_line[1]) if parts_line[1] else None
+                    lon = float(parts_line[2]) if parts_line[2] else None
+                    ts = int(parts_line[3]) if parts_line[3] else None
+                    if incident_type > 0:  # Real incident (not dummy)
+                        incidents.append({
+                            'type': incident_type,
+                            'lat': lat,
+                            'lon': lon,
+                            'ts': ts
+                        })
+                except (ValueError, IndexError):
+                    pass
+    return incidents
+
+
+def parse_ride_file(filepath, columnar=False, metrics=None):
+    """
+    Parse a SimRa ride file and extract sensor data.
+
+    By default the sensor data is a list with one dict per reading. With
+    columnar=True it is a dict of NumPy arrays instead (see parse_ride_columns).
+    Unreadable files give (None, None) and count as a parse failure in
+    metrics (a MiningMetrics, optional).
+    """
+    if columnar:
+        return parse_ride_columns(filepath, metrics)
 
-def parse_ride_file(filepath):
-    """Parse a SimRa ride file and extract sensor data."""
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        with timed(metrics, 'read'):
+            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read()
+        if metrics is not None:
+            metrics.count('bytes_read', len(content))
+            parse_start = time.perf_counter()
         
         # Split by the separator
-        parts = content.split('=========================')
+        parts = content.split(SECTION_SEPARATOR)
         if len(parts) < 2:
             return None, None
         
         # Parse incidents (before separator)
-        incident_section = parts[0].strip()
-        incidents = []
-        incident_lines = incident_section.split('\n')
-        for line in incident_lines[2:]:  # Skip version and header
-            if line.strip() and not line.startswith('key'):
-                parts_line = line.split(',')
-                if len(parts_line) > 8:
-                    try:
-                        incident_type = int(parts_line[8]) if parts_line[8] else 0
-                        lat = float(parts_line[1]) if parts_line[1] else None
-                        lon = float(parts_line[2]) if parts_line[2] else None
-                        ts = int(parts_line[3]) if parts_line[3] else None
-                        if incident_type > 0:  # Real incident (not dummy)
-                            incidents.append({
-                                'type': incident_type,
-                                'lat': lat,
-                                'lon': lon,
-                                'ts': ts
-                            })
-                    except (ValueError, IndexError):
-                        pass
+        incidents = parse_incidents(parts[0])
         
         # Parse ride data (after separator)
         ride_section = parts[1].strip()
@@ -108,14 +202,251 @@ def parse_ride_file(filepath):
                     except (ValueError, IndexError):
                         pass
         
+        if metrics is not None:
+            metrics.add_time('parse', time.perf_counter() - parse_start)
+            metrics.count('rows_parsed', len(sensor_data))
         return incidents, sensor_data
     
     except Exception as e:
+        if metrics is not None:
+            metrics.failure(filepath, e)
         return None, None
 
 
+def parse_ride_columns(filepath, metrics=None):
+    """
+    Parse a SimRa ride file into a columnar record.
+
+    Returns (incidents, columns) where columns maps every name in RIDE_COLUMNS
+    to a contiguous array: int64 for 'ts', float64 with NaN for missing values
+    for everything else. Rows without Z or timestamp are dropped, exactly like
+    the list-of-dicts parser.
+    """
+    try:
+        incidents, chunks = stream_ride_file(filepath, metrics=metrics)
+        if chunks is None:
+            return None, None
+        return incidents, concat_columns(list(chunks))
+    
+    except Exception as e:
+        if metrics is not None:
+            metrics.failure(filepath, e)
+        return None, None
+
+
+def stream_ride_file(filepath, chunk_bytes=PARSE_BLOCK_BYTES, metrics=None):
+    """
+    Open a SimRa ride file for streaming.
+
+    Reads the incident section and the ride header, then returns
+    (incidents, chunks): chunks is a generator of columnar records (as in
+    parse_ride_columns), each covering about chunk_bytes of ride text, so
+    memory does not depend on the ride length. Returns (None, None) when the
+    file has no incident/ride separator. Reading and parsing time, bytes
+    and rows go to metrics (a MiningMetrics, optional).
+    """
+    header_start = time.perf_counter()
+    f = open(filepath, 'rb')
+    try:
+        separator = SECTION_SEPARATOR.encode()
+        incident_lines = []
+        for line in f:
+            if separator in line:
+                incident_lines.append(line[:line.index(separator)])
+                break
+            incident_lines.append(line)
+        else:
+            f.close()
+            return None, None
+        incidents = parse_incidents(b''.join(incident_lines).decode('utf-8', errors='ignore'))
+        
+        # Version and header line; the header width enables the fast path
+        header_lines = []
+        for line in f:
+            if line.strip():
+                header_lines.append(line)
+                if len(header_lines) == 2:
+                    break
+        if metrics is not None:
+            metrics.add_time('read', time.perf_counter() - header_start)
+            metrics.count('bytes_read', f.tell())
+        if len(header_lines) < 2:
+            f.close()
+            return incidents, iter(())
+        n_cols = header_lines[1].count(b',') + 1
+    except Exception:
+        f.close()
+        raise
+    
+    return incidents, _iter_sensor_chunks(f, n_cols, chunk_bytes, metrics)
+
+
+def _iter_sensor_chunks(f, n_cols, chunk_bytes, metrics=None):
+    """Columnar records of the remaining sensor rows of an open ride file."""
+    def parse(block):
+        with timed(metrics, 'parse'):
+            columns = matrix_columns(parse_sensor_block(block, n_cols))
+        if metrics is not None:
+            n_rows = len(columns['ts'])
+            metrics.count('rows_parsed', n_rows)
+            metrics.count('rows_dropped', block.count(b'\n') + 1 - n_rows)
+        return columns
+    
+    with f:
+        tail = b''
+        while True:
+            with timed(metrics, 'read'):
+                data = f.read(chunk_bytes)
+            if not data:
+                break
+            if metrics is not None:
+                metrics.count('bytes_read', len(data))
+            data = tail + data
+            cut = data.rfind(b'\n')
+            if cut < 0:
+                tail = data
+                continue
+            tail = data[cut + 1:]
+            block = data[:cut].replace(b'\r', b'').strip()
+            if block:
+                yield parse(block)
+        
+        tail = tail.replace(b'\r', b'').strip()
+        if tail:
+            yield parse(tail)
+
+
+def empty_ride_columns():
+    """Columnar record with no rows."""
+    columns = {name: np.empty(0, dtype=np.float64) for name in RIDE_COLUMNS}
+    columns['ts'] = np.empty(0, dtype=np.int64)
+    return columns
+
+
+def matrix_columns(matrix):
+    """Columnar record from a parse_sensor_block matrix."""
+    columns = {name: np.ascontiguousarray(matrix[:, i]) for i, name in enumerate(RIDE_COLUMNS)}
+    columns['ts'] = columns['ts'].astype(np.int64)
+    return columns
+
+
+def concat_columns(chunks):
+    """Join consecutive columnar records into one."""
+    if not chunks:
+        return empty_ride_columns()
+    if len(chunks) == 1:
+        return chunks[0]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in RIDE_COLUMNS}
+
+
+def parse_sensor_block(block, n_cols):
+    """
+    Parse complete sensor rows into an (n, len(RIDE_COLUMNS)) float64 matrix.
+
+    When every row has the header's column count the block is parsed in one
+    NumPy pass (see _parse_sensor_fields); blocks with any irregular or
+    non-numeric row fall back to a line-by-line parse. Rows without Z or
+    timestamp are dropped.
+    """
+    matrix = None
+    if n_cols >= 6:
+        try:
+            with warnings.catch_warnings():
+                # Older NumPy only warns when it stops at a non-numeric token
+                warnings.simplefilter('error', DeprecationWarning)
+                matrix = _parse_sensor_fields(block, n_cols)
+        except (ValueError, DeprecationWarning):
+            matrix = None
+    
+    if matrix is None:
+        matrix = _parse_sensor_lines(block)
+    
+    z = matrix[:, RIDE_COLUMNS.index('z')]
+    ts = matrix[:, RIDE_COLUMNS.index('ts')]
+    return matrix[~np.isnan(z) & ~np.isnan(ts)]
+
+
+def _parse_sensor_fields(block, n_cols):
+    """
+    RIDE_COLUMNS of a block whose rows all have n_cols fields, or None if
+    any row has more or fewer fields.
+
+    Only the fields of RIDE_COLUMN_INDICES are converted: their bytes are
+    gathered into one comma-separated text, with 'nan' for empty fields,
+    and parsed by a single np.fromstring call. Most SimRa columns are never
+    read, so this skips most of the block's text.
+    """
+    # The block, a row terminator for its last field, and the text copied for empty fields
+    buf = np.frombuffer(block + b'\n' + EMPTY_FIELD_TEXT, dtype=np.uint8)
+    n_text = len(block) + 1
+    text = buf[:n_text]
+    is_newline = text == ord('\n')
+    ends = np.flatnonzero((text == ord(',')) | is_newline)
+    n_rows = int(np.count_nonzero(is_newline))
+    if len(ends) != n_rows * n_cols:
+        return None
+    ends = ends.reshape(n_rows, n_cols)
+    # Every row has n_cols - 1 commas only if each row's last terminator is its newline
+    if not is_newline[ends[:, -1]].all():
+        return None
+    
+    present = [i for i, index in enumerate(RIDE_COLUMN_INDICES) if index < n_cols]
+    indices = np.array([RIDE_COLUMN_INDICES[i] for i in present])
+    field_ends = ends[:, indices]
+    # A field starts after the previous field's terminator, the first of a row after the last row's
+    previous = np.where(indices > 0, indices - 1, n_cols - 1)
+    field_starts = ends[:, previous] + 1
+    field_starts[:, indices == 0] = np.r_[0, ends[:-1, -1] + 1][:, None]
+    starts, stops = field_starts.ravel(), field_ends.ravel()
+    
+    empty = starts == stops
+    starts = np.where(empty, n_text, starts)
+    lengths = np.where(empty, len(EMPTY_FIELD_TEXT) - 1, stops - starts) + 1  # With terminator
+    offsets = np.cumsum(lengths) - lengths
+    fields = buf[np.arange(int(lengths.sum())) + np.repeat(starts - offsets, lengths)]
+    fields[offsets + lengths - 1] = ord(',')
+    values = np.fromstring(fields.tobytes(), sep=',')
+    if values.size != n_rows * len(present):
+        return None
+    
+    matrix = np.full((n_rows, len(RIDE_COLUMNS)), np.nan)
+    matrix[:, present] = values.reshape(n_rows, len(present))
+    return matrix
+
+
+def _parse_sensor_lines(block):
+    """Line-by-line fallback for parse_sensor_block."""
+    rows = []
+    for line in block.split(b'\n'):
+        cols = line.split(b',')
+        if len(cols) < 6:
+            continue
+        try:
+            rows.append([
+                float(cols[index]) if index < len(cols) and cols[index] else np.nan
+                for index in RIDE_COLUMN_INDICES
+            ])
+        except ValueError:
+            pass
+    
+    if not rows:
+        return np.empty((0, len(RIDE_COLUMNS)))
+    return np.array(rows, dtype=np.float64)
+
+
 def extract_windows(sensor_data):
-    """Extract 2-second windows from sensor data."""
+    """
+    Extract 2-second windows from sensor data.
+
+    Columnar sensor data (a dict of arrays) gives columnar windows, i.e.
+    dicts of array views into the ride.
+    """
+    if isinstance(sensor_data, dict):
+        return [
+            {name: values[start:end] for name, values in sensor_data.items()}
+            for start, end in zip(*window_bounds(sensor_data['ts']))
+        ]
+    
     if not sensor_data or len(sensor_data) < MIN_SAMPLES_PER_WINDOW:
         return []
     
@@ -141,26 +472,260 @@ def extract_windows(sensor_data):
     return windows
 
 
+def window_bounds(ts):
+    """
+    Row ranges of the windows extract_windows builds over ts.
+
+    Returns (starts, ends) int64 arrays; window k covers rows starts[k]:ends[k].
+    With sorted timestamps every window end comes from one searchsorted pass,
+    so the cost is O(n log n) in NumPy plus one Python step per window start.
+    """
+    starts, ends, _ = closed_window_bounds(ts, final=True)
+    return starts, ends
+
+
+def closed_window_bounds(ts, final=False):
+    """
+    window_bounds of a ride that is still arriving.
+
+    With final=False ts is the head of a longer ride: a window is only
+    emitted once a later row closes it. Returns (starts, ends, next_start),
+    where next_start is the row where windowing resumes when more rows
+    arrive; with final=True the ride is complete and this is window_bounds.
+    """
+    n = len(ts)
+    if final and n < MIN_SAMPLES_PER_WINDOW:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), n
+    
+    if np.all(ts[1:] >= ts[:-1]):
+        window_ends = np.searchsorted(ts, ts + WINDOW_SIZE_MS, side='left').tolist()
+    else:
+        window_ends = None
+        ts_list = ts.tolist()
+    
+    starts = []
+    ends = []
+    i = 0
+    while i < n:
+        if window_ends is not None:
+            j = window_ends[i]
+        else:
+            # Out-of-order timestamps: scan like the list-of-dicts path
+            j = i
+            while j < n and (ts_list[j] - ts_list[i]) < WINDOW_SIZE_MS:
+                j += 1
+        
+        if j == n and not final:
+            break
+        
+        if j - i >= MIN_SAMPLES_PER_WINDOW:
+            starts.append(i)
+            ends.append(j)
+        
+        # Move to next window (50% overlap)
+        i += max(1, (j - i) // 2)
+    
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), min(i, n)
+
+
+def window_table(columns, bounds=None, metrics=None):
+    """
+    Window a columnar ride and compute every window's features and label.
+
+    Returns a dict of arrays with one entry per window: 'start'/'end' row
+    bounds, the FEATURE_NAMES statistics, 'lat'/'lon' (NaN without a fix),
+    'timestamp' and 'label' (LABEL_POTHOLE, LABEL_NORMAL or LABEL_AMBIGUOUS).
+    Means and standard deviations come from prefix sums and min/max from a
+    single reduceat pass over the window ranges, so a ride costs O(n).
+    bounds overrides the window_bounds(columns['ts']) row ranges.
+    """
+    if bounds is None:
+        with timed(metrics, 'window'):
+            bounds = window_bounds(columns['ts'])
+    starts, ends = bounds
+    table = {'start': starts, 'end': ends}
+    
+    featurize_start = time.perf_counter()
+    for axis in ('z', 'x', 'y'):
+        count, mean, std, min_v, max_v = _window_stats(columns[axis], starts, ends)
+        table[axis + '_mean'] = mean
+        table[axis + '_std'] = std
+        if axis == 'z':
+            table['z_min'] = min_v
+            table['z_max'] = max_v
+            sample_count = count
+        table[axis + '_range'] = max_v - min_v
+    table['sample_count'] = sample_count
+    
+    # Location from first sample with GPS (NaN and 0.0 both mean "no fix")
+    lats, lons = columns['lat'], columns['lon']
+    n = len(lats)
+    has_fix = (lats == lats) & (lons == lons) & (lats != 0) & (lons != 0)
+    next_fix = np.where(has_fix, np.arange(n), n)
+    next_fix = np.minimum.accumulate(next_fix[::-1])[::-1]
+    first_fix = next_fix[starts]
+    found = first_fix < ends
+    fix_index = np.where(found, first_fix, 0)
+    table['lat'] = np.where(found, lats[fix_index], np.nan)
+    table['lon'] = np.where(found, lons[fix_index], np.nan)
+    table['timestamp'] = columns['ts'][starts]
+    
+    classify_start = time.perf_counter()
+    z_min, z_max = table['z_min'], table['z_max']
+    pothole = (z_max > POTHOLE_HIGH_THRESHOLD) | (z_min < POTHOLE_LOW_THRESHOLD)
+    normal = ((NORMAL_MIN <= z_min) & (z_max <= NORMAL_MAX)
+              & (table['z_std'] < NORMAL_MAX_STD))
+    label = np.full(len(starts), LABEL_AMBIGUOUS, dtype=np.int8)
+    label[normal] = LABEL_NORMAL
+    label[pothole] = LABEL_POTHOLE
+    # A window without Z readings cannot be labelled (classify_window -> None)
+    label[sample_count == 0] = LABEL_AMBIGUOUS
+    table['label'] = label
+    
+    if metrics is not None:
+        metrics.add_time('featurize', classify_start - featurize_start)
+        metrics.add_time('classify', time.perf_counter() - classify_start)
+    return table
+
+
+def stream_window_tables(chunks, metrics=None):
+    """
+    Window a stream of columnar records (see stream_ride_file) incrementally.
+
+    Yields one window table per chunk with the windows that chunk completes;
+    'start'/'end' count rows from the start of the ride. Only the rows of
+    windows still open are carried over to the next chunk, so memory is
+    bounded by the chunk size plus one window whatever the ride length.
+    """
+    buffer = None
+    offset = 0  # Ride row index of buffer[0]
+    for chunk in chunks:
+        if buffer is None:
+            buffer = chunk
+        else:
+            buffer = {name: np.concatenate((buffer[name], chunk[name])) for name in RIDE_COLUMNS}
+        
+        with timed(metrics, 'window'):
+            starts, ends, next_start = closed_window_bounds(buffer['ts'])
+        yield _offset_table(window_table(buffer, (starts, ends), metrics), offset)
+        
+        buffer = {name: values[next_start:] for name, values in buffer.items()}
+        offset += next_start
+    
+    if buffer is not None and len(buffer['ts']):
+        yield _offset_table(window_table(buffer, metrics=metrics), offset)
+
+
+def _offset_table(table, offset):
+    table['start'] = table['start'] + offset
+    table['end'] = table['end'] + offset
+    return table
+
+
+def concat_tables(tables):
+    """Join window tables of consecutive parts of a ride."""
+    if len(tables) == 1:
+        return tables[0]
+    if not tables:
+        return tag_incidents(window_table(empty_ride_columns()), incident_arrays([]))
+    return {name: np.concatenate([table[name] for table in tables]) for name in tables[0]}
+
+
+def _window_stats(values, starts, ends):
+    """
+    Per-window count, mean, std, min and max of values, ignoring NaN.
+
+    Windows without any valid value get zeros, like compute_features.
+    """
+    n_windows = len(starts)
+    if not n_windows:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty, empty, empty
+    
+    valid = ~np.isnan(values)
+    # Centre on the ride mean so the prefix sums do not lose precision
+    shift = values[valid].mean() if valid.any() else 0.0
+    centred = np.where(valid, values - shift, 0.0)
+    
+    count_prefix = np.concatenate(([0], np.cumsum(valid)))
+    sum_prefix = np.concatenate(([0.0], np.cumsum(centred)))
+    square_prefix = np.concatenate(([0.0], np.cumsum(centred * centred)))
+    
+    count = count_prefix[ends] - count_prefix[starts]
+    safe_count = np.maximum(count, 1)
+    centred_mean = (sum_prefix[ends] - sum_prefix[starts]) / safe_count
+    variance = (square_prefix[ends] - square_prefix[starts]) / safe_count - centred_mean ** 2
+    std = np.sqrt(np.maximum(variance, 0.0))
+    mean = centred_mean + shift
+    
+    # Windows overlap, so reduce over interleaved (start, end) pairs and keep
+    # the even results; the padding keeps an end index of n in bounds.
+    bounds = np.column_stack((starts, ends)).ravel()
+    padded = np.append(values, np.nan)
+    min_v = np.fmin.reduceat(padded, bounds)[::2]
+    max_v = np.fmax.reduceat(padded, bounds)[::2]
+    
+    empty = count == 0
+    for stat in (mean, std, min_v, max_v):
+        stat[empty] = 0.0
+    return count, mean, std, min_v, max_v
+
+
+def window_samples(table):
+    """
+    Yield the labelled windows of a window table as feature dicts.
+
+    The dicts have the same keys as labelled_windows yields, in the order
+    of the windows in the ride; ambiguous windows are skipped.
+    """
+    selected = np.flatnonzero(table['label'] != LABEL_AMBIGUOUS)
+    if not selected.size:
+        return
+    
+    names = FEATURE_NAMES + ['lat', 'lon', 'timestamp']
+    columns = [table[name][selected].tolist() for name in names]
+    labels = table['label'][selected].tolist()
+    incident_types = table['incident_type'][selected].tolist()
+    distances = table['incident_distance_m'][selected].tolist()
+    for k, label in enumerate(labels):
+        features = {name: column[k] for name, column in zip(names, columns)}
+        if features['lat'] != features['lat']:
+            features['lat'] = features['lon'] = None
+        features['label'] = LABEL_NAMES[label]
+        features['incident_type'] = incident_types[k]
+        distance = distances[k]
+        features['incident_distance_m'] = None if distance != distance else distance
+        yield features
+
+
 def classify_window(window):
     """
     Classify a window as pothole or normal based on Z-axis values.
     Returns: 'pothole', 'normal', or None (ambiguous)
     """
-    z_values = [s['z'] for s in window if s['z'] is not None]
-    
-    if not z_values:
-        return None
-    
-    max_z = max(z_values)
-    min_z = min(z_values)
-    std_z = (sum((z - sum(z_values)/len(z_values))**2 for z in z_values) / len(z_values)) ** 0.5
+    if isinstance(window, dict):
+        z_values = window['z'][~np.isnan(window['z'])]
+        if not z_values.size:
+            return None
+        max_z = float(z_values.max())
+        min_z = float(z_values.min())
+        std_z = float(z_values.std())
+    else:
+        z_values = [s['z'] for s in window if s['z'] is not None]
+        
+        if not z_values:
+            return None
+        
+        max_z = max(z_values)
+        min_z = min(z_values)
+        std_z = (sum((z - sum(z_values)/len(z_values))**2 for z in z_values) / len(z_values)) ** 0.5
     
     # Pothole detection: significant spike or drop
     if max_z > POTHOLE_HIGH_THRESHOLD or min_z < POTHOLE_LOW_THRESHOLD:
         return 'pothole'
     
     # Normal: stable readings around gravity
-    if NORMAL_MIN <= min_z and max_z <= NORMAL_MAX and std_z < 2.5:
+    if NORMAL_MIN <= min_z and max_z <= NORMAL_MAX and std_z < NORMAL_MAX_STD:
         return 'normal'
     
     return None  # Ambiguous
@@ -168,6 +733,9 @@ def classify_window(window):
 
 def compute_features(window):
     """Compute features for a window."""
+    if isinstance(window, dict):
+        return compute_column_features(window)
+    
     z_values = [s['z'] for s in window if s['z'] is not None]
     x_values = [s['x'] for s in window if s['x'] is not None]
     y_values = [s['y'] for s in window if s['y'] is not None]
@@ -218,6 +786,734 @@ def compute_features(window):
     }
 
 
+def compute_column_features(window):
+    """compute_features for a columnar window (dict of arrays)."""
+    z_values = window['z'][~np.isnan(window['z'])]
+    x_values = window['x'][~np.isnan(window['x'])]
+    y_values = window['y'][~np.isnan(window['y'])]
+    
+    if not z_values.size:
+        return None
+    
+    def stats(values):
+        if not values.size:
+            return {'mean': 0, 'std': 0, 'min': 0, 'max': 0, 'range': 0}
+        min_value = float(values.min())
+        max_value = float(values.max())
+        return {
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'min': min_value,
+            'max': max_value,
+            'range': max_value - min_value
+        }
+    
+    z_stats = stats(z_values)
+    x_stats = stats(x_values)
+    y_stats = stats(y_values)
+    
+    # Get location from first sample with GPS (NaN and 0.0 both mean "no fix")
+    lat, lon = None, None
+    lats, lons = window['lat'], window['lon']
+    has_fix = np.flatnonzero((lats == lats) & (lons == lons) & (lats != 0) & (lons != 0))
+    if has_fix.size:
+        lat, lon = float(lats[has_fix[0]]), float(lons[has_fix[0]])
+    
+    return {
+        'z_mean': z_stats['mean'],
+        'z_std': z_stats['std'],
+        'z_min': z_stats['min'],
+        'z_max': z_stats['max'],
+        'z_range': z_stats['range'],
+        'x_mean': x_stats['mean'],
+        'x_std': x_stats['std'],
+        'x_range': x_stats['range'],
+        'y_mean': y_stats['mean'],
+        'y_std': y_stats['std'],
+        'y_range': y_stats['range'],
+        'sample_count': int(z_values.size),
+        'lat': lat,
+        'lon': lon,
+        'timestamp': int(window['ts'][0]) if len(window['ts']) else None
+    }
+
+
+def incident_arrays(incidents):
+    """
+    Timed incidents of a ride as arrays sorted by timestamp.
+
+    Returns (ts, lat, lon, type); lat/lon are NaN where the incident has no
+    position. This is the lookup structure tag_incidents searches.
+    """
+    timed = sorted((incident for incident in incidents if incident['ts'] is not None),
+                   key=lambda incident: incident['ts'])
+    n = len(timed)
+    ts = np.fromiter((incident['ts'] for incident in timed), np.float64, n)
+    lat = np.fromiter((incident['lat'] for incident in timed), np.float64, n)
+    lon = np.fromiter((incident['lon'] for incident in timed), np.float64, n)
+    types = np.fromiter((incident['type'] for incident in timed), np.int8, n)
+    return ts, lat, lon, types
+
+
+def tag_incidents(table, incident_index):
+    """
+    Join a ride's incidents to its window table.
+
+    Adds 'incident_type' (INCIDENT_NONE without a match) and
+    'incident_distance_m' (NaN without a match or without positions).
+    Each window is matched to the incident nearest in time to its centre,
+    found by binary search in incident_arrays(), so a ride costs
+    O(windows log incidents). The match holds if the incident lies within
+    INCIDENT_MAX_GAP_MS of the window span and, when both have a position,
+    within INCIDENT_MAX_DISTANCE_M of the window's first fix.
+    """
+    inc_ts, inc_lat, inc_lon, inc_type = incident_index
+    n = len(table['timestamp'])
+    incident_type = np.full(n, INCIDENT_NONE, dtype=np.int8)
+    distance = np.full(n, np.nan)
+    
+    if n and len(inc_ts):
+        half_window = WINDOW_SIZE_MS / 2
+        centre = table['timestamp'] + half_window
+        after = np.searchsorted(inc_ts, centre)
+        before = np.maximum(after - 1, 0)
+        after = np.minimum(after, len(inc_ts) - 1)
+        nearest = np.where(np.abs(inc_ts[before] - centre) <= np.abs(inc_ts[after] - centre),
+                           before, after)
+        
+        gap = np.maximum(np.abs(inc_ts[nearest] - centre) - half_window, 0.0)
+        to_incident = haversine_m(table['lat'], table['lon'], inc_lat[nearest], inc_lon[nearest])
+        # NaN distance (no position on either side) does not reject the match
+        matched = (gap <= INCIDENT_MAX_GAP_MS) & ~(to_incident > INCIDENT_MAX_DISTANCE_M)
+        incident_type[matched] = inc_type[nearest[matched]]
+        distance[matched] = to_incident[matched]
+    
+    table['incident_type'] = incident_type
+    table['incident_distance_m'] = distance
+    return table
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between arrays of coordinates."""
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def nearest_incident(features, incidents, incident_ts):
+    """
+    tag_incidents for a single compute_features dict.
+
+    incidents must be sorted by timestamp with incident_ts their timestamps.
+    Returns (incident_type, distance_m); distance_m is None when unknown.
+    """
+    if not incidents or features['timestamp'] is None:
+        return INCIDENT_NONE, None
+    
+    half_window = WINDOW_SIZE_MS / 2
+    centre = features['timestamp'] + half_window
+    after = bisect.bisect_left(incident_ts, centre)
+    candidates = [k for k in (after - 1, after) if 0 <= k < len(incidents)]
+    nearest = min(candidates, key=lambda k: abs(incident_ts[k] - centre))
+    incident = incidents[nearest]
+    
+    if abs(incident['ts'] - centre) - half_window > INCIDENT_MAX_GAP_MS:
+        return INCIDENT_NONE, None
+    positions = (features['lat'], features['lon'], incident['lat'], incident['lon'])
+    if any(value is None for value in positions):
+        return incident['type'], None
+    distance = _haversine_m(*positions)
+    if distance > INCIDENT_MAX_DISTANCE_M:
+        return INCIDENT_NONE, None
+    return incident['type'], distance
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def labelled_windows(windows, incidents=(), metrics=None):
+    """
+    Yield compute_features dicts plus 'label' for the labelled windows,
+    tagged with the ride's incidents (see nearest_incident).
+    """
+    incidents = sorted((incident for incident in incidents if incident['ts'] is not None),
+                       key=lambda incident: incident['ts'])
+    incident_ts = [incident['ts'] for incident in incidents]
+    for window in windows:
+        with timed(metrics, 'classify'):
+            label = classify_window(window)
+        if label is None:
+            continue
+        with timed(metrics, 'featurize'):
+            features = compute_features(window)
+        if features is None:
+            continue
+        features['label'] = label
+        with timed(metrics, 'classify'):
+            incident_type, distance = nearest_incident(features, incidents, incident_ts)
+        features['incident_type'] = incident_type
+        features['incident_distance_m'] = distance
+        yield features
+
+
+def mine_ride(ride_path, columnar=True, metrics=None):
+    """
+    Parse, window and featurize a single ride.
+
+    Returns None for unreadable or empty rides, otherwise
+    (n_windows, samples) where samples only holds the labelled windows: the
+    window table restricted to them in columnar mode, a list of feature
+    dicts otherwise. This runs in the worker processes of the parallel mode,
+    so the result is kept small to pickle. Stage times and counts are added
+    to metrics (a MiningMetrics, optional).
+    """
+    if columnar:
+        result = _mine_ride_stream(ride_path, metrics)
+    else:
+        incidents, sensor_data = parse_ride_file(ride_path, metrics=metrics)
+        if not sensor_data:
+            result = None
+        else:
+            with timed(metrics, 'window'):
+                windows = extract_windows(sensor_data)
+            result = len(windows), list(labelled_windows(windows, incidents, metrics))
+    
+    if metrics is not None:
+        metrics.count('rides')
+        if result is None:
+            metrics.count('rides_empty_or_failed')
+        else:
+            metrics.count('windows', result[0])
+            metrics.count('labelled_windows', len(result[1]['label'] if columnar else result[1]))
+    return result
+
+
+def _mine_ride_measured(ride_path, columnar):
+    """mine_ride in a worker process: returns (result, MiningMetrics state)."""
+    metrics = MiningMetrics()
+    result = mine_ride(ride_path, columnar, metrics)
+    return result, metrics.state()
+
+
+def _mine_ride_stream(ride_path, metrics=None):
+    """mine_ride in columnar mode, streaming the ride chunk by chunk."""
+    n_rows = 0
+    n_windows = 0
+    labelled_parts = []
+    
+    def counted(chunks):
+        nonlocal n_rows
+        for chunk in chunks:
+            n_rows += len(chunk['ts'])
+            yield chunk
+    
+    try:
+        incidents, chunks = stream_ride_file(ride_path, metrics=metrics)
+        if chunks is None:
+            return None
+        incident_index = incident_arrays(incidents)
+        for table in stream_window_tables(counted(chunks), metrics):
+            with timed(metrics, 'classify'):
+                tag_incidents(table, incident_index)
+            n_windows += len(table['label'])
+            labelled = table['label'] != LABEL_AMBIGUOUS
+            labelled_parts.append({name: values[labelled] for name, values in table.items()})
+    except Exception as e:
+        if metrics is not None:
+            metrics.failure(ride_path, e)
+        return None
+    
+    if not n_rows:
+        return None
+    return n_windows, concat_tables(labelled_parts)
+
+
+def iter_samples(samples):
+    """Feature dicts (with 'label') of a mine_ride result, in ride order."""
+    if isinstance(samples, dict):
+        return window_samples(samples)
+    return iter(samples)
+
+
+def list_ride_files(dataset_path):
+    """(month, path) of every ride file under year/month/, in sorted order."""
+    rides = []
+    for year_dir in ['2024', '2025']:
+        year_path = os.path.join(dataset_path, year_dir)
+        if not os.path.exists(year_path):
+            continue
+        
+        for month in sorted(os.listdir(year_path)):
+            month_path = os.path.join(year_path, month)
+            if not os.path.isdir(month_path):
+                continue
+            
+            for ride_file in sorted(os.listdir(month_path)):
+                ride_path = os.path.join(month_path, ride_file)
+                if os.path.isfile(ride_path):
+                    rides.append((f"{year_dir}/{month}", ride_path))
+    return rides
+
+
+class MiningMetrics:
+    """
+    Wall time per pipeline stage plus counters for a mining run.
+
+    Stages are PIPELINE_STAGES; counters include bytes_read, rows_parsed,
+    rows_dropped (rows without Z or timestamp), windows, labelled_windows
+    and parse_failures. Worker processes fill their own instance per ride
+    and main() merges their state(), so in parallel runs the stage times
+    add up across workers and can exceed the wall time.
+    """
+    
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.failures = defaultdict(int)
+        self.failure_examples = []
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+    
+    def add_time(self, name, seconds):
+        self.seconds[name] += seconds
+    
+    def count(self, name, n=1):
+        self.counts[name] += n
+    
+    def failure(self, ride_path, error):
+        """Record a ride that could not be parsed."""
+        self.counts['parse_failures'] += 1
+        self.failures[type(error).__name__] += 1
+        if len(self.failure_examples) < FAILURE_EXAMPLES:
+            self.failure_examples.append({'ride': ride_path, 'error': f'{type(error).__name__}: {error}'})
+    
+    def state(self):
+        """Picklable snapshot, for sending from a worker to merge()."""
+        return {
+            'seconds': dict(self.seconds),
+            'counts': dict(self.counts),
+            'failures': dict(self.failures),
+            'failure_examples': self.failure_examples,
+        }
+    
+    def merge(self, state):
+        for name, seconds in state['seconds'].items():
+            self.seconds[name] += seconds
+        for name, n in state['counts'].items():
+            self.counts[name] += n
+        for name, n in state['failures'].items():
+            self.failures[name] += n
+        room = FAILURE_EXAMPLES - len(self.failure_examples)
+        self.failure_examples.extend(state['failure_examples'][:max(room, 0)])
+    
+    def rates(self, wall_seconds):
+        if wall_seconds <= 0:
+            return {}
+        return {
+            'rides_per_s': self.counts['rides'] / wall_seconds,
+            'rows_per_s': self.counts['rows_parsed'] / wall_seconds,
+            'windows_per_s': self.counts['windows'] / wall_seconds,
+            'mb_per_s': self.counts['bytes_read'] / (1024 * 1024) / wall_seconds,
+        }
+    
+    def report(self, wall_seconds, workers):
+        """The metrics as a dict for mining_metrics.json."""
+        total = sum(self.seconds.values())
+        stages = {
+            name: {
+                'seconds': self.seconds.get(name, 0.0),
+                'share': self.seconds.get(name, 0.0) / total if total else 0.0,
+            }
+            for name in PIPELINE_STAGES
+        }
+        return {
+            'wall_seconds': wall_seconds,
+            'workers': workers,
+            'stages': stages,
+            'counts': dict(sorted(self.counts.items())),
+            'rates': self.rates(wall_seconds),
+            'parse_failures': {
+                'count': self.counts.get('parse_failures', 0),
+                'by_error': dict(self.failures),
+                'examples': self.failure_examples,
+            },
+        }
+    
+    def save(self, output_dir, wall_seconds, workers):
+        """Write mining_metrics.json and the flat mining_metrics.csv."""
+        report = self.report(wall_seconds, workers)
+        with open(os.path.join(output_dir, 'mining_metrics.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        
+        with open(os.path.join(output_dir, 'mining_metrics.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'value'])
+            writer.writerow(['run', 'wall_seconds', wall_seconds])
+            writer.writerow(['run', 'workers', workers])
+            for name, stage in report['stages'].items():
+                writer.writerow(['stage_seconds', name, stage['seconds']])
+            for name, n in report['counts'].items():
+                writer.writerow(['count', name, n])
+            for name, rate in report['rates'].items():
+                writer.writerow(['rate', name, rate])
+            for name, n in report['parse_failures']['by_error'].items():
+                writer.writerow(['parse_failure', name, n])
+
+
+def timed(metrics, stage):
+    """metrics.stage(stage), or a no-op without metrics."""
+    return metrics.stage(stage) if metrics is not None else contextlib.nullcontext()
+
+
+def mining_config():
+    """Settings that determine mine_ride's output; the ride cache is keyed on them."""
+    return {
+        'cache_version': CACHE_VERSION,
+        'window_size_ms': WINDOW_SIZE_MS,
+        'min_samples_per_window': MIN_SAMPLES_PER_WINDOW,
+        'pothole_high': POTHOLE_HIGH_THRESHOLD,
+        'pothole_low': POTHOLE_LOW_THRESHOLD,
+        'normal_min': NORMAL_MIN,
+        'normal_max': NORMAL_MAX,
+        'normal_max_std': NORMAL_MAX_STD,
+        'incident_max_gap_ms': INCIDENT_MAX_GAP_MS,
+        'incident_max_distance_m': INCIDENT_MAX_DISTANCE_M,
+        'ride_columns': RIDE_COLUMN_INDICES,
+    }
+
+
+def environment():
+    """Commit and machine details stored with benchmark and replay results."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__ if HAS_NUMPY else None,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+class RideCache:
+    """
+    Persistent cache of mine_ride results, keyed by ride path, size and mtime.
+
+    manifest.json records every mined ride and the mining_config() it was
+    mined with; a different config (window size, thresholds, ...) discards
+    the whole cache. Each ride's labelled windows are stored as a compressed
+    .npz file under entries/. The manifest is rewritten atomically every
+    CACHE_FLUSH_RIDES rides, so an interrupted run resumes from there.
+    """
+    
+    MISS = object()
+    
+    def __init__(self, cache_dir, dataset_path):
+        self.cache_dir = cache_dir
+        self.dataset_path = dataset_path
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.entries_dir = os.path.join(cache_dir, 'entries')
+        self.hits = 0
+        self.mined = 0
+        self._unsaved = 0
+        
+        self.manifest = None
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = None
+        
+        if self.manifest is None or self.manifest.get('config') != mining_config():
+            # Entries mined with other settings are useless: start over
+            shutil.rmtree(self.entries_dir, ignore_errors=True)
+            self.manifest = {'config': mining_config(), 'rides': {}}
+        os.makedirs(self.entries_dir, exist_ok=True)
+    
+    def _key(self, ride_path):
+        return os.path.relpath(ride_path, self.dataset_path)
+    
+    def lookup(self, ride_path):
+        """The cached mine_ride result for ride_path, or RideCache.MISS."""
+        entry = self.manifest['rides'].get(self._key(ride_path))
+        stat = os.stat(ride_path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return self.MISS
+        
+        if entry['file'] is None:
+            self.hits += 1
+            return None
+        try:
+            with np.load(os.path.join(self.entries_dir, entry['file'])) as data:
+                table = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError):
+            return self.MISS
+        self.hits += 1
+        return entry['n_windows'], table
+    
+    def store(self, ride_path, result):
+        """Record the mine_ride result of a ride that missed the cache."""
+        key = self._key(ride_path)
+        stat = os.stat(ride_path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'file': None, 'n_windows': 0}
+        if result is not None:
+            n_windows, table = result
+            entry['file'] = hashlib.sha1(key.encode()).hexdigest() + '.npz'
+            entry['n_windows'] = n_windows
+            np.savez_compressed(os.path.join(self.entries_dir, entry['file']), **table)
+        self.manifest['rides'][key] = entry
+        self.mined += 1
+        
+        self._unsaved += 1
+        if self._unsaved >= CACHE_FLUSH_RIDES:
+            self.flush()
+    
+    def flush(self):
+        """Write the manifest (atomically) if rides were added since the last flush."""
+        if not self._unsaved:
+            return
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._unsaved = 0
+
+
+def iter_ride_results(rides, workers=1, columnar=True, cache=None, metrics=None):
+    """
+    Yield (month, ride_path, mine_ride result) for each ride, in input order.
+
+    With workers > 1 the rides are mined in a process pool. Only
+    workers * RIDES_IN_FLIGHT_PER_WORKER rides are queued at any time and
+    results are handed out in submission order, so the output does not
+    depend on the worker count and closing the generator early only has a
+    few queued rides to cancel. Rides found in the cache are not mined;
+    newly mined rides are added to it. Stage metrics of mined rides,
+    including those from worker processes, are merged into metrics.
+    """
+    def cached(ride_path):
+        if cache is None:
+            return RideCache.MISS
+        with timed(metrics, 'cache'):
+            return cache.lookup(ride_path)
+    
+    def store(ride_path, result):
+        if cache is not None:
+            with timed(metrics, 'cache'):
+                cache.store(ride_path, result)
+    
+    if workers <= 1:
+        for month, ride_path in rides:
+            result = cached(ride_path)
+            if result is RideCache.MISS:
+                result = mine_ride(ride_path, columnar, metrics)
+                store(ride_path, result)
+            yield month, ride_path, result
+        return
+    
+    ride_iter = iter(rides)
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    
+    def submit(count):
+        for month, ride_path in itertools.islice(ride_iter, count):
+            result = cached(ride_path)
+            mined = result is RideCache.MISS
+            if mined:
+                future = executor.submit(_mine_ride_measured, ride_path, columnar)
+            else:
+                future = Future()
+                future.set_result(result)
+            pending.append((month, ride_path, future, mined))
+    
+    try:
+        submit(workers * RIDES_IN_FLIGHT_PER_WORKER)
+        while pending:
+            month, ride_path, future, mined = pending.popleft()
+            result = future.result()
+            if mined:
+                result, worker_metrics = result
+                if metrics is not None:
+                    metrics.merge(worker_metrics)
+                store(ride_path, result)
+            submit(1)
+            yield month, ride_path, result
+    finally:
+        for _, _, future, _ in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ReservoirSampler:
+    """
+    Uniform fixed-size sample of every labelled window in the corpus.
+
+    One reservoir of capacities[class] windows is kept per class, or per
+    class and month with by_month=True, so memory does not grow with the
+    corpus. Each reservoir applies Algorithm R to whole window tables at
+    once: the i-th window of a stratum (0-based) replaces a random slot with
+    probability capacity / (i + 1). Exact window counts are kept per class
+    and month.
+    """
+    
+    def __init__(self, capacities, seed, by_month=False):
+        self.capacities = capacities
+        self.by_month = by_month
+        self.rng = np.random.default_rng(seed)
+        self.reservoirs = {}
+        self.seen = defaultdict(int)
+        self.class_counts = defaultdict(int)
+        self.month_counts = defaultdict(lambda: defaultdict(int))
+    
+    def add(self, table, month):
+        """Offer the windows of one ride (a mine_ride window table)."""
+        for label, name in LABEL_NAMES.items():
+            selected = np.flatnonzero(table['label'] == label)
+            if not selected.size:
+                continue
+            self.class_counts[name] += int(selected.size)
+            self.month_counts[month][name] += int(selected.size)
+            key = (name, month if self.by_month else '')
+            self._add_to(key, {column: values[selected] for column, values in table.items()})
+    
+    def _add_to(self, key, table):
+        capacity = self.capacities[key[0]]
+        n = len(table['label'])
+        seen = self.seen[key]
+        self.seen[key] = seen + n
+        reservoir = self.reservoirs.get(key)
+        
+        # Fill phase: the first `capacity` windows are always kept
+        size = 0 if reservoir is None else len(reservoir['label'])
+        n_fill = min(n, capacity - size)
+        if n_fill > 0:
+            head = {column: values[:n_fill] for column, values in table.items()}
+            if reservoir is None:
+                reservoir = {column: values.copy() for column, values in head.items()}
+            else:
+                reservoir = {column: np.concatenate((reservoir[column], head[column]))
+                             for column in reservoir}
+            self.reservoirs[key] = reservoir
+        if n_fill >= n:
+            return
+        
+        # Replacement phase, vectorised over the rest of the ride
+        stream_index = seen + np.arange(n_fill, n)
+        slots = self.rng.integers(0, stream_index + 1)
+        accepted = np.flatnonzero(slots < capacity)
+        if not accepted.size:
+            return
+        # A later window overwrites an earlier one drawing the same slot
+        slots, last = np.unique(slots[accepted][::-1], return_index=True)
+        rows = n_fill + accepted[::-1][last]
+        for column, values in reservoir.items():
+            values[slots] = table[column][rows]
+    
+    def samples(self, name):
+        """Feature dicts kept for a class, in month then stream order."""
+        samples = []
+        for key in sorted(k for k in self.reservoirs if k[0] == name):
+            samples.extend(window_samples(self.reservoirs[key]))
+        return samples
+    
+    def summary(self):
+        return {
+            'mode': 'reservoir',
+            'reservoir_sizes': dict(self.capacities),
+            'stratified_by_month': self.by_month,
+            'class_counts': dict(self.class_counts),
+            'month_counts': {month: dict(counts) for month, counts in sorted(self.month_counts.items())},
+        }
+
+
+class FeatureHistograms:
+    """Fixed-bin histograms of every window feature, per class, over the corpus."""
+    
+    def __init__(self):
+        self.edges = {}
+        for name in FEATURE_NAMES:
+            kind = name if name == 'sample_count' else name.split('_', 1)[1]
+            low, high = HISTOGRAM_RANGES[kind]
+            self.edges[name] = np.linspace(low, high, HISTOGRAM_BINS + 1)
+        self.counts = {}
+    
+    def add(self, table):
+        for label, class_name in LABEL_NAMES.items():
+            selected = table['label'] == label
+            if not selected.any():
+                continue
+            class_counts = self.counts.setdefault(class_name, {})
+            for name, edges in self.edges.items():
+                values = table[name][selected]
+                # Bin 0 and the last bin collect under- and overflow
+                bins = np.clip(np.searchsorted(edges, values, side='right'), 0, len(edges))
+                counts = np.bincount(bins, minlength=len(edges) + 1)
+                if name in class_counts:
+                    class_counts[name] += counts
+                else:
+                    class_counts[name] = counts
+    
+    def to_dict(self):
+        histograms = {}
+        for class_name, class_counts in sorted(self.counts.items()):
+            histograms[class_name] = {
+                name: {
+                    'edges': self.edges[name].tolist(),
+                    'counts': counts[1:-1].tolist(),
+                    'underflow': int(counts[0]),
+                    'overflow': int(counts[-1]),
+                }
+                for name, counts in class_counts.items()
+            }
+        return histograms
+
+
+def balance_classes(pothole_samples, normal_samples, seed):
+    """Randomly downsample the larger class to the size of the smaller one."""
+    rng = random.Random(seed)
+    size = min(len(pothole_samples), len(normal_samples))
+    
+    def downsample(samples):
+        if len(samples) <= size:
+            return samples
+        keep = sorted(rng.sample(range(len(samples)), size))
+        return [samples[i] for i in keep]
+    
+    return downsample(pothole_samples), downsample(normal_samples)
+
+
+def incident_summary(samples):
+    """How the threshold labels of samples line up with their incident tags."""
+    tagged = defaultdict(int)
+    by_type = defaultdict(lambda: defaultdict(int))
+    for sample in samples:
+        if sample['incident_type'] != INCIDENT_NONE:
+            tagged[sample['label']] += 1
+            by_type[str(sample['incident_type'])][sample['label']] += 1
+    return {
+        'max_gap_ms': INCIDENT_MAX_GAP_MS,
+        'max_distance_m': INCIDENT_MAX_DISTANCE_M,
+        'tagged_samples': dict(tagged),
+        'by_type': {incident_type: dict(counts) for incident_type, counts in sorted(by_type.items())},
+    }
+
+
 def save_samples(samples, label, output_dir):
     """Save samples to CSV file."""
     os.makedirs(output_dir, exist_ok=True)
@@ -236,13 +1532,139 @@ def save_samples(samples, label, output_dir):
     print(f"Saved {len(samples)} {label} samples to {filepath}")
 
 
-def main():
+def save_dataset(samples, name, output_dir):
+    """
+    Save samples as a columnar binary dataset next to the CSV files.
+
+    Writes <name>_features.npy (float32, one column per FEATURE_NAMES entry),
+    <name>_labels.npy (int8, LABEL_NORMAL/LABEL_POTHOLE), <name>_positions.npy
+    (float64 lat, lon, timestamp; NaN where unknown), <name>_incidents.npy
+    (float32 incident type and distance, see tag_incidents) and a
+    <name>_schema.json sidecar describing them. The trainer memory-maps the .npy files instead
+    of parsing CSV.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    label_ids = {label_name: label for label, label_name in LABEL_NAMES.items()}
+    n = len(samples)
+    
+    # Filled column by column; None (no GPS fix) becomes NaN
+    features = np.empty((n, len(FEATURE_NAMES)), dtype=np.float32)
+    for j, column in enumerate(FEATURE_NAMES):
+        features[:, j] = np.fromiter((sample[column] for sample in samples), np.float64, n)
+    positions = np.empty((n, len(POSITION_COLUMNS)), dtype=np.float64)
+    for j, column in enumerate(POSITION_COLUMNS):
+        positions[:, j] = np.fromiter((sample[column] for sample in samples), np.float64, n)
+    incidents = np.empty((n, len(INCIDENT_COLUMNS)), dtype=np.float32)
+    for j, column in enumerate(INCIDENT_COLUMNS):
+        incidents[:, j] = np.fromiter((sample[column] for sample in samples), np.float64, n)
+    labels = np.fromiter((label_ids[sample['label']] for sample in samples), np.int8, n)
+    
+    arrays = {'features': features, 'labels': labels, 'positions': positions,
+              'incidents': incidents}
+    schema = {'format_version': DATASET_FORMAT_VERSION, 'rows': n}
+    for part, array in arrays.items():
+        filename = f"{name}_{part}.npy"
+        np.save(os.path.join(output_dir, filename), array)
+        schema[part] = {'file': filename, 'dtype': array.dtype.name, 'shape': list(array.shape)}
+    schema['features']['columns'] = FEATURE_NAMES
+    schema['positions']['columns'] = POSITION_COLUMNS
+    schema['incidents']['columns'] = INCIDENT_COLUMNS
+    schema['labels']['classes'] = {str(label): label_name for label, label_name in LABEL_NAMES.items()}
+    
+    with open(os.path.join(output_dir, f"{name}_schema.json"), 'w') as f:
+        json.dump(schema, f, indent=2)
+    
+    print(f"Saved {n} {name} samples to {os.path.join(output_dir, name)}_*.npy")
+
+
+def progress_rates(metrics, run_start):
+    """', N windows/s' progress suffix (only rides mined in this run count)."""
+    elapsed = time.perf_counter() - run_start
+    if not elapsed or not metrics.counts['windows']:
+        return ''
+    return f", {metrics.counts['windows'] / elapsed:.0f} windows/s"
+
+
+def print_metrics(metrics, wall_seconds, workers):
+    """Stage time breakdown and throughput of a run."""
+    summed = f", summed over {workers} workers" if workers > 1 else ""
+    print(f"\nStage times ({wall_seconds:.1f} s wall{summed}):")
+    for name in PIPELINE_STAGES:
+        print(f"  {name:<10} {metrics.seconds.get(name, 0.0):8.2f} s")
+    rates = metrics.rates(wall_seconds)
+    if rates:
+        print(f"Throughput: {rates['rows_per_s']:.0f} rows/s, {rates['windows_per_s']:.0f} windows/s, "
+              f"{rates['mb_per_s']:.1f} MB/s")
+    if metrics.counts['parse_failures']:
+        print(f"Parse failures: {metrics.counts['parse_failures']} {dict(metrics.failures)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mine pothole/normal windows from SimRa rides")
+    parser.add_argument('--parser', choices=['columnar', 'dicts'],
+                        default='columnar' if HAS_NUMPY else 'dicts',
+                        help="columnar: NumPy arrays per ride (low memory, needed by the cache "
+                             "and --sampling reservoir); "
+                             "dicts: one dict per sensor reading")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes mining rides in parallel (0 = one per CPU)")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="seed for shuffling the combined training samples")
+    parser.add_argument('--dataset', default=DATASET_PATH,
+                        help="SimRa Rides directory containing year/month/ride files")
+    parser.add_argument('--output', default=OUTPUT_PATH,
+                        help="directory for the CSV files and mining_summary.json")
+    parser.add_argument('--cache-dir', default=None,
+                        help="per-ride result cache (default: <output>/.miner_cache)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="mine every ride from scratch and leave the cache untouched")
+    parser.add_argument('--sampling', choices=['first', 'reservoir'], default='first',
+                        help="first: stop at the first TARGET_* windows per class; "
+                             "reservoir: stream the whole corpus and keep a uniform sample")
+    parser.add_argument('--reservoir-size', type=int, default=None,
+                        help="windows kept per class (per class and month with --per-month); "
+                             "default TARGET_POTHOLE_SAMPLES/TARGET_NORMAL_SAMPLES")
+    parser.add_argument('--per-month', action='store_true',
+                        help="reservoir sampling: keep a separate reservoir per month")
+    parser.add_argument('--balance', action='store_true',
+                        help="downsample the larger class to the size of the smaller one")
+    parser.add_argument('--format', choices=['both', 'npy', 'csv'],
+                        default='both' if HAS_NUMPY else 'csv',
+                        help="npy: columnar binary dataset loaded by the trainer; "
+                             "csv: per-class CSV files for inspection")
+    parser.add_argument('--profile', action='store_true',
+                        help="run under cProfile and write mining_profile.prof next to the "
+                             "summary (with --workers > 1 only the main process is profiled)")
+    args = parser.parse_args(argv)
+    if args.parser == 'columnar' and not HAS_NUMPY:
+        parser.error("the columnar parser requires numpy (pip install numpy)")
+    if args.format != 'csv' and not HAS_NUMPY:
+        parser.error("the npy dataset format requires numpy (pip install numpy)")
+    if args.sampling == 'reservoir' and args.parser != 'columnar':
+        parser.error("--sampling reservoir requires the columnar parser")
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+    if args.cache_dir is None:
+        args.cache_dir = os.path.join(args.output, '.miner_cache')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    columnar = args.parser == 'columnar'
+    
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    metrics = MiningMetrics()
+    run_start = time.perf_counter()
+    
     print("=" * 60)
     print("SimRa Pothole Data Miner")
     print("=" * 60)
     
     # Create output directory
-    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    os.makedirs(args.output, exist_ok=True)
     
     pothole_samples = []
     normal_samples = []
@@ -250,57 +1672,78 @@ def main():
     files_processed = 0
     total_windows = 0
     
-    # Walk through all ride files
-    for year_dir in ['2024', '2025']:
-        year_path = os.path.join(DATASET_PATH, year_dir)
-        if not os.path.exists(year_path):
-            continue
-        
-        for month in os.listdir(year_path):
-            month_path = os.path.join(year_path, month)
-            if not os.path.isdir(month_path):
+    # Walk through all ride files (year/month/ride), mining in parallel if asked
+    rides = list_ride_files(args.dataset)
+    if args.workers > 1:
+        print(f"Mining {len(rides)} rides with {args.workers} worker processes")
+    
+    # Reservoir mode streams every ride instead of stopping at the targets
+    sampler = histograms = None
+    if args.sampling == 'reservoir':
+        capacities = {
+            'pothole': args.reservoir_size or TARGET_POTHOLE_SAMPLES,
+            'normal': args.reservoir_size or TARGET_NORMAL_SAMPLES,
+        }
+        sampler = ReservoirSampler(capacities, args.seed, by_month=args.per_month)
+        histograms = FeatureHistograms()
+    
+    # The cache stores NumPy window tables, so it needs the columnar parser
+    cache = None
+    if columnar and not args.no_cache:
+        cache = RideCache(args.cache_dir, args.dataset)
+        print(f"Ride cache: {args.cache_dir} ({len(cache.manifest['rides'])} rides cached)")
+    
+    current_month = None
+    results = iter_ride_results(rides, args.workers, columnar, cache, metrics)
+    try:
+        for month, ride_path, result in results:
+            if month != current_month:
+                current_month = month
+                print(f"\nProcessing {month}...")
+            
+            if result is None:
                 continue
             
-            print(f"\nProcessing {year_dir}/{month}...")
+            files_processed += 1
+            n_windows, samples = result
+            total_windows += n_windows
             
-            for ride_file in os.listdir(month_path):
-                if len(pothole_samples) >= TARGET_POTHOLE_SAMPLES and len(normal_samples) >= TARGET_NORMAL_SAMPLES:
-                    break
-                
-                ride_path = os.path.join(month_path, ride_file)
-                if not os.path.isfile(ride_path):
-                    continue
-                
-                incidents, sensor_data = parse_ride_file(ride_path)
-                if not sensor_data:
-                    continue
-                
-                files_processed += 1
-                windows = extract_windows(sensor_data)
-                total_windows += len(windows)
-                
-                for window in windows:
-                    label = classify_window(window)
-                    features = compute_features(window)
-                    
-                    if features is None:
-                        continue
-                    
-                    if label == 'pothole' and len(pothole_samples) < TARGET_POTHOLE_SAMPLES:
-                        features['label'] = 'pothole'
-                        pothole_samples.append(features)
-                    elif label == 'normal' and len(normal_samples) < TARGET_NORMAL_SAMPLES:
-                        features['label'] = 'normal'
-                        normal_samples.append(features)
-                
+            if sampler is not None:
+                sampler.add(samples, month)
+                histograms.add(samples)
                 if files_processed % 100 == 0:
-                    print(f"  Processed {files_processed} files, {len(pothole_samples)} potholes, {len(normal_samples)} normal")
+                    counts = sampler.class_counts
+                    print(f"  Processed {files_processed} files, {counts['pothole']} potholes, {counts['normal']} normal seen"
+                          f"{progress_rates(metrics, run_start)}")
+                continue
+            
+            for features in iter_samples(samples):
+                label = features['label']
+                if label == 'pothole' and len(pothole_samples) < TARGET_POTHOLE_SAMPLES:
+                    pothole_samples.append(features)
+                elif label == 'normal' and len(normal_samples) < TARGET_NORMAL_SAMPLES:
+                    normal_samples.append(features)
+            
+            if files_processed % 100 == 0:
+                print(f"  Processed {files_processed} files, {len(pothole_samples)} potholes, {len(normal_samples)} normal"
+                      f"{progress_rates(metrics, run_start)}")
             
             if len(pothole_samples) >= TARGET_POTHOLE_SAMPLES and len(normal_samples) >= TARGET_NORMAL_SAMPLES:
                 break
-        
-        if len(pothole_samples) >= TARGET_POTHOLE_SAMPLES and len(normal_samples) >= TARGET_NORMAL_SAMPLES:
-            break
+    finally:
+        # Cancels rides still queued in the worker pool
+        results.close()
+        if cache is not None:
+            with metrics.stage('cache'):
+                cache.flush()
+            metrics.count('cache_hits', cache.hits)
+            print(f"\nRide cache: {cache.hits} hits, {cache.mined} rides mined")
+    
+    if sampler is not None:
+        pothole_samples = sampler.samples('pothole')
+        normal_samples = sampler.samples('normal')
+    if args.balance:
+        pothole_samples, normal_samples = balance_classes(pothole_samples, normal_samples, args.seed)
     
     print("\n" + "=" * 60)
     print("Mining Complete!")
@@ -309,14 +1752,24 @@ def main():
     print(f"Total windows analyzed: {total_windows}")
     print(f"Pothole samples: {len(pothole_samples)}")
     print(f"Normal samples: {len(normal_samples)}")
+    if sampler is not None:
+        counts = sampler.class_counts
+        print(f"Labelled windows in corpus: {counts['pothole']} pothole, {counts['normal']} normal")
     
     # Combine and save
     all_samples = pothole_samples + normal_samples
-    random.shuffle(all_samples)
+    random.Random(args.seed).shuffle(all_samples)
+    incidents = incident_summary(all_samples)
+    tagged = incidents['tagged_samples']
+    print(f"Incident-tagged samples: {tagged.get('pothole', 0)} pothole, {tagged.get('normal', 0)} normal")
     
-    save_samples(all_samples, "training_data", OUTPUT_PATH)
-    save_samples(pothole_samples, "pothole", OUTPUT_PATH)
-    save_samples(normal_samples, "normal", OUTPUT_PATH)
+    write_start = time.perf_counter()
+    if args.format in ('both', 'csv'):
+        save_samples(all_samples, "training_data", args.output)
+        save_samples(pothole_samples, "pothole", args.output)
+        save_samples(normal_samples, "normal", args.output)
+    if args.format in ('both', 'npy'):
+        save_dataset(all_samples, "training_data", args.output)
     
     # Save summary
     summary = {
@@ -335,10 +1788,30 @@ def main():
         }
     }
     
-    with open(os.path.join(OUTPUT_PATH, 'mining_summary.json'), 'w') as f:
+    summary['sampling'] = sampler.summary() if sampler is not None else {'mode': 'first'}
+    summary['sampling']['balanced'] = args.balance
+    summary['incidents'] = incidents
+    
+    with open(os.path.join(args.output, 'mining_summary.json'), 'w') as f:
         json.dump(summary, f, indent=2)
     
-    print(f"\nDataset saved to: {OUTPUT_PATH}")
+    if histograms is not None:
+        with open(os.path.join(args.output, 'feature_histograms.json'), 'w') as f:
+            json.dump(histograms.to_dict(), f)
+    metrics.add_time('write', time.perf_counter() - write_start)
+    
+    wall_seconds = time.perf_counter() - run_start
+    metrics.save(args.output, wall_seconds, args.workers)
+    print_metrics(metrics, wall_seconds, args.workers)
+    
+    if profiler is not None:
+        profiler.disable()
+        profile_path = os.path.join(args.output, 'mining_profile.prof')
+        profiler.dump_stats(profile_path)
+        print(f"\nProfile saved to: {profile_path} (top functions by cumulative time)")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    
+    print(f"\nDataset saved to: {args.output}")
     print("Next step: Run train_pothole_model.py to train the ML model")
 
 
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Ride Replay Simulator
+Streams SimRa ride files through the on-device inference pipeline and
+measures detection latency and cost.
+
+Every ride is read with the miner's streaming reader and windowed like the
+miner does (2 s windows, 50% overlap). A window is scored as soon as the
+row closing it arrives: compute_features, then the exported forest
+(pothole_forest.npz) through forest_export.scalar_evaluator, the Python
+port of the generated Dart evaluator. With --speed the rows are released
+at their recorded timestamps (1 = real time, 10 = ten times faster);
+without it the rides are replayed as fast as possible.
+
+Impacts are the rows the miner would label as pothole (Z above
+POTHOLE_HIGH_THRESHOLD or below POTHOLE_LOW_THRESHOLD); rows within one
+window length of each other form one impact. A detection within
+IMPACT_MATCH_MS after an impact detects it. Per ride and in total the
+report lists detections, detected and missed impacts, false detections,
+impact-to-detection latency and throughput in windows per second.
+
+Usage:
+  python replay_rides.py RIDES_DIR --model model/pothole_forest.npz
+  python replay_rides.py --synthetic 20 --rows 20000 --speed 50 --report replay.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+import simra_synth
+import forest_export
+import pothole_data_miner as miner
+
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model', 'pothole_forest.npz')
+DETECTION_THRESHOLD = 0.5     # Pothole probability of a detection (isPothole)
+DETECTION_COOLDOWN_MS = 2500  # Like MLPotholeDetectionService: no detection within this of the last
+IMPACT_MATCH_MS = 2 * miner.WINDOW_SIZE_MS  # Latest detection still counted for an impact
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+class RideReplay:
+    """
+    Replay of one ride: scores windows as rows arrive and records impacts
+    and detections in ride time (ms timestamps of the ride).
+    """
+
+    def __init__(self, predict, feature_names, threshold, cooldown_ms, pacer):
+        self.predict = predict
+        self.feature_names = feature_names
+        self.threshold = threshold
+        self.cooldown_ms = cooldown_ms
+        self.pacer = pacer
+        self.rows = 0
+        self.windows = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.impacts = []
+        self.detections = []
+        self.feature_seconds = 0.0
+        self.model_seconds = 0.0
+        self.queue_delays = []
+        self._last_impact_row_ts = None
+
+    def feed(self, columns, final=False):
+        """Score the windows columns (all rows not yet windowed) closes; returns the next start row."""
+        ts = columns['ts']
+        starts, ends, next_start = miner.closed_window_bounds(ts, final=final)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            # The row at end closes the window; the last window closes with the ride
+            available_ts = int(ts[end]) if end < len(ts) else int(ts[-1])
+            self._score({name: values[start:end] for name, values in columns.items()}, available_ts)
+        return next_start
+
+    def add_rows(self, columns):
+        """Account for newly arrived rows and find the impacts among them."""
+        ts = columns['ts']
+        if not len(ts):
+            return
+        if self.first_ts is None:
+            self.first_ts = int(ts[0])
+            self.pacer.start(self.first_ts)
+        self.last_ts = int(ts[-1])
+        self.rows += len(ts)
+
+        z = columns['z']
+        for impact_ts in ts[(z > miner.POTHOLE_HIGH_THRESHOLD) | (z < miner.POTHOLE_LOW_THRESHOLD)].tolist():
+            if self._last_impact_row_ts is None or impact_ts - self._last_impact_row_ts > miner.WINDOW_SIZE_MS:
+                self.impacts.append(impact_ts)
+            self._last_impact_row_ts = impact_ts
+
+    def _score(self, window, available_ts):
+        released = self.pacer.wait(available_ts)
+
+        start = time.perf_counter()
+        features = miner.compute_features(window)
+        middle = time.perf_counter()
+        if features is None:
+            return
+        probability = self.predict([features[name] for name in self.feature_names])
+        end = time.perf_counter()
+
+        self.windows += 1
+        self.feature_seconds += middle - start
+        self.model_seconds += end - middle
+        if released is not None:
+            self.queue_delays.append(end - released)
+
+        if probability > self.threshold and (
+                not self.detections or available_ts - self.detections[-1] > self.cooldown_ms):
+            self.detections.append(available_ts)
+
+    def result(self):
+        """Per-ride summary, matching every impact to the first detection after it."""
+        latencies = []
+        matched = set()
+        for impact_ts in self.impacts:
+            for k, detection_ts in enumerate(self.detections):
+                if k not in matched and impact_ts <= detection_ts <= impact_ts + IMPACT_MATCH_MS:
+                    matched.add(k)
+                    latencies.append(detection_ts - impact_ts)
+                    break
+
+        ride_seconds = (self.last_ts - self.first_ts) / 1000.0 if self.rows else 0.0
+        compute_seconds = self.feature_seconds + self.model_seconds
+        return {
+            'rows': self.rows,
+            'ride_seconds': ride_seconds,
+            'windows': self.windows,
+            'detections': len(self.detections),
+            'impacts': len(self.impacts),
+            'impacts_detected': len(latencies),
+            'impacts_missed': len(self.impacts) - len(latencies),
+            'false_detections': len(self.detections) - len(matched),
+            'latencies_ms': latencies,
+            'feature_seconds': self.feature_seconds,
+            'model_seconds': self.model_seconds,
+            'compute_ms_per_ride_second': compute_seconds * 1000.0 / ride_seconds if ride_seconds else 0.0,
+            'queue_delays_ms': [delay * 1000.0 for delay in self.queue_delays],
+        }
+
+
+class Pacer:
+    """Releases ride timestamps at speed times real time (speed None: no waiting)."""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.origin = None
+
+    def start(self, ride_ts):
+        """Release ride_ts, the first row of a ride, now."""
+        self.origin = (ride_ts, time.perf_counter())
+
+    def wait(self, ride_ts):
+        """Sleep until ride_ts is due; returns the perf_counter time it was due, or None."""
+        if not self.speed:
+            return None
+        due = self.origin[1] + (ride_ts - self.origin[0]) / 1000.0 / self.speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return due
+
+
+def replay_ride(ride_path, replay):
+    """Stream one ride through replay; returns False if the file is not a ride."""
+    _, chunks = miner.stream_ride_file(ride_path)
+    if chunks is None:
+        return False
+
+    buffer = None
+    for chunk in chunks:
+        replay.add_rows(chunk)
+        if buffer is None:
+            buffer = chunk
+        else:
+            buffer = {name: np.concatenate((buffer[name], chunk[name])) for name in miner.RIDE_COLUMNS}
+        next_start = replay.feed(buffer)
+        buffer = {name: values[next_start:] for name, values in buffer.items()}
+    if buffer is not None and len(buffer['ts']):
+        replay.feed(buffer, final=True)
+    return True
+
+
+def replay_rides(ride_paths, flat, threshold=DETECTION_THRESHOLD,
+                 cooldown_ms=DETECTION_COOLDOWN_MS, speed=None):
+    """Replay every ride; returns the per-ride results and the wall time."""
+    predict = forest_export.scalar_evaluator(flat)
+    pacer = Pacer(speed)
+    results = []
+    start = time.perf_counter()
+    for ride_path in ride_paths:
+        replay = RideReplay(predict, flat['feature_names'], threshold, cooldown_ms, pacer)
+        ride_start = time.perf_counter()
+        if not replay_ride(ride_path, replay):
+            continue
+        result = replay.result()
+        result['ride'] = ride_path
+        result['wall_seconds'] = time.perf_counter() - ride_start
+        results.append(result)
+    return results, time.perf_counter() - start
+
+
+def percentiles(values):
+    if not values:
+        return {f'p{p}': None for p in LATENCY_PERCENTILES}
+    return {f'p{p}': float(np.percentile(values, p)) for p in LATENCY_PERCENTILES}
+
+
+def summarize(results, wall_seconds):
+    """Totals over all rides."""
+    def total(key):
+        return sum(result[key] for result in results)
+
+    windows = total('windows')
+    ride_seconds = total('ride_seconds')
+    compute_seconds = total('feature_seconds') + total('model_seconds')
+    impacts = total('impacts')
+    detections = total('detections')
+    return {
+        'rides': len(results),
+        'rows': total('rows'),
+        'ride_seconds': ride_seconds,
+        'windows': windows,
+        'detections': detections,
+        'impacts': impacts,
+        'impacts_detected': total('impacts_detected'),
+        'impacts_missed': total('impacts_missed'),
+        'false_detections': total('false_detections'),
+        'recall': total('impacts_detected') / impacts if impacts else None,
+        'precision': (detections - total('false_detections')) / detections if detections else None,
+        'latency_ms': percentiles([ms for result in results for ms in result['latencies_ms']]),
+        'queue_delay_ms': percentiles([ms for result in results for ms in result['queue_delays_ms']]),
+        'wall_seconds': wall_seconds,
+        'windows_per_second': windows / wall_seconds if wall_seconds else 0.0,
+        'compute_windows_per_second': windows / compute_seconds if compute_seconds else 0.0,
+        'feature_us_per_window': total('feature_seconds') / windows * 1e6 if windows else 0.0,
+        'model_us_per_window': total('model_seconds') / windows * 1e6 if windows else 0.0,
+        'compute_ms_per_ride_second': compute_seconds * 1000.0 / ride_seconds if ride_seconds else 0.0,
+    }
+
+
+def _ms(value):
+    return f"{value:.0f}" if value is not None else "-"
+
+
+def print_report(results, summary):
+    print(f"{'ride':<28}{'windows':>8}{'impacts':>8}{'detected':>9}{'missed':>7}"
+          f"{'false':>6}{'p50 ms':>8}{'win/s':>9}")
+    for result in results:
+        latency = percentiles(result['latencies_ms'])
+        rate = result['windows'] / result['wall_seconds'] if result['wall_seconds'] else 0.0
+        print(f"{os.path.basename(result['ride'])[:27]:<28}{result['windows']:>8}{result['impacts']:>8}"
+              f"{result['impacts_detected']:>9}{result['impacts_missed']:>7}"
+              f"{result['false_detections']:>6}{_ms(latency['p50']):>8}{rate:>9.0f}")
+
+    latency = summary['latency_ms']
+    print(f"\n{summary['rides']} rides, {summary['ride_seconds'] / 60:.1f} min of riding, "
+          f"{summary['windows']} windows in {summary['wall_seconds']:.2f} s")
+    print(f"  Impacts: {summary['impacts']} ({summary['impacts_detected']} detected, "
+          f"{summary['impacts_missed']} missed), {summary['false_detections']} false detections")
+    print(f"  Impact to detection: p50 {_ms(latency['p50'])} ms, p90 {_ms(latency['p90'])} ms, "
+          f"p99 {_ms(latency['p99'])} ms")
+    print(f"  Throughput: {summary['windows_per_second']:.0f} windows/s end to end, "
+          f"{summary['compute_windows_per_second']:.0f} windows/s compute "
+          f"({summary['feature_us_per_window']:.1f} us features + "
+          f"{summary['model_us_per_window']:.1f} us model)")
+    print(f"  CPU per second of riding: {summary['compute_ms_per_ride_second']:.3f} ms")
+    if summary['queue_delay_ms']['p50'] is not None:
+        queue = summary['queue_delay_ms']
+        print(f"  Window closed to scored: p50 {queue['p50']:.3f} ms, p99 {queue['p99']:.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay SimRa rides through the exported model")
+    parser.add_argument('rides', nargs='*',
+                        help="ride files or Rides directories (year/month/ride files)")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="pothole_forest.npz from the trainer")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="release rows at this multiple of real time (default: as fast as possible)")
+    parser.add_argument('--threshold', type=float, default=DETECTION_THRESHOLD)
+    parser.add_argument('--cooldown-ms', type=int, default=DETECTION_COOLDOWN_MS)
+    parser.add_argument('--max-rides', type=int, default=None)
+    parser.add_argument('--synthetic', type=int, default=None, metavar='RIDES',
+                        help="replay this many synthetic rides (see simra_synth.py) instead")
+    parser.add_argument('--rows', type=int, default=20000, help="average rows per synthetic ride")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--report', default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        print(f"Error: Model not found at {args.model}")
+        print("Please run train_pothole_model.py first.")
+        sys.exit(1)
+    flat = forest_export.load_flat_forest(args.model)
+    stats = forest_export.forest_stats(flat)
+    print(f"Model: {args.model} ({stats['trees']} trees, {stats['nodes']} nodes)")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.synthetic:
+            ride_paths = simra_synth.write_corpus(work_dir, args.synthetic, args.rows, seed=args.seed)
+        else:
+            ride_paths = []
+            for path in args.rides:
+                if os.path.isdir(path):
+                    ride_paths.extend(ride_path for _, ride_path in miner.list_ride_files(path))
+                else:
+                    ride_paths.append(path)
+        ride_paths = ride_paths[:args.max_rides]
+        if not ride_paths:
+            parser.error("no rides to replay (give ride files, a Rides directory or --synthetic)")
+
+        mode = f"{args.speed:g}x real time" if args.speed else "as fast as possible"
+        print(f"Replaying {len(ride_paths)} rides {mode}\n")
+        results, wall_seconds = replay_rides(ride_paths, flat, args.threshold, args.cooldown_ms,
+                                             args.speed)
+
+    summary = summarize(results, wall_seconds)
+    print_report(results, summary)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({
+                'environment': miner.environment(),
+                'model': {'path': args.model, **stats, 'quantization': flat.get('quantization')},
+                'settings': {
+                    'speed': args.speed,
+                    'threshold': args.threshold,
+                    'cooldown_ms': args.cooldown_ms,
+                    'synthetic': {'rides': args.synthetic, 'rows': args.rows, 'seed': args.seed}
+                    if args.synthetic else None,
+                },
+                'summary': summary,
+                'rides': results,
+            }, f, indent=2)
+        print(f"\nReport saved to: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
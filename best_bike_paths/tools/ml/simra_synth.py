@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Synthetic SimRa Ride Generator
+Writes ride files in the SimRa format so the mining pipeline can be run and
+benchmarked without the real Berlin dataset.
+
+Each file has the same layout as a real SimRa ride:
+1. Incident section (version line, header, one row per incident)
+2. The ========================= separator
+3. Ride section (version line, header, 22-column sensor rows)
+
+Riding is simulated as gravity plus noise on the Z axis with occasional
+pothole impacts (short Z spikes); every impact can also be reported as an
+incident. Output is fully determined by the seed.
+
+Usage:
+  python simra_synth.py OUTPUT_DIR --rides 200 --rows 20000
+writes a Rides/year/month/VM2_<n> tree like the SimRa dataset.
+"""
+
+import os
+import random
+import shutil
+import argparse
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy is required. Install it with:")
+    print("  pip install numpy")
+    exit(1)
+
+INCIDENT_HEADER = ('key,lat,lon,ts,bike,childCheckBox,trailerCheckBox,pLoc,incident,'
+                   'i1,i2,i3,i4,i5,i6,i7,i8,i9,scary,desc,i10')
+RIDE_HEADER = ('lat,lon,X,Y,Z,timeStamp,acc,a,b,c,obsDistanceLeft1,obsDistanceLeft2,'
+               'obsDistanceRight1,obsDistanceRight2,obsClosePassEvent,XL,YL,ZL,RX,RY,RZ,RC')
+SEPARATOR = '========================='
+
+GRAVITY = 9.81
+SAMPLE_INTERVAL_MS = 40  # ~25 Hz accelerometer, like SimRa recordings
+GPS_EVERY = 75           # One GPS fix every ~3 seconds
+IMPACT_SAMPLES = 4       # Rows affected by one pothole impact
+START_TS = 1711210440000
+START_LAT = 52.5200
+START_LON = 13.4050
+
+ROWS_PER_BLOCK = 10000
+CORPUS_MONTHS = ['2024/04', '2024/05', '2024/06']
+RIDE_LENGTH_SPREAD = 0.5  # Corpus rides are rows * (1 +/- spread) long
+
+
+def write_ride(path, n_rows, seed=0, pothole_rate=0.5, impact_amplitude=9.0,
+               impact_samples=IMPACT_SAMPLES, incident_fraction=0.5, start_ts=START_TS):
+    """
+    Write one synthetic ride of n_rows sensor rows to path.
+
+    The rider follows a slow random walk starting in Berlin.
+    pothole_rate is the expected number of pothole impacts per minute of
+    riding, each a Z spike of impact_amplitude m/s² decaying over
+    impact_samples rows; incident_fraction of them are also listed in the
+    incident section. Rows are generated and written in blocks, so long rides do not
+    need much memory. Returns the list of impacts as (timestamp, lat, lon).
+    """
+    rng = np.random.default_rng(seed)
+
+    n_minutes = n_rows * SAMPLE_INTERVAL_MS / 60000.0
+    n_impacts = int(rng.poisson(pothole_rate * n_minutes))
+    impact_rows = np.sort(rng.choice(max(n_rows - impact_samples, 1),
+                                     size=min(n_impacts, max(n_rows - impact_samples, 1)),
+                                     replace=False))
+
+    tmp_path = path + '.tmp'
+    impacts = []
+    with open(tmp_path, 'w') as f:
+        # Ride body goes to the temp file first: the incident section needs
+        # the impact positions, which are only known while writing rows
+        lat, lon = START_LAT, START_LON
+        ts = start_ts
+        next_impact = 0
+        for block_start in range(0, n_rows, ROWS_PER_BLOCK):
+            n = min(ROWS_PER_BLOCK, n_rows - block_start)
+            steps = rng.integers(SAMPLE_INTERVAL_MS - 5, SAMPLE_INTERVAL_MS + 6, size=n)
+            timestamps = ts + np.cumsum(steps)
+            ts = int(timestamps[-1])
+            x = rng.normal(0.0, 0.8, size=n)
+            y = rng.normal(0.0, 0.8, size=n)
+            z = GRAVITY + rng.normal(0.0, 0.6, size=n)
+            linear = rng.normal(0.0, 0.3, size=(n, 3))
+            rotation = rng.normal(0.0, 0.05, size=(n, 4))
+
+            # Position only changes on the rows carrying a GPS fix
+            has_fix = (block_start + np.arange(n)) % GPS_EVERY == 0
+            lats = lat + np.cumsum(np.where(has_fix, rng.normal(0.0, 0.0002, size=n), 0.0))
+            lons = lon + np.cumsum(np.where(has_fix, rng.normal(0.0, 0.0003, size=n), 0.0))
+            lat, lon = float(lats[-1]), float(lons[-1])
+
+            while next_impact < len(impact_rows) and impact_rows[next_impact] < block_start + n:
+                row = int(impact_rows[next_impact]) - block_start
+                sign = 1.0 if rng.random() < 0.7 else -1.0
+                span = slice(row, min(row + impact_samples, n))
+                z[span] += sign * impact_amplitude * np.linspace(1.0, 0.4, span.stop - span.start)
+                impacts.append((int(timestamps[row]), float(lats[row]), float(lons[row])))
+                next_impact += 1
+
+            accuracy = rng.uniform(3.0, 12.0, size=n)
+
+            lines = []
+            for k in range(n):
+                if has_fix[k]:
+                    gps = f'{lats[k]:.8f},{lons[k]:.8f}'
+                    acc = f'{accuracy[k]:.1f}'
+                else:
+                    gps = ','
+                    acc = ''
+                xl, yl, zl = linear[k]
+                rx, ry, rz, rc = rotation[k]
+                lines.append(
+                    f'{gps},{x[k]:.7g},{y[k]:.7g},{z[k]:.7g},{timestamps[k]},{acc},,,,,,,,,'
+                    f'{xl:.7g},{yl:.7g},{zl:.7g},{rx:.7g},{ry:.7g},{rz:.7g},{rc:.7g}'
+                )
+            f.write('\n'.join(lines))
+            f.write('\n')
+
+    # Report a deterministic subset of the impacts as incidents
+    picker = random.Random(seed)
+    incident_lines = []
+    for key, (impact_ts, impact_lat, impact_lon) in enumerate(impacts):
+        if picker.random() < incident_fraction:
+            incident_type = picker.choice([1, 2, 3, 4, 5, 6, 7, 8])
+            incident_lines.append(
+                f'{key},{impact_lat:.8f},{impact_lon:.8f},{impact_ts},0,0,0,0,{incident_type},'
+                f'0,0,0,0,0,0,0,0,0,0,,0'
+            )
+    if not incident_lines:
+        # SimRa writes a dummy incident (type 0) for rides without incidents
+        incident_lines.append(f'0,{START_LAT:.8f},{START_LON:.8f},{start_ts},0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,,0')
+
+    with open(path, 'w') as out:
+        out.write('61#2\n')
+        out.write(INCIDENT_HEADER + '\n')
+        out.write('\n'.join(incident_lines) + '\n\n')
+        out.write(SEPARATOR + '\n')
+        out.write('61#2\n')
+        out.write(RIDE_HEADER + '\n')
+        with open(tmp_path) as body:
+            shutil.copyfileobj(body, out)
+    os.remove(tmp_path)
+
+    return impacts
+
+
+def write_corpus(output_dir, n_rides, rows_per_ride, seed=0, months=CORPUS_MONTHS, **ride_options):
+    """
+    Write n_rides synthetic rides as output_dir/year/month/VM2_<n>.
+
+    Rides are spread round-robin over months and their lengths vary by
+    RIDE_LENGTH_SPREAD around rows_per_ride. ride_options are passed on to
+    write_ride. Returns the list of ride paths.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n_rides):
+        month_dir = os.path.join(output_dir, *months[i % len(months)].split('/'))
+        os.makedirs(month_dir, exist_ok=True)
+        path = os.path.join(month_dir, f'VM2_{100000 + i}')
+        n_rows = max(1, int(rows_per_ride * rng.uniform(1 - RIDE_LENGTH_SPREAD, 1 + RIDE_LENGTH_SPREAD)))
+        write_ride(path, n_rows, seed=seed * 1000003 + i,
+                   start_ts=START_TS + i * 3600 * 1000, **ride_options)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic SimRa ride corpus")
+    parser.add_argument('output', help="Rides directory to create (year/month/ride files)")
+    parser.add_argument('--rides', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=20000, help="average sensor rows per ride")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pothole-rate', type=float, default=0.5,
+                        help="expected pothole impacts per minute of riding")
+    parser.add_argument('--impact-amplitude', type=float, default=9.0,
+                        help="Z spike of an impact in m/s²")
+    parser.add_argument('--impact-samples', type=int, default=IMPACT_SAMPLES,
+                        help="rows one impact spans")
+    parser.add_argument('--incident-fraction', type=float, default=0.5,
+                        help="share of impacts reported in the incident section")
+    args = parser.parse_args(argv)
+
+    paths = write_corpus(args.output, args.rides, args.rows, seed=args.seed,
+                         pothole_rate=args.pothole_rate,
+                         impact_amplitude=args.impact_amplitude,
+                         impact_samples=args.impact_samples,
+                         incident_fraction=args.incident_fraction)
+    print(f"Wrote {len(paths)} rides to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
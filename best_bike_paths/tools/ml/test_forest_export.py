@@ -0,0 +1,91 @@
+"""Parity tests of the flat forest export against scikit-learn."""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import forest_compress
+import forest_export
+from forest_export import PARITY_TOLERANCE, VALUE_CODE_SCALE
+
+FEATURE_NAMES = ['f0', 'f1', 'f2', 'f3', 'f4']
+FLOAT32_VALUE_ERROR = 2.0 ** -24  # Relative rounding of a leaf value to float32
+INT16_VALUE_ERROR = 0.5 / VALUE_CODE_SCALE
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(2000, len(FEATURE_NAMES))).astype(np.float32)
+    noise = rng.normal(scale=0.8, size=len(X))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + noise > 0).astype(np.int8)
+    model = RandomForestClassifier(n_estimators=12, max_depth=8, min_samples_leaf=2,
+                                   random_state=0).fit(X[:1500], y[:1500])
+    return model, forest_export.flatten_forest(model, FEATURE_NAMES), X[1500:]
+
+
+def sklearn_probability(model, X):
+    return model.predict_proba(X)[:, list(model.classes_).index(forest_export.POTHOLE_CLASS)]
+
+
+def test_predict_proba_flat_matches_sklearn(fitted):
+    model, flat, X = fitted
+    difference = np.abs(forest_export.predict_proba_flat(flat, X) - sklearn_probability(model, X))
+    assert difference.max() <= PARITY_TOLERANCE
+    report = forest_export.parity_report(model, flat, X)
+    assert report['passed'] and report['class_mismatches'] == 0
+
+
+def test_scalar_evaluator_matches_sklearn(fitted):
+    model, flat, X = fitted
+    predict = forest_export.scalar_evaluator(flat)
+    scalar = np.array([predict(row) for row in X.astype(np.float64).tolist()])
+    assert np.abs(scalar - sklearn_probability(model, X)).max() <= PARITY_TOLERANCE
+
+
+def test_float32_quantized_round_trip(fitted, tmp_path):
+    model, flat, X = fitted
+    path = tmp_path / 'forest.npz'
+    forest_export.save_flat_forest(forest_compress.quantize_forest(flat, 'float32'), path)
+    quantized = forest_export.load_flat_forest(path)
+    assert quantized['quantization'] == 'float32'
+
+    # Thresholds split float32 features exactly as before; only leaf values are rounded
+    expected = sklearn_probability(model, X)
+    for probability in (forest_export.predict_proba_flat(quantized, X),
+                        [forest_export.scalar_evaluator(quantized)(row) for row in X.tolist()]):
+        error = np.abs(np.asarray(probability) - expected).max()
+        assert error <= FLOAT32_VALUE_ERROR + PARITY_TOLERANCE
+
+
+def test_int16_quantized_round_trip(fitted, tmp_path):
+    model, flat, X = fitted
+    path = tmp_path / 'forest.npz'
+    forest_export.save_flat_forest(forest_compress.quantize_forest(flat, 'int16'), path)
+    quantized = forest_export.load_flat_forest(path)
+    assert quantized['quantization'] == 'int16'
+    assert quantized['threshold_code'].dtype == np.int16
+
+    # Each threshold moves by at most half a code step of its feature
+    split = np.flatnonzero(flat['feature'] != forest_export.LEAF)
+    scale = quantized['threshold_scale'][flat['feature'][split]]
+    moved = np.abs(quantized['threshold'][split] - flat['threshold'][split])
+    assert np.all(moved <= scale / 2 + 1e-12)
+    np.testing.assert_array_equal(quantized['value'], quantized['value_code'] / VALUE_CODE_SCALE)
+
+    # Rows further than a code step from every threshold take the same paths,
+    # so they differ from sklearn only by the leaf value rounding
+    safe = np.ones(len(X), dtype=bool)
+    for f in range(len(FEATURE_NAMES)):
+        thresholds = flat['threshold'][split[flat['feature'][split] == f]]
+        if thresholds.size:
+            distance = np.abs(X[:, f, None].astype(np.float64) - thresholds[None, :]).min(axis=1)
+            safe &= distance > quantized['threshold_scale'][f]
+    assert safe.mean() > 0.9
+
+    expected = sklearn_probability(model, X[safe])
+    predict = forest_export.scalar_evaluator(quantized)
+    for probability in (forest_export.predict_proba_flat(quantized, X[safe]),
+                        [predict(row) for row in X[safe].tolist()]):
+        error = np.abs(np.asarray(probability) - expected).max()
+        assert error <= INT16_VALUE_ERROR + PARITY_TOLERANCE
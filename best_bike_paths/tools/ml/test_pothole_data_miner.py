@@ -0,0 +1,46 @@
+"""Tests of the miner's columnar sensor block parser."""
+
+import numpy as np
+
+import pothole_data_miner as miner
+
+N_COLS = 18
+
+
+def sensor_row(i, fields=N_COLS):
+    values = [f'{52 + i * 1e-5:.7f}', f'{13 + i * 1e-5:.7f}', f'{0.1 * i:.3f}', '-0.2',
+              f'{9.81 + (i % 7) * 0.01:.3f}', str(1700000000000 + 10 * i)]
+    values += [''] * 9 + ['0.5', '-0.5', '1.5']
+    return ','.join((values + ['7'] * fields)[:fields]).encode()
+
+
+def line_parse(block):
+    matrix = miner._parse_sensor_lines(block)
+    z = matrix[:, miner.RIDE_COLUMNS.index('z')]
+    ts = matrix[:, miner.RIDE_COLUMNS.index('ts')]
+    return matrix[~np.isnan(z) & ~np.isnan(ts)]
+
+
+def test_regular_block_matches_line_parser():
+    block = b'\n'.join(sensor_row(i) for i in range(50))
+    assert miner._parse_sensor_fields(block, N_COLS) is not None
+    np.testing.assert_array_equal(miner.parse_sensor_block(block, N_COLS), line_parse(block))
+
+
+def test_row_with_empty_fields_matches_line_parser():
+    rows = [sensor_row(i) for i in range(10)]
+    rows[3] = b',,,,,1700000000030' + b',' * (N_COLS - 6)
+    rows[4] = rows[4].replace(b',9.85', b',')
+    block = b'\n'.join(rows)
+    np.testing.assert_array_equal(miner.parse_sensor_block(block, N_COLS), line_parse(block))
+
+
+def test_extra_and_missing_fields_do_not_cancel_out():
+    rows = [sensor_row(i) for i in range(10)]
+    rows[2] = sensor_row(2, N_COLS + 1)
+    rows[7] = sensor_row(7, N_COLS - 1)
+    block = b'\n'.join(rows)
+    # Same total comma count as a regular block
+    assert block.count(b',') == len(rows) * (N_COLS - 1)
+    assert miner._parse_sensor_fields(block, N_COLS) is None
+    np.testing.assert_array_equal(miner.parse_sensor_block(block, N_COLS), line_parse(block))
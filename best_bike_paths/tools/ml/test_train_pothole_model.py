@@ -0,0 +1,53 @@
+"""Tests of the trainer's training cache."""
+
+import json
+import os
+
+import numpy as np
+
+import train_pothole_model as trainer
+
+HEADER = trainer.FEATURE_COLUMNS + ['sample_count', 'lat', 'lon', 'timestamp', 'label']
+
+
+MAX_ROWS = 1000
+
+
+def write_dataset(dataset_dir, rows, seed=0):
+    """Synthetic training_data_samples.csv; the same seed gives the same leading rows."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 2, MAX_ROWS)[:rows]
+    features = rng.normal(size=(MAX_ROWS, len(trainer.FEATURE_COLUMNS)))[:rows] + labels[:, None]
+    os.makedirs(dataset_dir, exist_ok=True)
+    with open(os.path.join(dataset_dir, 'training_data_samples.csv'), 'w') as f:
+        f.write(','.join(HEADER) + '\n')
+        for values, label in zip(features, labels):
+            f.write(','.join(f'{v:.6f}' for v in values) +
+                    f",20,45.46,9.19,0,{'pothole' if label else 'normal'}\n")
+
+
+def train(dataset_dir, output_dir, *extra):
+    trainer.main(['--dataset', str(dataset_dir), '--output', str(output_dir), *extra])
+    with open(os.path.join(output_dir, 'model_metadata.json')) as f:
+        return json.load(f)
+
+
+def test_plain_run_after_incremental_trains_from_scratch(tmp_path):
+    dataset, output = tmp_path / 'dataset', tmp_path / 'model'
+    write_dataset(dataset, 400)
+    base = train(dataset, output)
+    assert base['n_estimators'] == trainer.DEFAULT_PARAMS['n_estimators']
+
+    write_dataset(dataset, 500)
+    grown = train(dataset, output, '--incremental', '--incremental-trees', '15')
+    assert grown['n_estimators'] == trainer.DEFAULT_PARAMS['n_estimators'] + 15
+    assert grown['incremental']['base_rows'] == 400
+    os.remove(os.path.join(output, 'model_metadata.json'))
+    assert train(dataset, output, '--incremental') == grown
+
+    plain = train(dataset, output)
+    assert plain['n_estimators'] == trainer.DEFAULT_PARAMS['n_estimators']
+    assert 'incremental' not in plain
+    assert plain['cv_scores'] is not None
+    os.remove(os.path.join(output, 'model_metadata.json'))
+    assert train(dataset, output) == plain
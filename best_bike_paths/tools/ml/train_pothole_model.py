@@ -7,17 +7,49 @@ This script:
 1. Loads the mined dataset
 2. Trains a RandomForest model
 3. Evaluates accuracy
-4. Exports the model as Dart code (if/else rules) for edge computing
+4. Exports the model as Dart code (flat node arrays plus a small evaluator,
+   see forest_export.py) for edge computing
+
+With --search it first scores a grid of forest sizes (tree count, depth,
+leaf size) on CV accuracy over the training rows, exported size and
+per-window latency, reports
+the Pareto frontier and trains the best candidate within the given
+--latency-budget-us / --size-budget-kb.
+
+--drop-trees, --merge-leaves and --quantize compress the trained forest
+before export (see forest_compress.py); the accuracy cost of every stage
+is printed and recorded in the metadata. Trees are dropped on a
+validation split held out of the training rows.
+
+--distill exports a single shallow tree or a lookup table over the top
+features, trained to imitate the forest (see forest_distill.py), instead
+of the forest itself.
+
+Runs are cached by data fingerprint and settings (see TrainingCache): a
+repeat run restores the exported files without training, and with
+--incremental a dataset that only gained rows grows the cached forest
+with warm_start instead of training from scratch.
 """
 
 import os
+import io
 import csv
+import math
 import json
+import time
+import pickle
+import shutil
+import hashlib
 import random
+import argparse
+import itertools
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Try to import sklearn, provide helpful message if not installed
 try:
+    import sklearn
     from sklearn.ensemble import RandomForestClassifier
     from sklearn.model_selection import train_test_split, cross_val_score
     from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
@@ -27,19 +59,44 @@ except ImportError:
     print("  pip install scikit-learn numpy")
     exit(1)
 
-# Try to import m2cgen for model export
-try:
-    import m2cgen as m2c
-    HAS_M2CGEN = True
-except ImportError:
-    HAS_M2CGEN = False
-    print("Warning: m2cgen not installed. Model export to Dart will use manual conversion.")
-    print("  Install with: pip install m2cgen")
+import forest_export
+import forest_compress
+import forest_distill
 
 # Configuration
 DATASET_PATH = "/Users/rahul/Desktop/NayakXXX/best_bike_paths/tools/ml/dataset"
 OUTPUT_PATH = "/Users/rahul/Desktop/NayakXXX/best_bike_paths/tools/ml/model"
 
+# Forest used without --search ("keep small for mobile", see the search report)
+DEFAULT_PARAMS = {
+    'n_estimators': 50,
+    'max_depth': 10,
+    'min_samples_leaf': 2,
+}
+
+# Train/test split (kept stable so cached and incremental runs are comparable)
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+DROP_TREES_VALIDATION_SIZE = 0.2  # Share of the training rows --drop-trees scores trees on
+
+# Training cache (see TrainingCache)
+TRAIN_CACHE_VERSION = 2
+FINGERPRINT_BLOCK_ROWS = 1 << 20  # Rows hashed at once by data_fingerprint
+
+# Hyperparameter search grid and latency sample
+SEARCH_TREES = [10, 25, 50, 100]
+SEARCH_DEPTHS = [4, 6, 8, 10, 14]
+SEARCH_MIN_LEAF = [1, 2, 5, 10]
+SEARCH_CV_FOLDS = 5
+LATENCY_SAMPLE_WINDOWS = 500
+
+# CSV dataset loading
+CSV_CHUNK_BYTES = 16 << 20  # Text parsed at once by load_dataset
+CSV_BLOCKS_IN_FLIGHT_PER_WORKER = 2
+MISSING_POLICIES = ('drop', 'error')
+LABEL_CODES = {'pothole': 1, 'normal': 0}
+LABEL_VALUES = tuple(LABEL_CODES)
+
 # Features to use for training
 FEATURE_COLUMNS = [
     'z_mean', 'z_std', 'z_min', 'z_max', 'z_range',
@@ -48,83 +105,168 @@ FEATURE_COLUMNS = [
 ]
 
 
-def load_dataset(filepath):
-    """Load dataset from CSV."""
-    samples = []
-    with open(filepath, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            samples.append(row)
-    return samples
-
-
-def prepare_data(samples):
-    """Prepare features and labels for training."""
-    X = []
-    y = []
-    
-    for sample in samples:
-        features = []
-        valid = True
+def load_dataset(filepath, missing='drop', workers=1, chunk_bytes=CSV_CHUNK_BYTES):
+    """
+    Load the miner's CSV dataset as (X, y) without building per-row objects.
+    
+    Only FEATURE_COLUMNS and label are parsed, block by block (chunk_bytes
+    of text at a time), straight into preallocated float32/int8 arrays, so
+    memory stays at the size of the result plus a few blocks. With
+    workers > 1 and more than one block, blocks are parsed in a process
+    pool, at most workers * CSV_BLOCKS_IN_FLIGHT_PER_WORKER at a time.
+    
+    Rows with an empty or NaN feature are dropped (missing='drop') or
+    rejected (missing='error'); a label other than pothole/normal is
+    always an error.
+    """
+    if missing not in MISSING_POLICIES:
+        raise ValueError(f"Unknown missing value policy {missing!r}, expected one of {MISSING_POLICIES}")
+    if os.path.getsize(filepath) <= chunk_bytes:
+        workers = 1  # A single block: a pool would only add startup and pickling
+    
+    with open(filepath, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]))
+        absent = [col for col in FEATURE_COLUMNS + ['label'] if col not in header]
+        if absent:
+            raise ValueError(f"{filepath} is missing columns: {absent}")
+        usecols = [header.index(col) for col in FEATURE_COLUMNS + ['label']]
         
-        for col in FEATURE_COLUMNS:
-            try:
-                val = float(sample[col]) if sample[col] else 0.0
-                features.append(val)
-            except (ValueError, KeyError):
-                valid = False
-                break
+        # Upper bound of the row count; blank lines are skipped when parsing
+        data_start = f.tell()
+        capacity = 1
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            capacity += chunk.count(b'\n')
+        f.seek(data_start)
         
-        if valid:
-            X.append(features)
-            y.append(1 if sample['label'] == 'pothole' else 0)
-    
-    return np.array(X), np.array(y)
+        X = np.empty((capacity, len(FEATURE_COLUMNS)), dtype=np.float32)
+        y = np.empty(capacity, dtype=np.int8)
+        n = 0
+        dropped = 0
+        for features, labels in _parsed_csv_blocks(f, usecols, chunk_bytes, workers):
+            if (labels < 0).any():
+                raise ValueError(f"Labels other than {LABEL_VALUES} in {filepath}")
+            incomplete = np.isnan(features).any(axis=1)
+            if incomplete.any():
+                if missing == 'error':
+                    raise ValueError(f"{int(incomplete.sum())} rows with missing feature values "
+                                     f"in {filepath}")
+                dropped += int(incomplete.sum())
+                features, labels = features[~incomplete], labels[~incomplete]
+            
+            X[n:n + len(features)] = features
+            y[n:n + len(features)] = labels
+            n += len(features)
+    
+    if dropped:
+        print(f"Dropped {dropped} rows with missing feature values")
+    return X[:n], y[:n]
 
 
-def export_model_to_dart(model, feature_names, output_path):
-    """Export the trained model to Dart code."""
+def _parsed_csv_blocks(f, usecols, chunk_bytes, workers):
+    """(features, labels) of consecutive blocks of whole lines of f, in file order."""
+    rest = b''
+    
+    def blocks():
+        nonlocal rest
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            chunk = rest + chunk
+            cut = chunk.rfind(b'\n') + 1
+            rest = chunk[cut:]
+            if cut:
+                yield chunk[:cut]
+        if rest.strip():
+            yield rest + b'\n'
+    
+    if workers <= 1:
+        for block in blocks():
+            yield _parse_csv_block(block, usecols)
+        return
     
-    if HAS_M2CGEN:
-        # Use m2cgen for automatic conversion
-        dart_code = m2c.export_to_dart(model, function_name='predictPothole')
+    block_iter = blocks()
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(count):
+            for block in itertools.islice(block_iter, count):
+                pending.append(executor.submit(_parse_csv_block, block, usecols))
         
-        # Wrap in a Dart class
-        full_dart_code = f'''// AUTO-GENERATED FILE - DO NOT EDIT MANUALLY
-// Generated from SimRa Berlin pothole detection training data
-// Model: RandomForestClassifier
-
-/// Pothole detection model using Random Forest
-/// Features: {feature_names}
-class PotholeDetectionModel {{
-  
-  /// Predict if the sensor window indicates a pothole
-  /// Returns probability of pothole (0.0 to 1.0)
-  static double predictProbability(List<double> features) {{
-    // features order: {feature_names}
-    assert(features.length == {len(feature_names)}, 
-        'Expected {len(feature_names)} features, got ${{features.length}}');
-    
-    final score = predictPothole(features);
-    // Convert to probability (score is sum of tree votes)
-    return score.clamp(0.0, 1.0);
-  }}
-  
-  /// Returns true if pothole is detected (probability > 0.5)
-  static bool isPothole(List<double> features) {{
-    return predictProbability(features) > 0.5;
-  }}
-  
-  /// Feature names in order
-  static const List<String> featureNames = {feature_names};
-  
-{dart_code}
-}}
-'''
+        submit(workers * CSV_BLOCKS_IN_FLIGHT_PER_WORKER)
+        while pending:
+            result = pending.popleft().result()
+            submit(1)
+            yield result
+
+
+def _parse_csv_block(block, usecols):
+    """
+    Parse the usecols (features..., label) of a block of whole CSV lines.
+    
+    Returns float32 features with NaN for missing values and int8 label
+    codes (-1 for unknown labels).
+    """
+    if b'\r' in block:
+        block = block.replace(b'\r\n', b'\n')
+    while b'\n\n' in block:
+        block = block.replace(b'\n\n', b'\n')
+    
+    def parse(text):
+        return np.loadtxt(io.StringIO(text), delimiter=',', usecols=usecols, dtype=np.float32,
+                          converters={usecols[-1]: _label_code}, ndmin=2)
+    
+    try:
+        parsed = parse(block.decode('utf-8'))
+    except ValueError:
+        # Empty fields: parse again with them written as nan
+        block = b'\n' + block
+        block = block.replace(b'\n,', b'\nnan,').replace(b',\n', b',nan\n')
+        # Twice: one pass only fills every other field of a run of empties
+        block = block.replace(b',,', b',nan,').replace(b',,', b',nan,')
+        parsed = parse(block[1:].decode('utf-8'))
+    return parsed[:, :-1], parsed[:, -1].astype(np.int8)
+
+
+def _label_code(label):
+    return LABEL_CODES.get(label, -1)
+
+
+def load_binary_dataset(schema_file):
+    """
+    Load the miner's columnar binary dataset (see save_dataset in
+    pothole_data_miner.py) as (X, y).
+
+    The .npy files are memory-mapped, so no rows are parsed or copied: X is
+    a float32 view over the FEATURE_COLUMNS of the feature matrix and y the
+    int8 label vector (1 = pothole, 0 = normal).
+    """
+    with open(schema_file, 'r') as f:
+        schema = json.load(f)
+    if schema.get('format_version') != 1:
+        raise ValueError(f"Unsupported dataset format version: {schema.get('format_version')}")
+    
+    dataset_dir = os.path.dirname(schema_file)
+    features = np.load(os.path.join(dataset_dir, schema['features']['file']), mmap_mode='r')
+    labels = np.load(os.path.join(dataset_dir, schema['labels']['file']), mmap_mode='r')
+    if features.shape[0] != schema['rows'] or labels.shape[0] != schema['rows']:
+        raise ValueError(f"Dataset files do not match the {schema['rows']} rows in {schema_file}")
+    
+    columns = schema['features']['columns']
+    missing = [col for col in FEATURE_COLUMNS if col not in columns]
+    if missing:
+        raise ValueError(f"Dataset is missing feature columns: {missing}")
+    
+    indices = [columns.index(col) for col in FEATURE_COLUMNS]
+    if indices == list(range(indices[0], indices[0] + len(indices))):
+        X = features[:, indices[0]:indices[0] + len(indices)]
     else:
-        # Manual conversion for simple model
-        dart_code = generate_simple_dart_model(model, feature_names)
-        full_dart_code = dart_code
+        X = features[:, indices]  # Reordered columns need a copy
+    return X, labels
+
+
+def export_model_to_dart(model, feature_names, output_path, flat=None,
+                         model_name='RandomForestClassifier'):
+    """Export the trained model to Dart code (flat node arrays, see forest_export.py)."""
+    if flat is None:
+        flat = forest_export.flatten_forest(model, feature_names)
+    full_dart_code = forest_export.dart_source(flat, feature_names, model_name)
     
     # Save to file
     os.makedirs(output_path, exist_ok=True)
@@ -137,85 +279,16 @@ class PotholeDetectionModel {{
     return dart_file
 
 
-def generate_simple_dart_model(model, feature_names):
-    """Generate a simple Dart model using feature importance thresholds."""
-    
-    # Get feature importances
-    importances = model.feature_importances_
-    
-    # Get the most important features
-    important_indices = np.argsort(importances)[::-1][:5]
-    
-    dart_code = f'''// AUTO-GENERATED FILE - DO NOT EDIT MANUALLY
-// Generated from SimRa Berlin pothole detection training data
-// Simplified threshold-based model
-
-/// Pothole detection model using feature thresholds
-/// Features: {feature_names}
-class PotholeDetectionModel {{
-  
-  // Feature indices
-'''
-    
-    for i, name in enumerate(feature_names):
-        dart_code += f"  static const int _{name.upper()} = {i};\n"
-    
-    dart_code += f'''
-  
-  /// Feature importance (from training)
-  static const List<double> featureImportance = {list(importances)};
-  
-  /// Predict probability of pothole
-  static double predictProbability(List<double> features) {{
-    assert(features.length == {len(feature_names)}, 
-        'Expected {len(feature_names)} features, got ${{features.length}}');
-    
-    double score = 0.0;
-    
-    // Z-axis range (most important - high range = pothole)
-    final zRange = features[_Z_RANGE];
-    if (zRange > 10.0) score += 0.4;
-    else if (zRange > 7.0) score += 0.25;
-    else if (zRange > 5.0) score += 0.1;
-    
-    // Z-axis standard deviation (high variance = pothole)
-    final zStd = features[_Z_STD];
-    if (zStd > 3.0) score += 0.3;
-    else if (zStd > 2.0) score += 0.15;
-    else if (zStd > 1.5) score += 0.05;
-    
-    // Z-axis max (spike detection)
-    final zMax = features[_Z_MAX];
-    if (zMax > 15.0) score += 0.2;
-    else if (zMax > 13.0) score += 0.1;
-    
-    // Z-axis min (drop detection)
-    final zMin = features[_Z_MIN];
-    if (zMin < 5.0) score += 0.2;
-    else if (zMin < 7.0) score += 0.1;
-    
-    // X/Y axis instability (lateral movement)
-    final xRange = features[_X_RANGE];
-    final yRange = features[_Y_RANGE];
-    if (xRange > 5.0 || yRange > 5.0) score += 0.1;
-    
-    return score.clamp(0.0, 1.0);
-  }}
-  
-  /// Returns true if pothole is detected (probability > threshold)
-  static bool isPothole(List<double> features, {{double threshold = 0.5}}) {{
-    return predictProbability(features) > threshold;
-  }}
-  
-  /// Feature names in order
-  static const List<String> featureNames = {feature_names};
-}}
-'''
-    
-    return dart_code
-
-
-def export_model_metadata(model, accuracy, report, output_path):
+def export_flat_forest(flat, output_path):
+    """Save the flat forest arrays for Python tools (forest_export.load_flat_forest)."""
+    os.makedirs(output_path, exist_ok=True)
+    flat_file = os.path.join(output_path, 'pothole_forest.npz')
+    forest_export.save_flat_forest(flat, flat_file)
+    print(f"Flat forest saved to: {flat_file}")
+    return flat_file
+
+
+def export_model_metadata(model, accuracy, report, output_path, export_info=None):
     """Export model metadata and performance metrics."""
     
     metadata = {
@@ -228,6 +301,8 @@ def export_model_metadata(model, accuracy, report, output_path):
         'feature_importances': dict(zip(FEATURE_COLUMNS, model.feature_importances_.tolist())),
         'classification_report': report
     }
+    if export_info:
+        metadata.update(export_info)
     
     os.makedirs(output_path, exist_ok=True)
     meta_file = os.path.join(output_path, 'model_metadata.json')
@@ -236,59 +311,560 @@ def export_model_metadata(model, accuracy, report, output_path):
         json.dump(metadata, f, indent=2)
     
     print(f"Model metadata saved to: {meta_file}")
+    return meta_file
+
+
+def build_model(params, n_jobs=-1):
+    """RandomForestClassifier with the given tree count, depth and leaf size."""
+    return RandomForestClassifier(
+        n_estimators=params['n_estimators'],
+        max_depth=params['max_depth'],
+        min_samples_split=5,
+        min_samples_leaf=params['min_samples_leaf'],
+        random_state=42,
+        n_jobs=n_jobs
+    )
+
+
+_search_data = None
+
+
+def _init_search_worker(X, y):
+    global _search_data
+    _search_data = X, y
+
+
+def _evaluate_candidate(params):
+    """CV accuracy and exported size of one candidate (runs in a worker process)."""
+    X, y = _search_data
+    model = build_model(params, n_jobs=1)
+    cv_scores = cross_val_score(model, X, y, cv=SEARCH_CV_FOLDS)
+    model.fit(X, y)
+    flat = forest_export.flatten_forest(model, FEATURE_COLUMNS)
+    dart_bytes = len(forest_export.dart_source(flat, FEATURE_COLUMNS).encode())
+    return {
+        'params': params,
+        'cv_accuracy': float(cv_scores.mean()),
+        'cv_std': float(cv_scores.std()),
+        'size_bytes': dart_bytes,
+        **forest_export.forest_stats(flat),
+    }, flat
+
+
+def hyperparameter_search(X, y, grid, workers):
+    """
+    Score every combination of the grid on accuracy, size and latency.
+
+    Cross-validation and fitting run in worker processes. Latency is then
+    measured in this process, one candidate at a time, on a fixed sample of
+    windows so that the numbers are comparable.
+    """
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    print(f"Searching {len(candidates)} candidates with {workers} worker processes...")
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                             initargs=(np.asarray(X), np.asarray(y))) as executor:
+        evaluated = list(executor.map(_evaluate_candidate, candidates))
+    
+    rng = np.random.default_rng(42)
+    sample = np.asarray(X)[rng.permutation(len(X))[:LATENCY_SAMPLE_WINDOWS]]
+    results = []
+    for result, flat in evaluated:
+        result.update(forest_export.measure_latency(flat, sample))
+        results.append(result)
+    
+    mark_pareto(results)
+    return results
+
+
+def mark_pareto(results):
+    """Flag candidates no other candidate beats on accuracy, size and latency at once."""
+    def dominates(a, b):
+        no_worse = (a['cv_accuracy'] >= b['cv_accuracy'] and a['size_bytes'] <= b['size_bytes']
+                    and a['latency_us'] <= b['latency_us'])
+        better = (a['cv_accuracy'] > b['cv_accuracy'] or a['size_bytes'] < b['size_bytes']
+                  or a['latency_us'] < b['latency_us'])
+        return no_worse and better
+    
+    for result in results:
+        result['pareto'] = not any(dominates(other, result) for other in results)
+
+
+def select_candidate(results, latency_budget_us=None, size_budget_bytes=None):
+    """Most accurate candidate within the budgets (smallest, then fastest on ties), or None."""
+    within = [
+        result for result in results
+        if (latency_budget_us is None or result['latency_us'] <= latency_budget_us)
+        and (size_budget_bytes is None or result['size_bytes'] <= size_budget_bytes)
+    ]
+    if not within:
+        return None
+    return max(within, key=lambda result: (result['cv_accuracy'], -result['size_bytes'],
+                                           -result['latency_us']))
+
+
+def print_search_report(results):
+    print("\nPareto frontier (accuracy vs. size vs. latency):")
+    print(f"  {'trees':>5} {'depth':>5} {'leaf':>4} {'cv_acc':>7} {'size_kb':>8} "
+          f"{'nodes':>6} {'latency_us':>10} {'visited':>7}")
+    frontier = sorted((result for result in results if result['pareto']),
+                      key=lambda result: result['size_bytes'])
+    for result in frontier:
+        params = result['params']
+        print(f"  {params['n_estimators']:>5} {str(params['max_depth']):>5} "
+              f"{params['min_samples_leaf']:>4} {result['cv_accuracy']:>7.3f} "
+              f"{result['size_bytes'] / 1024:>8.1f} {result['nodes']:>6} "
+              f"{result['latency_us']:>10.1f} {result['nodes_visited']:>7.1f}")
 
 
-def main():
+def save_search_report(results, selected, budgets, output_path):
+    os.makedirs(output_path, exist_ok=True)
+    report_file = os.path.join(output_path, 'hyperparameter_search.json')
+    with open(report_file, 'w') as f:
+        json.dump({
+            'cv_folds': SEARCH_CV_FOLDS,
+            'latency_sample_windows': LATENCY_SAMPLE_WINDOWS,
+            'latency_note': 'Python port of the exported Dart evaluator; compare candidates, '
+                            'not absolute on-device numbers',
+            'budgets': budgets,
+            'selected': selected['params'] if selected else None,
+            'candidates': results,
+        }, f, indent=2)
+    print(f"\nSearch report saved to: {report_file}")
+    return report_file
+
+
+def dataset_files(dataset_path):
+    """
+    The dataset files the trainer would read from dataset_path, preferring
+    the binary format over CSV, or None if there is no dataset.
+    """
+    schema_file = os.path.join(dataset_path, "training_data_schema.json")
+    if os.path.exists(schema_file):
+        with open(schema_file, 'r') as f:
+            schema = json.load(f)
+        return [schema_file] + [os.path.join(dataset_path, schema[part]['file'])
+                                for part in ('features', 'labels')]
+    dataset_file = os.path.join(dataset_path, "training_data_samples.csv")
+    if os.path.exists(dataset_file):
+        return [dataset_file]
+    return None
+
+
+def data_fingerprint(X, y):
+    """SHA-256 of the training data as float32 features and int8 labels."""
+    digest = hashlib.sha256(f"{X.shape}".encode())
+    for start in range(0, len(X), FINGERPRINT_BLOCK_ROWS):
+        digest.update(np.ascontiguousarray(X[start:start + FINGERPRINT_BLOCK_ROWS],
+                                           dtype=np.float32).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.int8).tobytes())
+    return digest.hexdigest()
+
+
+def training_settings(args):
+    """Everything besides the data that determines a training run's output."""
+    settings = {
+        'cache_version': TRAIN_CACHE_VERSION,
+        'sklearn': sklearn.__version__,
+        'features': FEATURE_COLUMNS,
+        'missing': args.missing,
+        'split': {
+            'test_size': TEST_SIZE,
+            'validation_size': DROP_TREES_VALIDATION_SIZE if args.drop_trees is not None else 0.0,
+            'seed': SPLIT_SEED,
+        },
+        'distill': {
+            'mode': args.distill,
+            'depth': args.distill_depth,
+            'features': args.distill_features,
+            'bins': args.distill_bins,
+        } if args.distill else None,
+        'compression': {
+            'drop_trees': args.drop_trees,
+            'merge_leaves': args.merge_leaves,
+            'quantize': args.quantize,
+        },
+    }
+    if args.search:
+        settings['search'] = {
+            'n_estimators': args.search_trees,
+            'max_depth': args.search_depths,
+            'min_samples_leaf': args.search_min_leaf,
+            'latency_budget_us': args.latency_budget_us,
+            'size_budget_kb': args.size_budget_kb,
+        }
+    else:
+        settings['params'] = DEFAULT_PARAMS
+    return settings
+
+
+def _sha256_json(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class TrainingCache:
+    """
+    Content-addressed cache of training runs.
+    
+    A run is keyed by the hash of its data fingerprint and its
+    training_settings(); a forest grown by --incremental also has its
+    lineage (base entry and trees added) in the settings, so only
+    incremental runs restore it. entries/<key>/ holds the fitted model (model.pkl)
+    and the exported artifacts; manifest.json records every entry's rows,
+    parameters and CV scores. The manifest also maps each set of dataset
+    files, by size and mtime, to its data fingerprint, so an unchanged
+    dataset is not even loaded on a repeat run.
+    """
+    
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.entries_dir = os.path.join(cache_dir, 'entries')
+        
+        self.manifest = None
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = None
+        
+        if self.manifest is None or self.manifest.get('version') != TRAIN_CACHE_VERSION:
+            shutil.rmtree(self.entries_dir, ignore_errors=True)
+            self.manifest = {'version': TRAIN_CACHE_VERSION, 'datasets': {}, 'entries': {}}
+        os.makedirs(self.entries_dir, exist_ok=True)
+    
+    @staticmethod
+    def key(fingerprint, settings):
+        return _sha256_json({'data': fingerprint, 'settings': _sha256_json(settings)})
+    
+    @staticmethod
+    def settings_hash(settings):
+        """Hash of settings without the incremental lineage, shared by a base and its grown forests."""
+        return _sha256_json({name: value for name, value in settings.items() if name != 'incremental'})
+    
+    def run_key(self, fingerprint, settings, incremental=False):
+        """
+        Key of the cached run to restore for this data and settings.
+        
+        A plain run only matches its own key. An incremental run also
+        accepts a forest grown on exactly this data (the latest one).
+        """
+        key = self.key(fingerprint, settings)
+        if not incremental or self.lookup(key):
+            return key
+        settings_hash = self.settings_hash(settings)
+        grown = sorted(
+            ((entry['created'], grown_key) for grown_key, entry in self.manifest['entries'].items()
+             if entry['fingerprint'] == fingerprint and entry['settings_hash'] == settings_hash
+             and self.lookup(grown_key)), reverse=True)
+        return grown[0][1] if grown else key
+    
+    @staticmethod
+    def _files_key(files):
+        return '|'.join(os.path.abspath(path) for path in files)
+    
+    @staticmethod
+    def _stats(files):
+        return [[os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in files]
+    
+    def known_fingerprint(self, files):
+        """Data fingerprint of files if they are unchanged since remember(), else None."""
+        dataset = self.manifest['datasets'].get(self._files_key(files))
+        if dataset is None or dataset['stats'] != self._stats(files):
+            return None
+        return dataset['fingerprint']
+    
+    def remember(self, files, fingerprint):
+        self.manifest['datasets'][self._files_key(files)] = {
+            'stats': self._stats(files),
+            'fingerprint': fingerprint,
+        }
+        self.flush()
+    
+    def lookup(self, key):
+        """The manifest entry of key if its model and artifacts are all present, else None."""
+        entry = self.manifest['entries'].get(key)
+        if entry is None:
+            return None
+        entry_dir = os.path.join(self.entries_dir, key)
+        if not all(os.path.exists(os.path.join(entry_dir, name))
+                   for name in entry['artifacts'] + ['model.pkl']):
+            return None
+        return entry
+    
+    def restore(self, key, output_path):
+        """Copy the exported artifacts of entry key into output_path."""
+        os.makedirs(output_path, exist_ok=True)
+        restored = []
+        for name in self.manifest['entries'][key]['artifacts']:
+            restored.append(shutil.copy2(os.path.join(self.entries_dir, key, name),
+                                         os.path.join(output_path, name)))
+        return restored
+    
+    def find_base(self, settings, X, y):
+        """
+        (key, entry) of the largest cached run with the same settings whose
+        data is a strict prefix of (X, y), or None.
+        """
+        settings_hash = self.settings_hash(settings)
+        candidates = sorted(
+            ((key, entry) for key, entry in self.manifest['entries'].items()
+             if entry['settings_hash'] == settings_hash and entry['rows'] < len(X)),
+            key=lambda item: item[1]['rows'], reverse=True)
+        for key, entry in candidates:
+            rows = entry['rows']
+            if self.lookup(key) and data_fingerprint(X[:rows], y[:rows]) == entry['fingerprint']:
+                return key, entry
+        return None
+    
+    def load_model(self, key):
+        with open(os.path.join(self.entries_dir, key, 'model.pkl'), 'rb') as f:
+            return pickle.load(f)
+    
+    def store(self, key, model, artifacts, fingerprint, settings, rows, info):
+        """Save a finished run: the fitted model, copies of artifacts and info in the manifest."""
+        entry_dir = os.path.join(self.entries_dir, key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        with open(os.path.join(tmp_dir, 'model.pkl'), 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for path in artifacts:
+            shutil.copy2(path, os.path.join(tmp_dir, os.path.basename(path)))
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        
+        self.manifest['entries'][key] = {
+            'settings_hash': self.settings_hash(settings),
+            'fingerprint': fingerprint,
+            'rows': int(rows),
+            'artifacts': [os.path.basename(path) for path in artifacts],
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **info,
+        }
+        self.flush()
+    
+    def flush(self):
+        """Write the manifest atomically."""
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def split_dataset(X, y, base_rows=0, validation_size=0.0):
+    """
+    Stratified train/validation/test split of (X, y), returned as
+    X_train, X_val, X_test, y_train, y_val, y_test.
+    
+    validation_size is the share of the training rows held out for
+    choosing trees (--drop-trees); with 0 the validation set is empty.
+    With base_rows, the first base_rows rows are split exactly as a run on
+    only those rows split them and the appended rows are split on their
+    own, so an incrementally grown forest never trains on earlier
+    validation or test rows.
+    """
+    if not base_rows:
+        return _split(X, y, validation_size)
+    
+    old = _split(X[:base_rows], y[:base_rows], validation_size)
+    try:
+        new = _split(X[base_rows:], y[base_rows:], validation_size)
+    except ValueError:
+        # Too few appended rows (or of one class) to split: train on all of them
+        X_new, y_new = X[base_rows:], y[base_rows:]
+        new = X_new, X_new[:0], X_new[:0], y_new, y_new[:0], y_new[:0]
+    return [np.concatenate([a, b]) for a, b in zip(old, new)]
+
+
+def _split(X, y, validation_size):
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=SPLIT_SEED, stratify=y)
+    if not validation_size:
+        return X_train, X_train[:0], X_test, y_train, y_train[:0], y_test
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_train, y_train, test_size=validation_size, random_state=SPLIT_SEED, stratify=y_train)
+    return X_train, X_val, X_test, y_train, y_val, y_test
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train and export the pothole detection model")
+    parser.add_argument('--dataset', default=DATASET_PATH,
+                        help="directory with the miner's training_data files")
+    parser.add_argument('--output', default=OUTPUT_PATH,
+                        help="directory for the Dart model and metadata")
+    parser.add_argument('--cache-dir', default=None,
+                        help="training cache directory (default: OUTPUT/.train_cache)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always train and do not update the training cache")
+    parser.add_argument('--incremental', action='store_true',
+                        help="grow a cached forest with warm_start when rows were only appended")
+    parser.add_argument('--incremental-trees', type=int, default=None,
+                        help="trees added by --incremental (default: in proportion to the new rows)")
+    parser.add_argument('--missing', choices=MISSING_POLICIES, default='drop',
+                        help="CSV rows with missing feature values: drop them or stop with an error")
+    parser.add_argument('--load-workers', type=int, default=1,
+                        help="worker processes parsing large CSV datasets (0 = one per CPU)")
+    parser.add_argument('--search', action='store_true',
+                        help="score a grid of forest sizes before training (implied by budgets)")
+    parser.add_argument('--search-trees', type=int, nargs='+', default=SEARCH_TREES)
+    parser.add_argument('--search-depths', type=int, nargs='+', default=SEARCH_DEPTHS)
+    parser.add_argument('--search-min-leaf', type=int, nargs='+', default=SEARCH_MIN_LEAF)
+    parser.add_argument('--search-workers', type=int, default=0,
+                        help="worker processes for the search (0 = one per CPU)")
+    parser.add_argument('--latency-budget-us', type=float, default=None,
+                        help="export the most accurate candidate at or below this per-window latency")
+    parser.add_argument('--size-budget-kb', type=float, default=None,
+                        help="export the most accurate candidate at or below this Dart file size")
+    parser.add_argument('--distill', choices=forest_distill.DISTILL_MODES, default=None,
+                        help="export a single tree or a lookup table imitating the forest")
+    parser.add_argument('--distill-depth', type=int, default=forest_distill.DISTILL_TREE_DEPTH,
+                        help="depth of the distilled tree")
+    parser.add_argument('--distill-features', type=int, default=forest_distill.LUT_FEATURES,
+                        help="top features (by importance) of the lookup table")
+    parser.add_argument('--distill-bins', type=int, default=forest_distill.LUT_BINS,
+                        help="bins per feature of the lookup table")
+    parser.add_argument('--drop-trees', type=float, default=None, metavar='MAX_ACCURACY_DROP',
+                        help="drop trees while validation accuracy stays within this drop (e.g. 0.005)")
+    parser.add_argument('--merge-leaves', action='store_true',
+                        help="merge sibling leaves that predict the same class")
+    parser.add_argument('--quantize', choices=('none',) + forest_compress.QUANTIZATION_MODES,
+                        default='none', help="store thresholds and leaf values as float32 or int16")
+    args = parser.parse_args(argv)
+    if args.latency_budget_us is not None or args.size_budget_kb is not None:
+        args.search = True
+    if args.cache_dir is None:
+        args.cache_dir = os.path.join(args.output, '.train_cache')
+    if args.load_workers <= 0:
+        args.load_workers = os.cpu_count() or 1
+    if args.search_workers <= 0:
+        args.search_workers = os.cpu_count() or 1
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("=" * 60)
     print("Pothole Detection Model Trainer")
     print("=" * 60)
     
-    # Load dataset
-    dataset_file = os.path.join(DATASET_PATH, "training_data_samples.csv")
-    if not os.path.exists(dataset_file):
-        print(f"Error: Dataset not found at {dataset_file}")
+    # Load dataset, preferring the binary format over CSV
+    files = dataset_files(args.dataset)
+    if files is None:
+        print(f"Error: Dataset not found at {os.path.join(args.dataset, 'training_data_samples.csv')}")
         print("Please run pothole_data_miner.py first.")
         return
     
-    print(f"\nLoading dataset from: {dataset_file}")
-    samples = load_dataset(dataset_file)
-    print(f"Loaded {len(samples)} samples")
+    # A dataset unchanged since a cached run with the same settings needs no training
+    cache = None if args.no_cache else TrainingCache(args.cache_dir)
+    settings = training_settings(args)
+    fingerprint = cache.known_fingerprint(files) if cache else None
+    if fingerprint and restore_cached_run(
+            cache, cache.run_key(fingerprint, settings, args.incremental), args.output):
+        return
     
-    # Prepare data
-    X, y = prepare_data(samples)
-    print(f"Prepared {len(X)} valid samples")
-    print(f"  Potholes: {sum(y)}")
-    print(f"  Normal: {len(y) - sum(y)}")
+    print(f"\nLoading dataset from: {files[0]}")
+    if files[0].endswith('.json'):
+        X, y = load_binary_dataset(files[0])
+    else:
+        X, y = load_dataset(files[0], missing=args.missing, workers=args.load_workers)
+    print(f"Loaded {len(X)} samples")
+    
+    n_potholes = int(np.sum(y))
+    print(f"  Potholes: {n_potholes}")
+    print(f"  Normal: {len(y) - n_potholes}")
+    
+    base = None
+    if cache:
+        fingerprint = data_fingerprint(X, y)
+        cache.remember(files, fingerprint)
+        if restore_cached_run(cache, cache.run_key(fingerprint, settings, args.incremental),
+                              args.output):
+            return
+        if args.incremental:
+            base = cache.find_base(settings, X, y)
+            if base is None:
+                print("\nNo cached run on a prefix of this dataset, training from scratch")
     
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    base_rows = base[1]['rows'] if base else 0
+    validation_size = DROP_TREES_VALIDATION_SIZE if args.drop_trees is not None else 0.0
+    X_train, X_val, X_test, y_train, y_val, y_test = split_dataset(X, y, base_rows, validation_size)
     
     print(f"\nTraining set: {len(X_train)} samples")
+    if len(X_val):
+        print(f"Validation set (--drop-trees): {len(X_val)} samples")
     print(f"Test set: {len(X_test)} samples")
     
-    # Train model
-    print("\nTraining RandomForest model...")
-    model = RandomForestClassifier(
-        n_estimators=50,  # Keep small for mobile
-        max_depth=10,     # Limit depth for simplicity
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42,
-        n_jobs=-1
-    )
+    params = base[1]['params'] if base else DEFAULT_PARAMS
+    search_info = base[1].get('search') if base else None
+    artifacts = []
+    if args.search and not base:
+        print("\n" + "=" * 60)
+        print("Hyperparameter Search")
+        print("=" * 60)
+        grid = {
+            'n_estimators': args.search_trees,
+            'max_depth': args.search_depths,
+            'min_samples_leaf': args.search_min_leaf,
+        }
+        # Only training rows: the test set must not take part in choosing the model
+        results = hyperparameter_search(X_train, y_train, grid, args.search_workers)
+        print_search_report(results)
+        
+        size_budget = args.size_budget_kb * 1024 if args.size_budget_kb is not None else None
+        budgets = {'latency_us': args.latency_budget_us, 'size_bytes': size_budget}
+        selected = select_candidate(results, args.latency_budget_us, size_budget)
+        artifacts.append(save_search_report(results, selected, budgets, args.output))
+        if selected is None:
+            print("Error: no candidate fits the latency/size budget")
+            return
+        params = selected['params']
+        search_info = {'search': {'budgets': budgets, 'selected': selected}}
+        print(f"\nSelected: {params} (CV accuracy {selected['cv_accuracy']:.3f}, "
+              f"{selected['size_bytes'] / 1024:.1f} KB, {selected['latency_us']:.1f} us/window)")
     
-    model.fit(X_train, y_train)
+    # Train model
+    incremental_info = None
+    if base:
+        # Grow the cached forest: warm_start fits only the added trees
+        base_key, base_entry = base
+        model = cache.load_model(base_key)
+        n_old = model.n_estimators
+        n_new = args.incremental_trees or math.ceil(n_old * (len(X) - base_rows) / base_rows)
+        print(f"\nGrowing cached forest ({n_old} trees, {base_rows} rows) "
+              f"by {n_new} trees for {len(X) - base_rows} new rows...")
+        model.set_params(warm_start=True, n_estimators=n_old + n_new)
+        model.fit(X_train, y_train)
+        model.set_params(warm_start=False)
+        incremental_info = {'incremental': {
+            'base': base_key,
+            'base_rows': base_rows,
+            'new_rows': int(len(X) - base_rows),
+            'trees_added': n_new,
+        }}
+        # A grown forest is not what a plain run would train: key it by its lineage
+        settings = {**settings, 'incremental': {'base': base_key, 'trees_added': n_new}}
+    else:
+        print("\nTraining RandomForest model...")
+        model = build_model(params)
+        
+        model.fit(X_train, y_train)
     
     # Evaluate
     print("\n" + "=" * 60)
     print("Model Evaluation")
     print("=" * 60)
     
-    # Cross-validation
-    cv_scores = cross_val_score(model, X, y, cv=5)
-    print(f"\nCross-validation accuracy: {cv_scores.mean():.3f} (+/- {cv_scores.std() * 2:.3f})")
+    # Cross-validation (refits from scratch, so skipped when growing a forest)
+    cv_scores = None
+    if base:
+        print("\nCross-validation skipped for the incrementally grown forest")
+    else:
+        cv_scores = cross_val_score(model, X, y, cv=5)
+        print(f"\nCross-validation accuracy: {cv_scores.mean():.3f} (+/- {cv_scores.std() * 2:.3f})")
     
     # Test set evaluation
     y_pred = model.predict(X_test)
@@ -314,9 +890,104 @@ def main():
     print("Exporting Model")
     print("=" * 60)
     
-    dart_file = export_model_to_dart(model, FEATURE_COLUMNS, OUTPUT_PATH)
-    export_model_metadata(model, accuracy, report, OUTPUT_PATH)
+    # The exported arrays must reproduce predict_proba on every sample
+    flat = forest_export.flatten_forest(model, FEATURE_COLUMNS)
+    parity = forest_export.parity_report(model, flat, X)
+    print(f"Flat forest parity on {parity['rows']} samples: "
+          f"max |diff| = {parity['max_abs_diff']:.2e}, {parity['class_mismatches']} class mismatches")
+    if not parity['passed']:
+        print("Error: flat forest does not match predict_proba, model not exported")
+        return
     
+    model_name = 'RandomForestClassifier'
+    distillation_info = None
+    if args.distill:
+        print("\nDistilling forest...")
+        if args.distill == 'tree':
+            flat = forest_distill.distill_tree(model, X_train, FEATURE_COLUMNS, args.distill_depth)
+            model_name = f"DecisionTreeRegressor distilled from {model.n_estimators} trees"
+        else:
+            flat = forest_distill.distill_lookup_table(model, X_train, FEATURE_COLUMNS,
+                                                       args.distill_features, args.distill_bins)
+            features = [FEATURE_COLUMNS[f] for f in
+                        forest_distill.top_features(model, args.distill_features)]
+            model_name = f"Lookup table over {features} distilled from {model.n_estimators} trees"
+        agreement = forest_distill.agreement_report(model, flat, X_test, y_test)
+        print(f"  {forest_export.forest_stats(flat)['nodes']} nodes, depth {flat['max_depth']}")
+        print(f"  Agreement with the forest on the test set: {agreement['agreement']:.4f} "
+              f"(mean |diff| {agreement['mean_abs_diff']:.3f})")
+        print(f"  Test accuracy: {agreement['accuracy']:.4f} "
+              f"(forest {agreement['forest_accuracy']:.4f}, "
+              f"{agreement['accuracy'] - agreement['forest_accuracy']:+.4f})")
+        distillation_info = {'distillation': {
+            'mode': args.distill,
+            'exported_model': model_name,
+            **({'depth': args.distill_depth} if args.distill == 'tree' else
+               {'features': features, 'bins': args.distill_bins}),
+            **forest_export.forest_stats(flat),
+            **agreement,
+        }}
+    
+    compression_info = None
+    quantization = None if args.quantize == 'none' else args.quantize
+    if args.drop_trees is not None or args.merge_leaves or quantization:
+        print("\nCompressing forest...")
+        flat, stages = forest_compress.compress_forest(
+            flat, X_val, y_val, X_test, y_test,
+            max_accuracy_drop=args.drop_trees,
+            merge_leaves=args.merge_leaves,
+            quantization=quantization,
+        )
+        forest_compress.print_compression_report(stages)
+        compression_info = {'compression': {
+            'max_accuracy_drop': args.drop_trees,
+            'merge_leaves': args.merge_leaves,
+            'quantization': quantization,
+            'stages': stages,
+            'accuracy_delta': stages[-1]['accuracy_delta'],
+        }}
+    
+    dart_file = export_model_to_dart(model, FEATURE_COLUMNS, args.output, flat, model_name)
+    artifacts.append(dart_file)
+    artifacts.append(export_flat_forest(flat, args.output))
+    artifacts.append(export_model_metadata(model, accuracy, report, args.output, {
+        'min_samples_leaf': model.min_samples_leaf,
+        'cv_scores': cv_scores.tolist() if cv_scores is not None else None,
+        'export': {'format': 'flat_forest', **forest_export.forest_stats(flat), 'parity': parity},
+        **(search_info or {}),
+        **(distillation_info or {}),
+        **(compression_info or {}),
+        **(incremental_info or {}),
+    }))
+    
+    if cache:
+        key = TrainingCache.key(fingerprint, settings)
+        cache.store(key, model, artifacts, fingerprint, settings, len(X), {
+            'params': {**params, 'n_estimators': model.n_estimators},
+            'cv_scores': cv_scores.tolist() if cv_scores is not None else None,
+            'accuracy': accuracy,
+            **(search_info or {}),
+        })
+        print(f"Training cache entry: {key[:12]}")
+    
+    print_next_steps(dart_file)
+
+
+def restore_cached_run(cache, key, output_path):
+    """Restore the artifacts of a cached run into output_path; False on a cache miss."""
+    entry = cache.lookup(key)
+    if entry is None:
+        return False
+    print(f"\nTraining cache hit: {key[:12]} ({entry['rows']} rows, {entry['params']}, "
+          f"trained {entry['created']})")
+    for path in cache.restore(key, output_path):
+        print(f"Restored: {path}")
+    dart_file = os.path.join(output_path, 'pothole_detection_model.dart')
+    print_next_steps(dart_file)
+    return True
+
+
+def print_next_steps(dart_file):
     print("\n" + "=" * 60)
     print("Training Complete!")
     print("=" * 60)
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the Supabase REST endpoint, for testing imports.
+
+Accepts the PostgREST requests import_datasets.py sends
+(POST /rest/v1/<table>, upserts with ?on_conflict=<column>,
+DELETE /rest/v1/<table>?<column>=in.(...) and key listings
+GET /rest/v1/<table>?select=<column>&offset=...&limit=... of the rows
+stored by upserts), counts the rows per table and
+can fail or delay requests to exercise retries and concurrency:
+
+    python rest_stub.py --port 54321 --fail-rate 0.1 --latency-ms 50
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE_KEY=stub \\
+        python import_datasets.py
+
+GET /stats returns the counts, and the number of rows stored per table by
+upserts, as JSON.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+REST_PREFIX = "/rest/v1/"
+
+
+class StubState:
+    def __init__(self, fail_rate: float = 0.0, latency_ms: float = 0.0):
+        self.fail_rate = fail_rate
+        self.latency_ms = latency_ms
+        self.lock = threading.Lock()
+        self.rows: Dict[str, int] = {}
+        self.deleted: Dict[str, int] = {}
+        self.stored: Dict[str, Dict[str, Any]] = {}
+        self.requests = 0
+        self.failures = 0
+        self.max_concurrent = 0
+        self.active = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "rows": dict(self.rows),
+                "deleted": dict(self.deleted),
+                "stored": {table: len(rows) for table, rows in self.stored.items()},
+                "requests": self.requests,
+                "failures": self.failures,
+                "max_concurrent": self.max_concurrent,
+            }
+
+
+def parse_in_filter(value: str) -> List[str]:
+    """Values of a PostgREST in.(a,"b,c") filter."""
+    values, current, quoted = [], "", False
+    for char in value[len("in.("):-1]:
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            values.append(current)
+            current = ""
+        else:
+            current += char
+    values.append(current)
+    return values
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def send_json(self, status: int, body: Any) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            if self.path == "/stats":
+                self.send_json(200, state.stats())
+            elif url.path.startswith(REST_PREFIX) and url.path != REST_PREFIX:
+                query = dict(parse_qsl(url.query))
+                column = query.get("select", "*")
+                offset = int(query.get("offset", 0))
+                with state.lock:
+                    rows = list(state.stored.get(url.path[len(REST_PREFIX):], {}).items())
+                rows.sort()
+                rows = rows[offset:offset + int(query["limit"])] if "limit" in query else rows[offset:]
+                if column == "*":
+                    self.send_json(200, [row for _, row in rows])
+                else:
+                    self.send_json(200, [{column: row.get(column)} for _, row in rows])
+            else:
+                self.send_json(404, {"message": "not found"})
+
+        def do_POST(self) -> None:
+            self.handle_write(self.apply_post)
+
+        def do_DELETE(self) -> None:
+            self.handle_write(self.apply_delete)
+
+        def handle_write(self, apply) -> None:
+            url = urlsplit(self.path)
+            table = url.path[len(REST_PREFIX):]
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not url.path.startswith(REST_PREFIX) or not table:
+                self.send_json(404, {"message": "not found"})
+                return
+
+            with state.lock:
+                state.requests += 1
+                state.active += 1
+                state.max_concurrent = max(state.max_concurrent, state.active)
+            try:
+                if state.latency_ms:
+                    time.sleep(state.latency_ms / 1000)
+                if random.random() < state.fail_rate:
+                    with state.lock:
+                        state.failures += 1
+                    self.send_json(
+                        503,
+                        {"code": "PGRST000", "message": "stub: injected failure", "details": None, "hint": None},
+                    )
+                    return
+                status, response = apply(table, parse_qsl(url.query), body)
+                self.send_json(status, response)
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+        def apply_post(self, table: str, query: List[Tuple[str, str]], body: bytes) -> Tuple[int, Any]:
+            rows = json.loads(body or b"[]")
+            if isinstance(rows, dict):
+                rows = [rows]
+            key = dict(query).get("on_conflict")
+            with state.lock:
+                state.rows[table] = state.rows.get(table, 0) + len(rows)
+                if key:
+                    stored = state.stored.setdefault(table, {})
+                    for row in rows:
+                        stored[str(row[key])] = row
+            return 201, rows
+
+        def apply_delete(self, table: str, query: List[Tuple[str, str]], body: bytes) -> Tuple[int, Any]:
+            stored = state.stored.get(table, {})
+            removed = []
+            with state.lock:
+                for column, value in query:
+                    if value.startswith("in.("):
+                        for row_key in parse_in_filter(value):
+                            if row_key in stored:
+                                removed.append(stored.pop(row_key))
+                state.deleted[table] = state.deleted.get(table, 0) + len(removed)
+            return 200, removed
+
+    return Handler
+
+
+def serve(port: int = 54321, fail_rate: float = 0.0, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stub on a background thread; call .shutdown() to stop it."""
+    state = StubState(fail_rate, latency_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stub of the Supabase REST endpoint")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before every response")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.fail_rate, args.latency_ms)
+    print(f"REST stub listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(server.state.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
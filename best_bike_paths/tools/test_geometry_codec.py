@@ -0,0 +1,96 @@
+"""Round-trip tests of the surface geometry encodings."""
+
+import pytest
+
+from geometry_codec import (
+    POLYLINE_PRECISION,
+    SRID,
+    WKB_TYPES,
+    compare_encodings,
+    decode_ewkb,
+    decode_geometry,
+    decode_polyline,
+    encode_ewkb,
+    encode_geometry,
+    encode_polyline,
+    max_coordinate_error,
+)
+
+RING = [[9.18, 45.46], [9.19, 45.46], [9.19, 45.47], [9.18, 45.47], [9.18, 45.46]]
+HOLE = [[9.183, 45.463], [9.186, 45.463], [9.186, 45.466], [9.183, 45.463]]
+SOUTH_WEST_RING = [
+    [-58.3816, -34.6037],
+    [-58.3701, -34.6037],
+    [-58.3701, -34.5921],
+    [-58.3816, -34.6037],
+]
+
+GEOMETRIES = {
+    "Point": {"type": "Point", "coordinates": [9.1900001, 45.4642035]},
+    "LineString": {
+        "type": "LineString",
+        "coordinates": [
+            [9.1, 45.4],
+            [9.1000004, 45.4000006],
+            [-0.1277583, 51.5073509],
+            [-122.4194155, -37.7749295],
+        ],
+    },
+    "Polygon": {"type": "Polygon", "coordinates": [RING, HOLE]},
+    "MultiPoint": {"type": "MultiPoint", "coordinates": [[9.19, 45.46], [-70.64827, -33.45694]]},
+    "MultiLineString": {
+        "type": "MultiLineString",
+        "coordinates": [
+            [[9.18, 45.46], [9.19, 45.47]],
+            [[-3.7037902, 40.4167754], [-3.7, -40.4], [179.9999999, -89.9999999]],
+        ],
+    },
+    "MultiPolygon": {
+        "type": "MultiPolygon",
+        "coordinates": [[RING, HOLE], [SOUTH_WEST_RING]],
+    },
+}
+
+# Example of Google's polyline algorithm documentation, at precision 5
+GOOGLE_POINTS = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+GOOGLE_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_every_wkb_type_is_covered():
+    assert set(GEOMETRIES) == set(WKB_TYPES)
+
+
+@pytest.mark.parametrize("kind", sorted(WKB_TYPES))
+def test_ewkb_round_trip_is_exact(kind):
+    geometry = GEOMETRIES[kind]
+    decoded, srid = decode_ewkb(encode_ewkb(geometry))
+    assert srid == SRID
+    assert decoded == geometry
+    assert decode_geometry(encode_geometry(geometry, "ewkb"), "ewkb") == geometry
+
+
+@pytest.mark.parametrize("precision", [5, POLYLINE_PRECISION, 7])
+@pytest.mark.parametrize("kind", sorted(WKB_TYPES))
+def test_polyline_round_trip_within_half_a_unit(kind, precision):
+    geometry = GEOMETRIES[kind]
+    value = encode_geometry(geometry, "polyline", precision)
+    assert value["type"] == kind and value["precision"] == precision
+    decoded = decode_geometry(value, "polyline")
+    assert max_coordinate_error(geometry, decoded) <= 0.5 / 10**precision + 1e-12
+
+
+def test_google_polyline_vector():
+    assert encode_polyline(GOOGLE_POINTS, precision=5) == GOOGLE_POLYLINE
+    assert decode_polyline(GOOGLE_POLYLINE, precision=5) == GOOGLE_POINTS
+
+
+def test_polyline_of_negative_coordinates():
+    line = [[-0.00001, -0.00001], [0.0, 0.0], [-179.99999, -89.99999]]
+    assert decode_polyline(encode_polyline(line, 5), 5) == line
+
+
+def test_compare_encodings_checks_every_geometry():
+    totals = compare_encodings(GEOMETRIES.values())
+    assert totals["ewkb"]["max_error"] == 0.0
+    assert totals["polyline"]["max_error"] <= 0.5 / 10**POLYLINE_PRECISION + 1e-12
+    assert totals["polyline"]["payload_bytes"] < totals["geojson"]["payload_bytes"]
@@ -0,0 +1,286 @@
+"""
+Offline tile packs of the imported datasets.
+
+The rows import_datasets.py prepares for fountains, surface_segments and
+accident_cells are partitioned into z/x/y web map tiles at one zoom level
+and written to a single file, so a city's data can be shipped or cached
+in one piece and read a tile at a time:
+
+    header   magic "BBPT", version, zoom, compression, tile count and
+             metadata length (TILE_HEADER)
+    metadata JSON: zoom, layers, row counts, bounds
+    index    one TILE_INDEX_ENTRY per tile, sorted by (z, x, y): z, x, y,
+             byte offset of the tile and its length with the prefix
+    tiles    per tile, a u32 length followed by the zlib-compressed JSON
+             {"<table>": [rows...]}
+
+Rows are stored as sent to the database. Points go to the tile of their
+position; surfaces to every tile their bounding box touches. Rows without
+a position (accidents of the city-wide cell) go to tile 0/0/0.
+
+Build a pack while importing (python import_datasets.py --tile-pack
+city.bbpt), or without uploading (python tile_pack.py build city.bbpt),
+then read it with TilePack:
+
+    with TilePack("city.bbpt") as pack:
+        tile = pack.get(*tile_for(9.19, 45.46, pack.zoom))
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from geometry_codec import decode_ewkb, decode_geometry
+
+TILE_LAYERS = ("fountains", "surface_segments", "accident_cells")
+TILE_ZOOM = 14  # About 1.7 km wide at Milan's latitude
+TILE_PACK_MAGIC = b"BBPT"
+TILE_PACK_VERSION = 1
+COMPRESSION_ZLIB = 1
+COMPRESSION_LEVEL = 9
+TILE_HEADER = struct.Struct("<4sBBBxII")  # magic, version, zoom, compression, tiles, metadata bytes
+TILE_INDEX_ENTRY = struct.Struct("<BIIQI")  # z, x, y, offset, length
+TILE_LENGTH = struct.Struct("<I")
+MAX_LATITUDE = 85.05112878  # Web Mercator limit
+UNPLACED_TILE = (0, 0, 0)
+
+Tile = Tuple[int, int, int]
+WKT_POINT = re.compile(r"POINT\s*\(\s*(\S+)\s+(\S+)\s*\)", re.IGNORECASE)
+
+
+def tile_for(lon: float, lat: float, zoom: int = TILE_ZOOM) -> Tile:
+    """(z, x, y) of the web map tile containing a position."""
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return zoom, min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def parse_point(value: Any) -> Optional[Tuple[float, float]]:
+    """(lon, lat) of a row's point: WKT/EWKT, hex EWKB or GeoJSON."""
+    if isinstance(value, dict):
+        coords = value.get("coordinates") or []
+        return (coords[0], coords[1]) if len(coords) >= 2 else None
+    if not isinstance(value, str):
+        return None
+    match = WKT_POINT.search(value)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    try:
+        geometry, _ = decode_ewkb(value)
+    except (ValueError, KeyError, struct.error):
+        return None
+    return tuple(geometry["coordinates"][:2]) if geometry["type"] == "Point" else None
+
+
+def _flatten(coords: Any) -> Iterator[Tuple[float, float]]:
+    if coords and isinstance(coords[0], (int, float)):
+        yield coords[0], coords[1]
+    else:
+        for part in coords or []:
+            yield from _flatten(part)
+
+
+def row_bounds(table: str, row: Dict[str, Any]) -> Optional[Tuple[float, float, float, float]]:
+    """(min lon, min lat, max lon, max lat) of a row, or None if it has no position."""
+    if table == "surface_segments":
+        geometry = row.get("geometry")
+        if isinstance(geometry, dict) and "polyline" in geometry:
+            geometry = decode_geometry(geometry, "polyline")
+        elif geometry is None and row.get("geom"):
+            geometry = decode_ewkb(row["geom"])[0]
+        points = list(_flatten((geometry or {}).get("coordinates")))
+        if points:
+            lons, lats = zip(*points)
+            return min(lons), min(lats), max(lons), max(lats)
+        point = parse_point(row.get("centroid"))
+    elif table == "fountains":
+        point = parse_point(row.get("location"))
+    else:
+        point = parse_point(row.get("center"))
+    return (point[0], point[1], point[0], point[1]) if point else None
+
+
+class TilePackBuilder:
+    """Rows partitioned into tiles at one zoom level, written by write()."""
+
+    def __init__(self, zoom: int = TILE_ZOOM):
+        self.zoom = zoom
+        self.tiles: Dict[Tile, Dict[str, List[Dict[str, Any]]]] = {}
+        self.rows: Dict[str, int] = {}
+        self.unplaced = 0
+        self.bounds: Optional[List[float]] = None
+
+    def add(self, table: str, row: Dict[str, Any]) -> None:
+        bounds = row_bounds(table, row)
+        if bounds is None:
+            tiles: Iterable[Tile] = [UNPLACED_TILE]
+            self.unplaced += 1
+        else:
+            _, min_x, max_y = tile_for(bounds[0], bounds[1], self.zoom)
+            _, max_x, min_y = tile_for(bounds[2], bounds[3], self.zoom)
+            tiles = [
+                (self.zoom, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+            ]
+            if self.bounds is None:
+                self.bounds = list(bounds)
+            else:
+                self.bounds = [
+                    min(self.bounds[0], bounds[0]),
+                    min(self.bounds[1], bounds[1]),
+                    max(self.bounds[2], bounds[2]),
+                    max(self.bounds[3], bounds[3]),
+                ]
+        for tile in tiles:
+            self.tiles.setdefault(tile, {}).setdefault(table, []).append(row)
+        self.rows[table] = self.rows.get(table, 0) + 1
+
+    def collect(self, table: str, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Pass rows through, adding those of TILE_LAYERS tables to the pack."""
+        for row in rows:
+            if table in TILE_LAYERS:
+                self.add(table, row)
+            yield row
+
+    def write(self, path: str) -> Dict[str, Any]:
+        """Write the pack to path (atomically) and return its metadata."""
+        keys = sorted(self.tiles)
+        payloads = []
+        for key in keys:
+            data = json.dumps(self.tiles[key], separators=(",", ":"), ensure_ascii=False, default=str)
+            payloads.append(zlib.compress(data.encode("utf-8"), COMPRESSION_LEVEL))
+        metadata = {
+            "zoom": self.zoom,
+            "layers": list(TILE_LAYERS),
+            "rows": self.rows,
+            "unplaced_rows": self.unplaced,
+            "bounds": self.bounds,
+        }
+        metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+
+        offset = TILE_HEADER.size + len(metadata_bytes) + TILE_INDEX_ENTRY.size * len(keys)
+        index = []
+        for (z, x, y), payload in zip(keys, payloads):
+            length = TILE_LENGTH.size + len(payload)
+            index.append(TILE_INDEX_ENTRY.pack(z, x, y, offset, length))
+            offset += length
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                TILE_HEADER.pack(
+                    TILE_PACK_MAGIC,
+                    TILE_PACK_VERSION,
+                    self.zoom,
+                    COMPRESSION_ZLIB,
+                    len(keys),
+                    len(metadata_bytes),
+                )
+            )
+            f.write(metadata_bytes)
+            f.write(b"".join(index))
+            for payload in payloads:
+                f.write(TILE_LENGTH.pack(len(payload)))
+                f.write(payload)
+        os.replace(tmp_path, path)
+        return {**metadata, "tiles": len(keys), "bytes": offset}
+
+
+class TilePack:
+    """
+    Memory-mapped reader of a tile pack.
+
+    Only the header and index are read on open; get() decompresses the
+    single tile it is asked for.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, zoom, compression, tiles, metadata_length = TILE_HEADER.unpack_from(self._map, 0)
+        if magic != TILE_PACK_MAGIC or version != TILE_PACK_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {TILE_PACK_VERSION} tile pack")
+        if compression != COMPRESSION_ZLIB:
+            self.close()
+            raise ValueError(f"Unknown tile compression {compression}")
+        self.zoom = zoom
+        start = TILE_HEADER.size
+        self.metadata = json.loads(self._map[start:start + metadata_length])
+        start += metadata_length
+        self.index: Dict[Tile, Tuple[int, int]] = {}
+        for z, x, y, offset, length in TILE_INDEX_ENTRY.iter_unpack(
+            self._map[start:start + TILE_INDEX_ENTRY.size * tiles]
+        ):
+            self.index[(z, x, y)] = (offset, length)
+
+    def get(self, z: int, x: int, y: int) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Rows per table of tile z/x/y, or None if the pack has no such tile."""
+        entry = self.index.get((z, x, y))
+        if entry is None:
+            return None
+        offset, length = entry
+        (size,) = TILE_LENGTH.unpack_from(self._map, offset)
+        start = offset + TILE_LENGTH.size
+        return json.loads(zlib.decompress(self._map[start:start + size]))
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "TilePack":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or read an offline tile pack")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a pack from the datasets without uploading")
+    build.add_argument("path")
+    build.add_argument("--zoom", type=int, default=TILE_ZOOM)
+    info = commands.add_parser("info", help="print a pack's metadata and tile count")
+    info.add_argument("path")
+    get = commands.add_parser("get", help="print the rows of one tile as JSON")
+    get.add_argument("path")
+    get.add_argument("z", type=int)
+    get.add_argument("x", type=int)
+    get.add_argument("y", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        import import_datasets as importer
+
+        builder = TilePackBuilder(args.zoom)
+        accidents, fountains, surfaces = importer.dataset_paths()
+        grid = importer.AccidentGrid()
+        for _ in importer.accident_rows(accidents, grid):
+            pass
+        for table, rows in (
+            ("accident_cells", importer.accident_cell_rows(grid)),
+            ("fountains", importer.fountain_rows(importer.iter_features(fountains))),
+            ("surface_segments", importer.surface_rows(importer.iter_features(surfaces))),
+        ):
+            for _ in builder.collect(table, rows):
+                pass
+        summary = builder.write(args.path)
+        print(f"{args.path}: {summary['tiles']} tiles, {summary['bytes'] / 1e6:.1f} MB, rows {summary['rows']}")
+    else:
+        with TilePack(args.path) as pack:
+            if args.command == "info":
+                print(json.dumps({**pack.metadata, "tiles": len(pack.index)}, indent=2))
+            else:
+                print(json.dumps(pack.get(args.z, args.x, args.y), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()